@@ -1,64 +1,68 @@
 import os
-from datetime import datetime
-from flask import render_template, request, flash, redirect, url_for, current_app, jsonify
+from datetime import datetime, timedelta
+from flask import render_template, request, flash, redirect, url_for, current_app, jsonify, abort, Response, stream_with_context
 from flask_login import login_required, current_user
 from werkzeug.security import generate_password_hash
-from sqlalchemy import func, extract
+from sqlalchemy.orm import joinedload
 from app import db
 from models import User, Incident, Resource, IncidentResource, StatusUpdate
 from forms import UserManagementForm, ResourceForm, AssignResourceForm, AssignTeamForm, StatusUpdateForm
 from utils import admin_required
+from geocoder import geocode
+from cache_utils import cached_fragment
+from stats_utils import admin_stats
+from pagination_utils import keyset_paginate
+from search_utils import search_incidents
+from incident_feed import parse_list_arg
+from incident_export import EXPORTS, FORMATS, export_chunks
+from nearest_utils import nearest_resources, nearest_teams
+from response_times import response_times
+from image_cache import image_cache
+from rollup_utils import (GRANULARITIES, align_range, bucket_label, latest_buckets_start,
+                          rollup_distributions, rollup_trend)
 from . import admin_bp
 
+def get_dashboard_stats():
+    """Counts shown in the dashboard statistics cards, from the shared snapshot"""
+    return admin_stats.get()
+
+def get_recent_incidents():
+    """Latest incidents with their reporter and team loaded in the same query"""
+    return Incident.query.options(joinedload(Incident.reporter), joinedload(Incident.assigned_team))\
+                         .order_by(Incident.created_at.desc()).limit(5).all()
+
+# Refreshable dashboard regions: fragment name -> (template, context loader)
+DASHBOARD_FRAGMENTS = {
+    'stats': ('admin/_dashboard_stats.html', lambda: {'stats': get_dashboard_stats()}),
+    'recent_incidents': ('admin/_recent_incidents.html', lambda: {'recent_incidents': get_recent_incidents()})
+}
+
 @admin_bp.route('/dashboard')
 @login_required
 @admin_required
 def dashboard():
-    # Get overall statistics
-    total_users = User.query.filter_by(role='user').count()
-    total_rescue_teams = User.query.filter_by(role='rescue_team').count()
-    total_incidents = Incident.query.count()
-    total_resources = Resource.query.count()
-    
-    # Get recent incidents
-    recent_incidents = Incident.query.order_by(Incident.created_at.desc()).limit(5).all()
-    
-    # Get incidents by status
-    incident_stats = {
-        'pending': Incident.query.filter_by(status='pending').count(),
-        'in_progress': Incident.query.filter_by(status='in_progress').count(),
-        'resolved': Incident.query.filter_by(status='resolved').count(),
-        'closed': Incident.query.filter_by(status='closed').count()
-    }
-    
-    # Get high priority incidents
-    high_priority_incidents = Incident.query.filter(
-        Incident.priority.in_(['high', 'critical']),
-        Incident.status.in_(['pending', 'in_progress'])
-    ).count()
-    
-    stats = {
-        'total_users': total_users,
-        'total_rescue_teams': total_rescue_teams,
-        'total_incidents': total_incidents,
-        'total_resources': total_resources,
-        'high_priority_incidents': high_priority_incidents,
-        'incident_stats': incident_stats
-    }
-    
     return render_template('admin/dashboard.html',
-                         stats=stats,
-                         recent_incidents=recent_incidents)
+                         stats=get_dashboard_stats(),
+                         recent_incidents=get_recent_incidents())
+
+@admin_bp.route('/dashboard/fragments/<name>')
+@login_required
+@admin_required
+def dashboard_fragment(name):
+    if name not in DASHBOARD_FRAGMENTS:
+        abort(404)
+    template, load_context = DASHBOARD_FRAGMENTS[name]
+    
+    # Every admin sees the same figures, so one cached copy serves them all
+    return cached_fragment(('admin', name), None, lambda: render_template(template, **load_context()))
 
 @admin_bp.route('/users')
 @login_required
 @admin_required
 def users():
-    page = request.args.get('page', 1, type=int)
     per_page = 20
     
-    users = User.query.order_by(User.created_at.desc())\
-                     .paginate(page=page, per_page=per_page, error_out=False)
+    users = keyset_paginate(User.query, User, per_page, request.args)
     
     return render_template('admin/users.html', users=users)
 
@@ -80,6 +84,10 @@ def add_user():
                 password_hash=generate_password_hash(form.password.data or 'defaultpass123')
             )
             
+            # A team's base address is its starting position for dispatch
+            if user.role == 'rescue_team':
+                user.latitude, user.longitude = geocode(user.address) or (None, None)
+            
             db.session.add(user)
             db.session.commit()
             
@@ -107,6 +115,10 @@ def edit_user(user_id):
             user.email = form.email.data
             user.full_name = form.full_name.data
             user.phone = form.phone.data
+            # Only geocode when the address changed; an address that can't be
+            # found must not leave the team at its old position
+            if form.role.data == 'rescue_team' and (form.address.data != user.address or user.latitude is None):
+                user.latitude, user.longitude = geocode(form.address.data) or (None, None)
             user.address = form.address.data
             user.role = form.role.data
             
@@ -116,6 +128,8 @@ def edit_user(user_id):
             db.session.commit()
             
             flash(f'User {user.username} updated successfully.', 'success')
+            if user.role == 'rescue_team' and user.address and user.latitude is None:
+                flash(f'Address "{user.address}" could not be found, so the team will not be ranked by distance.', 'warning')
             current_app.logger.info(f'User {user.username} updated by admin {current_user.username}')
             return redirect(url_for('admin.users'))
             
@@ -155,12 +169,10 @@ def toggle_user_status(user_id):
 @login_required
 @admin_required
 def rescue_teams():
-    page = request.args.get('page', 1, type=int)
     per_page = 20
     
-    rescue_teams = User.query.filter_by(role='rescue_team')\
-                            .order_by(User.created_at.desc())\
-                            .paginate(page=page, per_page=per_page, error_out=False)
+    rescue_teams = keyset_paginate(User.query.filter_by(role='rescue_team'), User, per_page, request.args,
+                                   total=admin_stats.get()['total_rescue_teams'])
     
     return render_template('admin/rescue_teams.html', rescue_teams=rescue_teams)
 
@@ -168,11 +180,10 @@ def rescue_teams():
 @login_required
 @admin_required
 def resources():
-    page = request.args.get('page', 1, type=int)
     per_page = 20
     
-    resources = Resource.query.order_by(Resource.created_at.desc())\
-                             .paginate(page=page, per_page=per_page, error_out=False)
+    resources = keyset_paginate(Resource.query, Resource, per_page, request.args,
+                                total=admin_stats.get()['total_resources'])
     
     return render_template('admin/resources.html', resources=resources)
 
@@ -192,10 +203,17 @@ def add_resource():
                 location=form.location.data
             )
             
+            # Resolve the location once here so map reads never have to
+            coordinates = geocode(resource.location)
+            if coordinates:
+                resource.latitude, resource.longitude = coordinates
+            
             db.session.add(resource)
             db.session.commit()
             
             flash(f'Resource {resource.name} created successfully.', 'success')
+            if resource.location and not coordinates:
+                flash(f'Location "{resource.location}" could not be found, so the resource will not appear on the map.', 'warning')
             current_app.logger.info(f'Resource {resource.name} created by admin {current_user.username}')
             return redirect(url_for('admin.resources'))
             
@@ -219,11 +237,17 @@ def edit_resource(resource_id):
             resource.resource_type = form.resource_type.data
             resource.description = form.description.data
             resource.availability_status = form.availability_status.data
-            resource.location = form.location.data
+            
+            # Only geocode when the location text changed
+            if form.location.data != resource.location or resource.latitude is None:
+                resource.location = form.location.data
+                resource.latitude, resource.longitude = geocode(resource.location) or (None, None)
             
             db.session.commit()
             
             flash(f'Resource {resource.name} updated successfully.', 'success')
+            if resource.location and resource.latitude is None:
+                flash(f'Location "{resource.location}" could not be found, so the resource will not appear on the map.', 'warning')
             current_app.logger.info(f'Resource {resource.name} updated by admin {current_user.username}')
             return redirect(url_for('admin.resources'))
             
@@ -238,25 +262,127 @@ def edit_resource(resource_id):
 @login_required
 @admin_required
 def incidents():
-    page = request.args.get('page', 1, type=int)
     per_page = 20
+    search_query = request.args.get('q', '').strip()
     status_filter = request.args.get('status', '')
     priority_filter = request.args.get('priority', '')
-    
-    query = Incident.query
-    
-    if status_filter:
-        query = query.filter_by(status=status_filter)
-    if priority_filter:
-        query = query.filter_by(priority=priority_filter)
-    
-    incidents = query.order_by(Incident.created_at.desc())\
-                    .paginate(page=page, per_page=per_page, error_out=False)
+    type_filter = request.args.get('type', '')
+    
+    if search_query:
+        incidents = search_incidents(search_query, per_page, request.args,
+                                     types=[type_filter] if type_filter else None,
+                                     statuses=[status_filter] if status_filter else None,
+                                     priorities=[priority_filter] if priority_filter else None)
+    else:
+        query = Incident.query
+        
+        if status_filter:
+            query = query.filter_by(status=status_filter)
+        if priority_filter:
+            query = query.filter_by(priority=priority_filter)
+        if type_filter:
+            query = query.filter_by(incident_type=type_filter)
+        
+        # The dashboard snapshot already has the totals for the unfiltered and status-only views
+        total = None
+        if not priority_filter and not type_filter:
+            stats = admin_stats.get()
+            total = stats['incident_stats'].get(status_filter) if status_filter else stats['total_incidents']
+        
+        incidents = keyset_paginate(query, Incident, per_page, request.args, total=total)
     
     return render_template('admin/incidents.html', 
                          incidents=incidents,
+                         search_query=search_query,
                          status_filter=status_filter,
-                         priority_filter=priority_filter)
+                         priority_filter=priority_filter,
+                         type_filter=type_filter)
+
+@admin_bp.route('/api/incidents/search')
+@login_required
+@admin_required
+def search_incidents_data():
+    """
+    Ranked incident search. Query parameters: q, type, status and priority
+    (comma separated), limit, and after/before cursors from a previous page.
+    """
+    search_query = request.args.get('q', '').strip()
+    if not search_query:
+        return jsonify({'error': 'q is required'}), 400
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    
+    results = search_incidents(search_query, limit, request.args,
+                               types=parse_list_arg(request.args, 'type'),
+                               statuses=parse_list_arg(request.args, 'status'),
+                               priorities=parse_list_arg(request.args, 'priority'))
+    
+    return jsonify({
+        'incidents': [{
+            'id': incident.id,
+            'title': incident.title,
+            'incident_type': incident.incident_type,
+            'priority': incident.priority,
+            'status': incident.status,
+            'address': incident.address,
+            'created_at': incident.created_at.isoformat() if incident.created_at else None,
+            'url': url_for('admin.view_incident', incident_id=incident.id)
+        } for incident in results.items],
+        'next_page': results.next_cursor,
+        'prev_page': results.prev_cursor
+    })
+
+@admin_bp.route('/export/<export>.<fmt>')
+@login_required
+@admin_required
+def export_data(export, fmt):
+    if export not in EXPORTS or fmt not in FORMATS:
+        abort(404)
+    search_query = request.args.get('q', '').strip()
+    status_filter = request.args.get('status', '')
+    priority_filter = request.args.get('priority', '')
+    type_filter = request.args.get('type', '')
+    
+    current_app.logger.info(f'{export} exported as {fmt} by admin {current_user.username}')
+    
+    # Rows are streamed from a server-side cursor as they are written
+    response = Response(stream_with_context(export_chunks(export, fmt, status_filter, priority_filter,
+                                                          type_filter, search_query)),
+                        mimetype=FORMATS[fmt])
+    filename = f"{export}-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.{fmt}"
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# How many of the nearest available resources and teams to offer for an incident
+RESOURCE_CHOICES = 25
+TEAM_CHOICES = 25
+
+def team_choices(incident):
+    """Active rescue teams for the assignment form, the nearest to the incident first"""
+    teams = User.query.filter_by(role='rescue_team', is_active=True).order_by(User.full_name).all()
+    choices = []
+    if incident.latitude is not None and incident.longitude is not None:
+        ranked = nearest_teams(incident.latitude, incident.longitude, k=TEAM_CHOICES)
+        choices = [(t.id, f"{t.full_name} ({t.username}) - {distance:.1f} km") for distance, t in ranked]
+    
+    # The other teams, and those without a known position, follow by name
+    listed = {team_id for team_id, _ in choices}
+    choices += [(t.id, f"{t.full_name} ({t.username})") for t in teams if t.id not in listed]
+    return choices
+
+def resource_choices(incident):
+    """Available resources for the assignment form, nearest to the incident first"""
+    if incident.latitude is None or incident.longitude is None:
+        available_resources = Resource.query.filter_by(availability_status='available').all()
+        return [(r.id, f"{r.name} ({r.resource_type})") for r in available_resources]
+    
+    ranked = nearest_resources(incident.latitude, incident.longitude, k=RESOURCE_CHOICES)
+    choices = [(r.id, f"{r.name} ({r.resource_type}) - {distance:.1f} km") for distance, r in ranked]
+    
+    # Resources whose location couldn't be geocoded can still be assigned
+    unplaced = Resource.query.filter_by(availability_status='available', latitude=None).order_by(Resource.name).all()
+    choices += [(r.id, f"{r.name} ({r.resource_type})") for r in unplaced]
+    return choices
 
 @admin_bp.route('/incidents/<int:incident_id>')
 @login_required
@@ -265,16 +391,12 @@ def view_incident(incident_id):
     incident = Incident.query.get_or_404(incident_id)
     status_updates = incident.status_updates.order_by(db.desc('created_at')).all()
     
-    # Get available rescue teams and resources for assignment
-    rescue_teams = User.query.filter_by(role='rescue_team', is_active=True).all()
-    available_resources = Resource.query.filter_by(availability_status='available').all()
-    
-    # Forms for assignments
+    # Forms for assignments, offering the closest teams and resources first
     assign_team_form = AssignTeamForm()
-    assign_team_form.team_id.choices = [(t.id, f"{t.full_name} ({t.username})") for t in rescue_teams]
+    assign_team_form.team_id.choices = team_choices(incident)
     
     assign_resource_form = AssignResourceForm()
-    assign_resource_form.resource_ids.choices = [(r.id, f"{r.name} ({r.resource_type})") for r in available_resources]
+    assign_resource_form.resource_ids.choices = resource_choices(incident)
     
     status_form = StatusUpdateForm()
     
@@ -293,8 +415,7 @@ def assign_team(incident_id):
     form = AssignTeamForm()
     
     # Populate choices
-    rescue_teams = User.query.filter_by(role='rescue_team', is_active=True).all()
-    form.team_id.choices = [(t.id, f"{t.full_name} ({t.username})") for t in rescue_teams]
+    form.team_id.choices = team_choices(incident)
     
     if form.validate_on_submit():
         try:
@@ -334,8 +455,7 @@ def assign_resource(incident_id):
     form = AssignResourceForm()
     
     # Populate choices
-    available_resources = Resource.query.filter_by(availability_status='available').all()
-    form.resource_ids.choices = [(r.id, f"{r.name} ({r.resource_type})") for r in available_resources]
+    form.resource_ids.choices = resource_choices(incident)
     
     if form.validate_on_submit():
         try:
@@ -402,54 +522,90 @@ def assign_resource(incident_id):
 def analytics():
     return render_template('admin/analytics.html')
 
+def _parse_moment(value, is_end=False):
+    moment = datetime.fromisoformat(value)
+    if is_end and len(value) == 10:
+        # A date-only end includes that whole day
+        moment += timedelta(days=1)
+    return moment
+
 @admin_bp.route('/api/analytics-data')
 @login_required
 @admin_required
 def analytics_data():
-    # Incidents by status
-    status_data = db.session.query(
-        Incident.status,
-        func.count(Incident.id)
-    ).group_by(Incident.status).all()
-    
-    # Incidents by type
-    type_data = db.session.query(
-        Incident.incident_type,
-        func.count(Incident.id)
-    ).group_by(Incident.incident_type).all()
-    
-    # Incidents by priority
-    priority_data = db.session.query(
-        Incident.priority,
-        func.count(Incident.id)
-    ).group_by(Incident.priority).all()
-    
-    # Monthly incident trends (last 12 months)
-    monthly_data = db.session.query(
-        extract('year', Incident.created_at).label('year'),
-        extract('month', Incident.created_at).label('month'),
-        func.count(Incident.id).label('count')
-    ).group_by('year', 'month').order_by('year', 'month').limit(12).all()
+    """
+    Chart data from the incident rollups. Optional query parameters:
+    start and end (ISO dates or datetimes; a date-only end is inclusive)
+    and granularity (hour, day, week or month, default month). Without a
+    start the trend covers the latest twelve buckets and the
+    distributions cover all incidents.
+    """
+    granularity = request.args.get('granularity', 'month')
+    if granularity not in GRANULARITIES:
+        return jsonify({'error': f"granularity must be one of {', '.join(GRANULARITIES)}"}), 400
+    
+    try:
+        end = _parse_moment(request.args['end'], is_end=True) if request.args.get('end') else datetime.utcnow()
+        if request.args.get('start'):
+            start = _parse_moment(request.args['start'])
+            range_start, range_stop, _ = align_range(start, end, granularity)
+            distributions = rollup_distributions(range_start, range_stop, granularity)
+        else:
+            start = latest_buckets_start(end, granularity)
+            distributions = rollup_distributions()
+        trend = rollup_trend(start, end, granularity)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    status_data = distributions['status']
+    type_data = distributions['incident_type']
+    priority_data = distributions['priority']
     
     return jsonify({
         'status_distribution': {
-            'labels': [item[0].title() for item in status_data],
-            'data': [item[1] for item in status_data]
+            'labels': [status.replace('_', ' ').title() for status in status_data],
+            'data': list(status_data.values())
         },
         'type_distribution': {
-            'labels': [item[0].replace('_', ' ').title() for item in type_data],
-            'data': [item[1] for item in type_data]
+            'labels': [incident_type.replace('_', ' ').title() for incident_type in type_data],
+            'data': list(type_data.values())
         },
         'priority_distribution': {
-            'labels': [item[0].title() for item in priority_data],
-            'data': [item[1] for item in priority_data]
+            'labels': [priority.title() for priority in priority_data],
+            'data': list(priority_data.values())
         },
-        'monthly_trends': {
-            'labels': [f"{int(item[1])}/{int(item[0])}" for item in monthly_data],
-            'data': [item[2] for item in monthly_data]
+        'trends': {
+            'granularity': granularity,
+            'labels': [bucket_label(bucket, granularity) for bucket, _ in trend],
+            'data': [count for _, count in trend]
         }
     })
 
+@admin_bp.route('/api/response-times')
+@login_required
+@admin_required
+def response_times_data():
+    """
+    Time to accept, to in progress and to resolve percentiles for
+    incidents created between the optional start and end (ISO dates or
+    datetimes; a date-only end is inclusive), overall and by incident
+    type, priority and team.
+    """
+    try:
+        start = _parse_moment(request.args['start']) if request.args.get('start') else None
+        stop = _parse_moment(request.args['end'], is_end=True) if request.args.get('end') else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify(response_times(start, stop))
+
+@admin_bp.route('/api/image-cache')
+@login_required
+@admin_required
+def image_cache_data():
+    """Hit, miss and eviction counters of this worker's image cache, with the size of each tier"""
+    return jsonify(image_cache.stats())
+
 # Delete functionality for all entities
 @admin_bp.route('/delete/user/<int:user_id>', methods=['POST'])
 @login_required
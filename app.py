@@ -52,11 +52,13 @@ def create_app():
     from user import user_bp
     from rescue import rescue_bp
     from admin import admin_bp
+    from routes import image_bp
     
     app.register_blueprint(auth_bp, url_prefix='/auth')
     app.register_blueprint(user_bp, url_prefix='/user')
     app.register_blueprint(rescue_bp, url_prefix='/rescue')
     app.register_blueprint(admin_bp, url_prefix='/admin')
+    app.register_blueprint(image_bp)
     
     # Main route
     @app.route('/')
@@ -72,72 +74,245 @@ def create_app():
     # API endpoints for map data
     @app.route('/api/incidents')
     def api_incidents():
-        from flask import jsonify
-        from models import Incident, User
-        
-        incidents = Incident.query.all()
-        incidents_data = []
-        
-        for incident in incidents:
-            if incident.latitude and incident.longitude:
-                assigned_team_name = None
-                if incident.assigned_team_id:
-                    team = User.query.get(incident.assigned_team_id)
-                    if team:
-                        assigned_team_name = team.full_name
+        from flask import jsonify, request, Response
+        from werkzeug.http import is_resource_modified
+        from geo_utils import parse_bbox
+        from compact_payload import negotiate_format, compact_response
+        from incident_feed import (feed_statement, fetch_feed, fetch_changes, feed_version, feed_etag,
+                                   is_settled, initial_cursor, row_matches, serialize_row, encode_compact,
+                                   parse_list_arg, parse_limit_arg)
+        
+        fmt = negotiate_format(request)
+        
+        # Answer unchanged polls from the validators alone, before touching any rows
+        version = feed_version()
+        etag = feed_etag(version, request.query_string, fmt)
+        if is_settled(version) and not is_resource_modified(request.environ, etag=etag, last_modified=version.last_modified):
+            response = Response(status=304)
+        else:
+            # Restrict to the requested viewport using the geohash index
+            bbox = None
+            if request.args.get('bbox'):
+                try:
+                    bbox = parse_bbox(request.args['bbox'])
+                except ValueError as e:
+                    return jsonify({'error': f'Invalid bbox: {str(e)}'}), 400
+            
+            types = parse_list_arg(request.args, 'type')
+            statuses = parse_list_arg(request.args, 'status')
+            priorities = parse_list_arg(request.args, 'priority')
+            limit = parse_limit_arg(request.args)
+            
+            # Compact clients fetch descriptions per incident, so don't select them
+            encode_rows = encode_compact if fmt else (lambda rows: [serialize_row(row) for row in rows])
+            
+            if request.args.get('cursor'):
+                # Delta sync: every change in view is returned, and the ones that
+                # no longer match the filters are reported as removed
+                try:
+                    rows, deleted_ids, cursor, has_more = fetch_changes(feed_statement(bbox=bbox, include_description=not fmt),
+                                                                        request.args['cursor'], limit)
+                except ValueError:
+                    return jsonify({'error': 'Invalid cursor'}), 400
                 
-                incidents_data.append({
-                    'id': incident.id,
-                    'title': incident.title,
-                    'description': incident.description,
-                    'incident_type': incident.incident_type,
-                    'priority': incident.priority,
-                    'status': incident.status,
-                    'latitude': incident.latitude,
-                    'longitude': incident.longitude,
-                    'created_at': incident.created_at.isoformat(),
-                    'assigned_team': assigned_team_name
-                })
-        
-        return jsonify({'incidents': incidents_data})
+                matching = [row for row in rows if row_matches(row, types, statuses, priorities)]
+                removed = deleted_ids + [row.id for row in rows if not row_matches(row, types, statuses, priorities)]
+                payload = {
+                    'incidents': encode_rows(matching),
+                    'removed': removed,
+                    'cursor': cursor,
+                    'has_more': has_more
+                }
+            else:
+                # Cap the result size so a response never grows with the table
+                stmt = feed_statement(bbox=bbox, types=types, statuses=statuses, priorities=priorities,
+                                      include_description=not fmt)
+                try:
+                    rows, truncated, next_page = fetch_feed(stmt, limit, request.args.get('after'))
+                except ValueError:
+                    return jsonify({'error': 'Invalid page cursor'}), 400
+                payload = {
+                    'incidents': encode_rows(rows),
+                    'truncated': truncated,
+                    'next_page': next_page,
+                    'cursor': initial_cursor(version)
+                }
+            response = compact_response(payload, fmt) if fmt else jsonify(payload)
+        
+        response.set_etag(etag)
+        response.last_modified = version.last_modified
+        response.cache_control.no_cache = True
+        response.vary.add('Accept')
+        return response
+    
+    @app.route('/api/incidents/<int:incident_id>/description')
+    def api_incident_description(incident_id):
+        from flask import jsonify, abort
+        from models import Incident
+        
+        # Loaded on demand by compact clients when a popup opens
+        description = db.session.execute(
+            db.select(Incident.description).where(Incident.id == incident_id)
+        ).first()
+        if description is None:
+            abort(404)
+        return jsonify({'id': incident_id, 'description': description[0]})
+    
+    @app.route('/api/incidents/clusters')
+    def api_incident_clusters():
+        from flask import jsonify, request, Response
+        from werkzeug.http import is_resource_modified
+        from geo_utils import parse_bbox
+        from incident_feed import feed_version, feed_etag, is_settled, parse_list_arg
+        from cluster_utils import clusters_in_view
+        
+        try:
+            bbox = parse_bbox(request.args.get('bbox', '-180,-90,180,90'))
+        except ValueError as e:
+            return jsonify({'error': f'Invalid bbox: {str(e)}'}), 400
+        zoom = request.args.get('zoom', 0, type=int)
+        
+        # Clusters change exactly when the incident feed does, so they share its validators
+        version = feed_version()
+        etag = feed_etag(version, request.query_string)
+        if is_settled(version) and not is_resource_modified(request.environ, etag=etag, last_modified=version.last_modified):
+            response = Response(status=304)
+        else:
+            precision, clusters = clusters_in_view(zoom, bbox,
+                                                   statuses=parse_list_arg(request.args, 'status'),
+                                                   priorities=parse_list_arg(request.args, 'priority'))
+            response = jsonify({'zoom': zoom, 'precision': precision, 'clusters': clusters})
+        
+        response.set_etag(etag)
+        response.last_modified = version.last_modified
+        response.cache_control.no_cache = True
+        return response
+    
+    @app.route('/api/incidents/heatmap/<int:z>/<int:x>/<int:y>')
+    def api_incident_heatmap(z, x, y):
+        from flask import jsonify, request, Response
+        from werkzeug.http import is_resource_modified
+        from incident_feed import parse_list_arg
+        from heatmap_utils import heatmap_tile
+        
+        try:
+            tile, etag = heatmap_tile(z, x, y, types=parse_list_arg(request.args, 'type'),
+                                      window_hours=request.args.get('window', 0, type=int))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        if not is_resource_modified(request.environ, etag=etag):
+            response = Response(status=304)
+        else:
+            response = jsonify(tile)
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response
+    
+    @app.route('/api/events/stream')
+    def api_event_stream():
+        from flask import jsonify, request, Response, current_app, stream_with_context
+        from flask_login import current_user
+        from event_stream import broker, event_stream
+        
+        if not current_user.is_authenticated:
+            return jsonify({'error': 'Authentication required'}), 401
+        
+        # EventSource gives up on a 503, and the page falls back to polling
+        if broker.at_capacity():
+            response = jsonify({'error': 'Too many open event streams'})
+            response.status_code = 503
+            response.headers['Retry-After'] = '60'
+            return response
+        
+        # EventSource sends Last-Event-ID itself when it reconnects
+        last_event_id = request.headers.get('Last-Event-ID', type=int)
+        if last_event_id is None:
+            last_event_id = request.args.get('last_event_id', type=int)
+        
+        response = Response(
+            stream_with_context(event_stream(current_app._get_current_object(),
+                                             current_user.id, current_user.role, last_event_id)),
+            mimetype='text/event-stream'
+        )
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'  # stop nginx from buffering the stream
+        return response
     
     @app.route('/api/resources')
     def api_resources():
-        from flask import jsonify
+        from flask import jsonify, request
+        from sqlalchemy import or_, select
+        from geo_utils import parse_bbox, covering_cells, geohash_range_filter
+        from incident_feed import parse_list_arg
+        from compact_payload import negotiate_format, compact_response, encode_columns, coordinate
         from models import Resource
         
-        resources = Resource.query.all()
-        resources_data = []
-        
-        for resource in resources:
-            # For demo, we'll add some mock coordinates based on resource location
-            lat, lng = None, None
-            if resource.location:
-                # Simple coordinate assignment for demo (in real app, geocode the location)
-                if 'north' in resource.location.lower():
-                    lat, lng = 40.7589, -73.9851  # Central Park area
-                elif 'south' in resource.location.lower():
-                    lat, lng = 40.7505, -73.9934  # Times Square area
-                elif 'east' in resource.location.lower():
-                    lat, lng = 40.7614, -73.9776  # Upper East Side
-                elif 'west' in resource.location.lower():
-                    lat, lng = 40.7614, -73.9776  # Upper West Side
-                else:
-                    lat, lng = 40.7128, -74.0060  # Default NYC
-            
-            if lat and lng:
-                resources_data.append({
-                    'id': resource.id,
-                    'name': resource.name,
-                    'resource_type': resource.resource_type,
-                    'availability_status': resource.availability_status,
-                    'description': resource.description,
-                    'location': resource.location,
-                    'latitude': lat,
-                    'longitude': lng
-                })
-        
-        return jsonify({'resources': resources_data})
+        fmt = negotiate_format(request)
+        
+        # Coordinates are geocoded when a resource is saved, so this is a plain read
+        columns = [Resource.id, Resource.name, Resource.resource_type, Resource.availability_status,
+                   Resource.location, Resource.latitude, Resource.longitude]
+        if not fmt:
+            columns.append(Resource.description)
+        stmt = select(*columns).where(Resource.geohash.isnot(None))
+        
+        if request.args.get('bbox'):
+            try:
+                south, west, north, east = parse_bbox(request.args['bbox'])
+            except ValueError as e:
+                return jsonify({'error': f'Invalid bbox: {str(e)}'}), 400
+            stmt = stmt.where(geohash_range_filter(Resource.geohash, covering_cells(south, west, north, east)),
+                              Resource.latitude.between(south, north))
+            if west <= east:
+                stmt = stmt.where(Resource.longitude.between(west, east))
+            else:
+                stmt = stmt.where(or_(Resource.longitude >= west, Resource.longitude <= east))
+        
+        statuses = parse_list_arg(request.args, 'status')
+        if statuses:
+            stmt = stmt.where(Resource.availability_status.in_(statuses))
+        
+        # Sorted here: ORDER BY id makes SQLite walk the whole table by rowid instead of the geohash ranges
+        rows = sorted(db.session.execute(stmt).all(), key=lambda row: row.id)
+        
+        if fmt:
+            response = compact_response({'resources': encode_columns(
+                rows,
+                ('id', 'name', 'resource_type', 'availability_status', 'location', 'latitude', 'longitude'),
+                enums=('resource_type', 'availability_status'),
+                converters={'latitude': coordinate, 'longitude': coordinate}
+            )}, fmt)
+            # The body depends on the Accept header; shared caches must key on it
+            response.vary.add('Accept')
+            return response
+        
+        resources_data = [{
+            'id': row.id,
+            'name': row.name,
+            'resource_type': row.resource_type,
+            'availability_status': row.availability_status,
+            'description': row.description,
+            'location': row.location,
+            'latitude': row.latitude,
+            'longitude': row.longitude
+        } for row in rows]
+        
+        response = jsonify({'resources': resources_data})
+        response.vary.add('Accept')
+        return response
+    
+    @app.route('/api/resources/<int:resource_id>/description')
+    def api_resource_description(resource_id):
+        from flask import jsonify, abort
+        from models import Resource
+        
+        description = db.session.execute(
+            db.select(Resource.description).where(Resource.id == resource_id)
+        ).first()
+        if description is None:
+            abort(404)
+        return jsonify({'id': resource_id, 'description': description[0]})
     
     # Profile route
     @app.route('/profile', methods=['GET', 'POST'])
@@ -199,6 +374,10 @@ def create_app():
     # Create database tables
     with app.app_context():
         import models  # noqa: F401
+        import cluster_utils  # noqa: F401  (registers the cluster cell maintenance handler)
+        import counter_utils  # noqa: F401  (registers the incident counter maintenance handler)
+        import rollup_utils  # noqa: F401  (registers the incident rollup maintenance handler)
+        import event_stream  # noqa: F401  (registers the change event writers)
         db.create_all()
         
         # Create default admin user if it doesn't exist
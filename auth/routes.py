@@ -3,7 +3,7 @@ from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import check_password_hash, generate_password_hash
 from app import db
 from models import User
-from forms import LoginForm, RegisterForm
+from forms import LoginForm, RegistrationForm
 from . import auth_bp
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
@@ -37,7 +37,7 @@ def register():
     if current_user.is_authenticated:
         return redirect_to_dashboard()
     
-    form = RegisterForm()
+    form = RegistrationForm()
     if form.validate_on_submit():
         try:
             user = User(
@@ -0,0 +1,61 @@
+from datetime import datetime
+from app import create_app, db
+from models import Incident
+from geo_utils import encode_geohash
+from update_schema import apply_schema_updates
+from cluster_utils import rebuild_cluster_cells
+from sqlalchemy import bindparam
+
+BATCH_SIZE = 1000
+
+def backfill_geohash():
+    """
+    Add the incidents.geohash column and index if missing, then fill it for
+    existing rows.
+
+    Only rows that gain a geohash are written, and those are new to the map
+    feed: updated_at is bumped on them, so delta-sync clients download each
+    of them once. On a first backfill that is every incident with
+    coordinates, i.e. a full re-sync for every open map. The bulk UPDATEs
+    bypass the session hooks that maintain the cluster cells, so those are
+    rebuilt at the end.
+    """
+    app = create_app()
+    with app.app_context():
+        apply_schema_updates()
+
+        # Walk the table in primary key order so each batch is an index range scan
+        last_id = 0
+        updated = 0
+        while True:
+            rows = db.session.query(Incident.id, Incident.latitude, Incident.longitude)\
+                             .filter(Incident.id > last_id,
+                                     Incident.geohash.is_(None),
+                                     Incident.latitude.isnot(None),
+                                     Incident.longitude.isnot(None))\
+                             .order_by(Incident.id)\
+                             .limit(BATCH_SIZE).all()
+            if not rows:
+                break
+
+            # Bump updated_at so delta-sync clients and the per-process indexes,
+            # which follow it, pick the rows up without a restart
+            db.session.execute(
+                Incident.__table__.update()
+                .where(Incident.__table__.c.id == bindparam('row_id'))
+                .values(geohash=bindparam('row_geohash'), updated_at=datetime.utcnow()),
+                [{'row_id': row.id, 'row_geohash': encode_geohash(row.latitude, row.longitude)} for row in rows]
+            )
+            db.session.commit()
+
+            last_id = rows[-1].id
+            updated += len(rows)
+            print(f"Backfilled {updated} incidents")
+
+        if updated:
+            rebuild_cluster_cells()
+            print("Incident cluster cells rebuilt")
+        print(f"Geohash backfill completed: {updated} incidents updated")
+
+if __name__ == "__main__":
+    backfill_geohash()
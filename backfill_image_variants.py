@@ -0,0 +1,60 @@
+from concurrent.futures import FIRST_COMPLETED, wait
+from sqlalchemy import or_
+from app import create_app, db
+from models import Incident
+from image_storage import get_image_storage
+from image_utils import IMAGE_WORKERS, VARIANTS, get_executor, render_stored_variants, store_variants
+
+BATCH_SIZE = 1000
+IN_FLIGHT = IMAGE_WORKERS * 2  # images queued ahead of the pool
+
+def backfill_image_variants():
+    """Render the thumbnail and medium variants of incident and rescue images that don't have them yet"""
+    app = create_app()
+    with app.app_context():
+        storage = get_image_storage()
+        executor = get_executor()
+        pending = {}
+        last_id = 0
+        rendered = failed = 0
+
+        def collect(done):
+            nonlocal rendered, failed
+            for future in done:
+                file_id = pending.pop(future)
+                try:
+                    store_variants(file_id, *future.result())
+                    rendered += 1
+                except Exception as e:
+                    failed += 1
+                    print(f"Error rendering variants of image {file_id}: {str(e)}")
+            print(f"Rendered variants of {rendered} images")
+
+        # Walk the table in primary key order so each batch is an index range scan
+        while True:
+            rows = db.session.query(Incident.id, Incident.image_id, Incident.rescue_image_id)\
+                             .filter(Incident.id > last_id,
+                                     or_(Incident.image_id.isnot(None), Incident.rescue_image_id.isnot(None)))\
+                             .order_by(Incident.id)\
+                             .limit(BATCH_SIZE).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            for file_id in [file_id for row in rows for file_id in (row.image_id, row.rescue_image_id) if file_id]:
+                file_doc = storage.get_file(file_id)
+                if not file_doc or file_doc.get("metadata", {}).get("variant_of") \
+                        or set(VARIANTS) <= set(file_doc.get("variants", {})):
+                    continue
+                # The worker reads the original itself
+                pending[executor.submit(render_stored_variants, file_id)] = file_id
+                if len(pending) >= IN_FLIGHT:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+
+        if pending:
+            collect(wait(pending)[0])
+        print(f"Image variant backfill completed: {rendered} images rendered, {failed} failed")
+
+if __name__ == "__main__":
+    backfill_image_variants()
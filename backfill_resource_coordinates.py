@@ -0,0 +1,68 @@
+from datetime import datetime
+from app import create_app, db
+from models import Resource
+from geocoder import geocode
+from geo_utils import encode_geohash
+from update_schema import apply_schema_updates
+from sqlalchemy import bindparam
+
+BATCH_SIZE = 1000
+
+def backfill_resource_coordinates():
+    """
+    Add the resource coordinate columns if missing, then geocode existing
+    rows. Only rows that had no coordinates and now get them are written,
+    with updated_at bumped so running workers' resource indexes pick them
+    up. Resources have no cluster cells or delta feed to maintain.
+    """
+    app = create_app()
+    with app.app_context():
+        apply_schema_updates()
+
+        last_id = 0
+        updated = 0
+        unresolved = []
+        while True:
+            rows = db.session.query(Resource.id, Resource.location)\
+                             .filter(Resource.id > last_id,
+                                     Resource.latitude.is_(None),
+                                     Resource.location.isnot(None))\
+                             .order_by(Resource.id)\
+                             .limit(BATCH_SIZE).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            # Many resources share a location; geocode() caches repeated lookups
+            params = []
+            for row in rows:
+                coordinates = geocode(row.location)
+                if coordinates:
+                    lat, lng = coordinates
+                    params.append({'row_id': row.id, 'row_lat': lat, 'row_lng': lng,
+                                   'row_geohash': encode_geohash(lat, lng)})
+                else:
+                    unresolved.append(row)
+
+            if params:
+                # Bumping updated_at lets running workers' resource indexes pick the rows up
+                db.session.execute(
+                    Resource.__table__.update()
+                    .where(Resource.__table__.c.id == bindparam('row_id'))
+                    .values(latitude=bindparam('row_lat'),
+                            longitude=bindparam('row_lng'),
+                            geohash=bindparam('row_geohash'),
+                            updated_at=datetime.utcnow()),
+                    params
+                )
+                db.session.commit()
+
+            updated += len(params)
+            print(f"Geocoded {updated} resources")
+
+        for row in unresolved:
+            print(f"Could not geocode resource {row.id}: {row.location!r}")
+        print(f"Resource backfill completed: {updated} resources updated, {len(unresolved)} unresolved")
+
+if __name__ == "__main__":
+    backfill_resource_coordinates()
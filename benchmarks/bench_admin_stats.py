@@ -0,0 +1,65 @@
+"""
+Benchmark the admin dashboard statistics.
+
+Compares, at each table size:
+  separate_counts  the original nine COUNT queries
+  single_query     stats_utils.compute_admin_stats, one aggregate statement
+  snapshot_hit     stats_utils.admin_stats.get() with no writes since the
+                   last load: only the change_events version lookup
+
+Usage (from the repository root):
+    python -m benchmarks.bench_admin_stats --sizes 100000 1000000
+"""
+import argparse
+from benchmarks.common import create_benchmark_app, measure, print_table, seed_incidents
+
+def separate_counts():
+    from models import Incident, Resource, User
+
+    return {
+        'total_users': User.query.filter_by(role='user').count(),
+        'total_rescue_teams': User.query.filter_by(role='rescue_team').count(),
+        'total_incidents': Incident.query.count(),
+        'total_resources': Resource.query.count(),
+        'high_priority_incidents': Incident.query.filter(
+            Incident.priority.in_(['high', 'critical']),
+            Incident.status.in_(['pending', 'in_progress'])
+        ).count(),
+        'incident_stats': {
+            'pending': Incident.query.filter_by(status='pending').count(),
+            'in_progress': Incident.query.filter_by(status='in_progress').count(),
+            'resolved': Incident.query.filter_by(status='resolved').count(),
+            'closed': Incident.query.filter_by(status='closed').count()
+        }
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    app, db = create_benchmark_app(args.database_url)
+    results = []
+    with app.app_context():
+        from stats_utils import admin_stats, compute_admin_stats
+
+        for size in sorted(args.sizes):
+            seed_incidents(db, size)
+            admin_stats.invalidate()
+            expected = separate_counts()
+            assert compute_admin_stats() == expected
+            admin_stats.get()  # warm the snapshot
+
+            for name, fn in (('separate_counts', separate_counts),
+                             ('single_query', compute_admin_stats),
+                             ('snapshot_hit', admin_stats.get)):
+                runs = [measure(db.engine, fn) for _ in range(args.repeat)]
+                best = min(runs, key=lambda run: run['ms'])
+                results.append((size, name, best['queries'], f"{best['ms']:.2f}"))
+
+    print_table(['incidents', 'path', 'queries', 'best ms'], results)
+
+if __name__ == '__main__':
+    main()
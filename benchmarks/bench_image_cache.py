@@ -0,0 +1,106 @@
+"""
+Benchmark serving images through the image cache tiers.
+
+Uploads a small hot set of random images, then requests them round robin
+through /image/<id> from several threads, the way responders keep opening
+the same few photos during an incident. Compares:
+  uncached  every request reads the chunks from MongoDB
+  disk      the disk tier only (memory budget 0), warmed first
+  memory    memory LRU in front of the disk tier, warmed first
+
+Reports requests per second, throughput, latency percentiles and the cache
+counters. Needs a MongoDB server; the images are written to the
+SCRATCH_DATABASE database there, which is dropped afterwards.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_image_cache --mongodb-uri mongodb://localhost:27017/crisis_bench
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from benchmarks.common import create_benchmark_app, print_table
+
+SCRATCH_DATABASE = 'crisis_bench_image_cache'
+
+def serve(app, file_ids, requests, threads):
+    """Request the images round robin from `threads` threads; returns (seconds, latencies in ms)"""
+    def worker(offset):
+        client = app.test_client()
+        latencies = []
+        for i in range(offset, requests, threads):
+            started = time.perf_counter()
+            response = client.get(f'/image/{file_ids[i % len(file_ids)]}')
+            response.get_data()
+            latencies.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, response.status_code
+        return latencies
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        latencies = [ms for part in pool.map(worker, range(threads)) for ms in part]
+    return time.perf_counter() - started, sorted(latencies)
+
+def main():
+    from werkzeug.datastructures import FileStorage
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=5, help='size of the hot set')
+    parser.add_argument('--size', type=float, default=2, help='image size in MB')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--mongodb-uri', default=os.getenv('MONGODB_URI'))
+    args = parser.parse_args()
+    if not args.mongodb_uri:
+        parser.error('--mongodb-uri or MONGODB_URI is required')
+
+    # mongo_utils connects on import
+    os.environ['MONGODB_URI'] = args.mongodb_uri
+    import mongo_utils
+
+    if mongo_utils.db is None:
+        raise SystemExit('MongoDB is not reachable')
+
+    # Write to a scratch database rather than the one in the URI
+    scratch = mongo_utils.client[SCRATCH_DATABASE]
+    mongo_utils.fs_files = scratch.fs_files
+    mongo_utils.fs_chunks = scratch.fs_chunks
+    mongo_utils.content_chunks = scratch.content_chunks
+
+    app, _ = create_benchmark_app()
+    import routes
+    from image_cache import ImageCache
+
+    cache_dir = tempfile.mkdtemp(prefix='crisis-bench-image-cache-')
+    nbytes = int(args.size * 1024 * 1024)
+    hot_set_bytes = nbytes * args.images
+    results = []
+    try:
+        file_ids = [mongo_utils.save_image(FileStorage(BytesIO(os.urandom(nbytes)), filename='bench.jpg',
+                                                       content_type='image/jpeg'))
+                    for _ in range(args.images)]
+        caches = (
+            ('uncached', ImageCache(memory_bytes=0, disk_dir=None)),
+            ('disk', ImageCache(memory_bytes=0, disk_dir=cache_dir, disk_bytes=hot_set_bytes * 2)),
+            ('memory', ImageCache(memory_bytes=hot_set_bytes * 2, disk_dir=cache_dir, disk_bytes=hot_set_bytes * 2)),
+        )
+        for name, cache in caches:
+            routes.image_cache = cache
+            serve(app, file_ids, len(file_ids), 1)  # warm up
+            seconds, latencies = serve(app, file_ids, args.requests, args.threads)
+            stats = cache.stats()
+            results.append((name, f'{args.requests / seconds:.0f}', f'{args.requests * args.size / seconds:.0f}',
+                            f'{latencies[len(latencies) // 2]:.2f}', f'{latencies[int(len(latencies) * 0.99)]:.2f}',
+                            stats['memory_hits'], stats['disk_hits'], stats['misses']))
+    finally:
+        mongo_utils.client.drop_database(SCRATCH_DATABASE)
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    print(f"{args.images} images of {args.size:g} MB, {args.requests} requests from {args.threads} threads")
+    print_table(('tier', 'req/s', 'MB/s', 'p50_ms', 'p99_ms', 'memory_hits', 'disk_hits', 'misses'), results)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark image ingestion into MongoDB.
+
+Uploads random images of each size and compares:
+  per_chunk  the original save_image: read the whole upload, then one
+             insert_one round trip per 255 KB chunk
+  streamed   mongo_utils.save_image: read chunk by chunk, hash each chunk
+             and upsert it into content_chunks in batches of INSERT_BATCH,
+             fs_files written last
+  duplicate  mongo_utils.save_image of an image already stored, which only
+             adds chunk references
+
+Reports the best wall time, throughput and peak traced Python memory per
+upload. Needs a MongoDB server; the images are written to the
+SCRATCH_DATABASE database there, which is dropped afterwards.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_image_upload --mongodb-uri mongodb://localhost:27017/crisis_bench
+"""
+import argparse
+import os
+import time
+import tracemalloc
+from io import BytesIO
+from benchmarks.common import print_table
+
+SCRATCH_DATABASE = 'crisis_bench_images'
+
+def per_chunk_save(fs_files, fs_chunks, file):
+    """The original ingestion path, kept here for comparison"""
+    file_data = file.read()
+    file_id = fs_files.insert_one({
+        "filename": file.filename,
+        "length": len(file_data),
+        "chunkSize": 261120,
+        "metadata": {"filename": file.filename, "contentType": file.content_type}
+    }).inserted_id
+    chunk_size = 261120
+    for i in range(0, len(file_data), chunk_size):
+        fs_chunks.insert_one({"files_id": file_id, "n": i // chunk_size, "data": file_data[i:i + chunk_size]})
+    return str(file_id)
+
+def run(fn, payload):
+    from werkzeug.datastructures import FileStorage
+
+    upload = FileStorage(BytesIO(payload), filename='bench.jpg', content_type='image/jpeg')
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    started = time.perf_counter()
+    file_id = fn(upload)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert file_id, 'upload failed'
+    return elapsed * 1000, peak / 1024
+
+def main():
+    from werkzeug.datastructures import FileStorage
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=float, nargs='+', default=[0.5, 4, 16], help='image sizes in MB')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--mongodb-uri', default=os.getenv('MONGODB_URI'))
+    args = parser.parse_args()
+    if not args.mongodb_uri:
+        parser.error('--mongodb-uri or MONGODB_URI is required')
+
+    # mongo_utils connects on import
+    os.environ['MONGODB_URI'] = args.mongodb_uri
+    import mongo_utils
+
+    if mongo_utils.db is None:
+        raise SystemExit('MongoDB is not reachable')
+
+    # Write to a scratch database rather than the one in the URI
+    scratch = mongo_utils.client[SCRATCH_DATABASE]
+    mongo_utils.fs_files = scratch.fs_files
+    mongo_utils.fs_chunks = scratch.fs_chunks
+    mongo_utils.content_chunks = scratch.content_chunks
+
+    results = []
+    try:
+        for size in args.sizes:
+            nbytes = int(size * 1024 * 1024)
+            duplicate = os.urandom(nbytes)
+            mongo_utils.save_image(FileStorage(BytesIO(duplicate), filename='bench.jpg', content_type='image/jpeg'))
+            for name, fn, payload in (
+                    ('per_chunk', lambda f: per_chunk_save(mongo_utils.fs_files, mongo_utils.fs_chunks, f), None),
+                    ('streamed', mongo_utils.save_image, None),
+                    ('duplicate', mongo_utils.save_image, duplicate)):
+                # Fresh random bytes per run, so only the duplicate path finds its chunks stored
+                runs = [run(fn, payload or os.urandom(nbytes)) for _ in range(args.repeat)]
+                ms, peak_kib = min(runs)
+                results.append((f'{size:g} MB', name, f'{ms:.1f}', f'{size / (ms / 1000):.1f}', f'{peak_kib:.0f}'))
+    finally:
+        mongo_utils.client.drop_database(SCRATCH_DATABASE)
+
+    print_table(('size', 'path', 'ms', 'MB/s', 'peak_kib'), results)
+
+if __name__ == '__main__':
+    main()
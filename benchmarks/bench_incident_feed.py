@@ -0,0 +1,107 @@
+"""
+Benchmark the /api/incidents serialization paths.
+
+Compares, at each table size:
+  legacy_full        the original endpoint: Incident.query.all() plus one
+                     User lookup per assigned incident
+  orm_viewport       ORM hydration plus per-row team lookups, restricted to
+                     a city viewport and the default result cap
+  projected_viewport the incident_feed path: one joined, column-projected
+                     SELECT over the same viewport and cap
+
+Timings include tracemalloc overhead, so compare them relative to each other.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_incident_feed --sizes 10000 100000 1000000
+"""
+import argparse
+from benchmarks.common import CITY_BBOX, create_benchmark_app, measure, print_table, seed_incidents
+
+def legacy_full():
+    from models import Incident, User
+
+    incidents_data = []
+    for incident in Incident.query.all():
+        if incident.latitude and incident.longitude:
+            assigned_team_name = None
+            if incident.assigned_team_id:
+                team = User.query.get(incident.assigned_team_id)
+                if team:
+                    assigned_team_name = team.full_name
+            incidents_data.append({
+                'id': incident.id,
+                'title': incident.title,
+                'description': incident.description,
+                'incident_type': incident.incident_type,
+                'priority': incident.priority,
+                'status': incident.status,
+                'latitude': incident.latitude,
+                'longitude': incident.longitude,
+                'created_at': incident.created_at.isoformat(),
+                'assigned_team': assigned_team_name
+            })
+    return len(incidents_data)
+
+def orm_viewport(limit):
+    from models import Incident, User
+    from geo_utils import covering_cells, geohash_range_filter
+
+    south, west, north, east = CITY_BBOX
+    incidents = Incident.query\
+        .filter(geohash_range_filter(Incident.geohash, covering_cells(south, west, north, east)))\
+        .filter(Incident.latitude.between(south, north), Incident.longitude.between(west, east))\
+        .order_by(Incident.created_at.desc()).limit(limit).all()
+
+    incidents_data = []
+    for incident in incidents:
+        team = User.query.get(incident.assigned_team_id) if incident.assigned_team_id else None
+        incidents_data.append({
+            'id': incident.id,
+            'title': incident.title,
+            'description': incident.description,
+            'incident_type': incident.incident_type,
+            'priority': incident.priority,
+            'status': incident.status,
+            'latitude': incident.latitude,
+            'longitude': incident.longitude,
+            'created_at': incident.created_at.isoformat(),
+            'assigned_team': team.full_name if team else None
+        })
+    return len(incidents_data)
+
+def projected_viewport(limit):
+    from incident_feed import feed_statement, fetch_feed, serialize_row
+
+    rows, _, _ = fetch_feed(feed_statement(bbox=CITY_BBOX), limit)
+    return len([serialize_row(row) for row in rows])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--limit', type=int, default=500)
+    parser.add_argument('--legacy-max', type=int, default=100000,
+                        help='skip legacy_full above this size (it loads the whole table)')
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    app, db = create_benchmark_app(args.database_url)
+    results = []
+    with app.app_context():
+        for size in sorted(args.sizes):
+            seed_incidents(db, size)
+
+            runs = [('orm_viewport', orm_viewport, (args.limit,)),
+                    ('projected_viewport', projected_viewport, (args.limit,))]
+            if size <= args.legacy_max:
+                runs.insert(0, ('legacy_full', legacy_full, ()))
+
+            for name, fn, fn_args in runs:
+                db.session.remove()  # start every run with an empty identity map
+                stats = measure(db.engine, fn, *fn_args)
+                results.append((size, name, stats['result'], stats['queries'],
+                                f"{stats['peak_kib']:.0f}", f"{stats['ms']:.1f}"))
+
+    print_table(['incidents', 'path', 'rows', 'queries', 'peak KiB', 'ms'], results)
+
+if __name__ == '__main__':
+    main()
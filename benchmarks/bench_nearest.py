@@ -0,0 +1,77 @@
+"""
+Benchmark nearest available resource lookups.
+
+Compares, for random incident positions:
+  full_scan   load every available resource with coordinates and sort by
+              great-circle distance (what a per-request lookup would cost)
+  grid_index  nearest_utils.resource_index, including its freshness check
+              and the confirmation query
+
+The grid index is built on first use; its build time is reported
+separately.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_nearest --resources 50000 --k 10
+"""
+import argparse
+import random
+import time
+from benchmarks.common import SEED_BOUNDS, create_benchmark_app, print_table, seed_resources
+
+def full_scan(lat, lng, k):
+    from sqlalchemy import select
+    from app import db
+    from models import Resource
+    from nearest_utils import haversine_km
+
+    rows = db.session.execute(
+        select(Resource.id, Resource.latitude, Resource.longitude)
+        .where(Resource.availability_status == 'available', Resource.latitude.isnot(None))
+    ).all()
+    return sorted((haversine_km(lat, lng, row.latitude, row.longitude), row.id) for row in rows)[:k]
+
+def grid_index(lat, lng, k):
+    from nearest_utils import resource_index
+    return resource_index.nearest(lat, lng, k)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--resources', type=int, default=50000)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    app, db = create_benchmark_app(args.database_url)
+    with app.app_context():
+        from nearest_utils import resource_index
+
+        seed_resources(db, args.resources)
+
+        started = time.perf_counter()
+        resource_index.refresh()
+        build_ms = (time.perf_counter() - started) * 1000
+
+        rng = random.Random(1)
+        south, west, north, east = SEED_BOUNDS
+        points = [(rng.uniform(south, north), rng.uniform(west, east)) for _ in range(args.queries)]
+
+        results = []
+        for name, fn, count in (('full_scan', full_scan, min(args.queries, 20)), ('grid_index', grid_index, args.queries)):
+            timings = []
+            for lat, lng in points[:count]:
+                started = time.perf_counter()
+                matches = fn(lat, lng, args.k)
+                timings.append((time.perf_counter() - started) * 1000)
+                if name == 'grid_index':
+                    expected = [key for _, key in full_scan(lat, lng, args.k)] if len(timings) <= 20 else None
+                    assert expected is None or [key for _, key in matches] == expected
+            timings.sort()
+            results.append((name, count, f"{sum(timings) / len(timings):.2f}",
+                            f"{timings[len(timings) // 2]:.2f}", f"{timings[int(len(timings) * 0.95)]:.2f}"))
+
+    print(f"grid index build: {build_ms:.0f} ms for {len(resource_index.grid)} available resources")
+    print_table(['path', 'queries', 'mean ms', 'p50 ms', 'p95 ms'], results)
+
+if __name__ == '__main__':
+    main()
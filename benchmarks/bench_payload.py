@@ -0,0 +1,77 @@
+"""
+Benchmark the /api/incidents payload encodings.
+
+Fetches every seeded incident through the feed statement and compares:
+  json       the default list of objects, descriptions included
+  columnar   one array per field with dictionary-encoded enums and no
+             descriptions (format=columnar)
+  msgpack    the columnar tables packed with MessagePack (format=msgpack),
+             skipped if msgpack is not installed
+
+For each, reports the time to build and encode the body (best of --repeat
+runs, query excluded), the body size and its gzip size.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_payload --size 100000
+"""
+import argparse
+import gzip
+import json
+import time
+from benchmarks.common import create_benchmark_app, print_table, seed_incidents
+
+def encode_json(rows):
+    from incident_feed import serialize_row
+    return json.dumps({'incidents': [serialize_row(row) for row in rows]}).encode()
+
+def encode_columnar(rows):
+    from incident_feed import encode_compact
+    return json.dumps({'incidents': encode_compact(rows), 'format': 'columnar'}, separators=(',', ':')).encode()
+
+def encode_msgpack(rows):
+    from compact_payload import msgpack
+    from incident_feed import encode_compact
+    return msgpack.packb({'incidents': encode_compact(rows), 'format': 'msgpack'}, use_bin_type=True)
+
+def best_time(fn, rows, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = fn(rows)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000, body
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    app, db = create_benchmark_app(args.database_url)
+    with app.app_context():
+        from compact_payload import msgpack
+        from incident_feed import feed_statement, fetch_feed
+
+        seed_incidents(db, args.size)
+        full_rows, _, _ = fetch_feed(feed_statement(), args.size)
+        compact_rows, _, _ = fetch_feed(feed_statement(include_description=False), args.size)
+
+        runs = [('json', encode_json, full_rows), ('columnar', encode_columnar, compact_rows)]
+        if msgpack is not None:
+            runs.append(('msgpack', encode_msgpack, compact_rows))
+
+        results = []
+        baseline = None
+        for name, fn, rows in runs:
+            ms, body = best_time(fn, rows, args.repeat)
+            gzipped = len(gzip.compress(body, 6))
+            baseline = baseline or (ms, len(body), gzipped)
+            results.append((name, len(rows), f"{ms:.0f}", f"{len(body) / 1024:.0f}", f"{gzipped / 1024:.0f}",
+                            f"{len(body) / baseline[1]:.2f}", f"{gzipped / baseline[2]:.2f}", f"{ms / baseline[0]:.2f}"))
+
+    print_table(['format', 'rows', 'encode ms', 'KiB', 'gzip KiB', 'size x', 'gzip x', 'time x'], results)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""
+Benchmark the response-time analytics.
+
+Seeds incidents with status histories and times, per size:
+  load      the query reducing status updates to first transition times
+            per incident, fetched into NumPy arrays
+  compute   response_times.summarize_timings: percentiles overall and per
+            type, priority and team on those arrays
+  total     response_times.compute_response_times end to end
+  cached    response_times.response_times on a cache hit
+
+Usage (from the repository root):
+    python -m benchmarks.bench_response_times --sizes 1000000 5000000
+"""
+import argparse
+import time
+from benchmarks.common import create_benchmark_app, print_table, seed_incidents, seed_status_updates
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return (time.perf_counter() - started) * 1000, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000000, 5000000],
+                        help='status update counts')
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    app, db = create_benchmark_app(args.database_url)
+    results = []
+    with app.app_context():
+        import response_times
+
+        for size in sorted(args.sizes):
+            seed_incidents(db, size // 3)
+            updates = seed_status_updates(db, size)
+
+            load_ms, timings = timed(response_times.load_incident_timings)
+            compute_ms, _ = timed(response_times.summarize_timings, timings)
+            total_ms, _ = timed(response_times.compute_response_times)
+            response_times.response_time_cache.clear()
+            response_times.response_times()
+            cached_ms, _ = timed(response_times.response_times)
+            results.append((updates, len(timings['created']), f"{load_ms:.0f}", f"{compute_ms:.0f}",
+                            f"{total_ms:.0f}", f"{cached_ms:.2f}"))
+
+    print_table(['status updates', 'incidents', 'load ms', 'compute ms', 'total ms', 'cached ms'], results)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+"""
+Shared helpers for the benchmark scripts.
+
+Benchmarks run against a throwaway SQLite database unless --database-url is
+given. DATABASE_URL has to be set before the app module is imported, because
+importing it builds the application.
+"""
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+INCIDENT_TYPES = ['fire', 'medical', 'accident', 'natural_disaster', 'crime', 'utility', 'other']
+PRIORITIES = ['low', 'medium', 'high', 'critical']
+STATUSES = ['pending', 'in_progress', 'resolved', 'closed']
+
+# Seeded incidents are scattered over a box around New York City
+SEED_BOUNDS = (40.40, -74.40, 41.00, -73.60)  # south, west, north, east
+CITY_BBOX = (40.70, -74.02, 40.76, -73.95)  # a Manhattan sized viewport
+
+def create_benchmark_app(database_url=None):
+    """Import the app against the given database (a temporary SQLite file by default)"""
+    if database_url is None:
+        handle, path = tempfile.mkstemp(prefix='crisis-bench-', suffix='.db')
+        os.close(handle)
+        database_url = f'sqlite:///{path}'
+    os.environ['DATABASE_URL'] = database_url
+
+    from app import app, db
+    return app, db
+
+def seed_teams(db, count=50):
+    """Make sure at least `count` rescue team users exist and return their ids"""
+    from models import User
+
+    existing = [row.id for row in db.session.query(User.id).filter_by(role='rescue_team')]
+    for i in range(len(existing), count):
+        db.session.add(User(username=f'bench_team_{i}', email=f'bench_team_{i}@crisis.system',
+                            password_hash='x', role='rescue_team', full_name=f'Bench Team {i}'))
+    db.session.commit()
+    return [row.id for row in db.session.query(User.id).filter_by(role='rescue_team')]
+
+def seed_incidents(db, count, batch_size=10000, seed=42):
+    """
+    Top the incidents table up to `count` rows with random data using bulk
+    core inserts. Existing rows are kept, so growing sizes reuse earlier work.
+    """
+    from models import Incident, User
+    from geo_utils import encode_geohash
+
+    existing = db.session.query(Incident).count()
+    if existing >= count:
+        return existing
+
+    rng = random.Random(seed + existing)
+    reporter_id = db.session.query(User.id).filter_by(username='admin').scalar()
+    team_ids = seed_teams(db)
+    south, west, north, east = SEED_BOUNDS
+    now = datetime.utcnow()
+    description = 'Caller reports an emergency at the location. ' * 8
+
+    table = Incident.__table__
+    remaining = count - existing
+    while remaining > 0:
+        rows = []
+        for _ in range(min(batch_size, remaining)):
+            latitude = rng.uniform(south, north)
+            longitude = rng.uniform(west, east)
+            created_at = now - timedelta(seconds=rng.randint(0, 365 * 24 * 3600))
+            status = rng.choice(STATUSES)
+            rows.append({
+                'title': f'Incident {existing + len(rows)}',
+                'description': description,
+                'incident_type': rng.choice(INCIDENT_TYPES),
+                'priority': rng.choice(PRIORITIES),
+                'status': status,
+                'latitude': latitude,
+                'longitude': longitude,
+                'geohash': encode_geohash(latitude, longitude),
+                'address': f'{rng.randint(1, 999)} Bench Street',
+                'created_at': created_at,
+                'updated_at': created_at,
+                'resolved_at': created_at + timedelta(hours=rng.randint(1, 48)) if status == 'resolved' else None,
+                'reported_by': reporter_id,
+                'assigned_team_id': rng.choice(team_ids) if status != 'pending' else None
+            })
+        db.session.execute(table.insert(), rows)
+        db.session.commit()
+        existing += len(rows)
+        remaining -= len(rows)
+
+    return existing
+
+def seed_status_updates(db, count, batch_size=10000, seed=11):
+    """
+    Top the status_updates table up to about `count` rows by giving seeded
+    incidents a plausible history: the assigned team accepts, posts a few
+    progress notes and resolves. Incidents that already have a history are
+    skipped, so seed enough incidents first (about count / 4).
+    """
+    from sqlalchemy import func, select
+    from models import Incident, StatusUpdate, User
+
+    existing = db.session.query(StatusUpdate).count()
+    if existing >= count:
+        return existing
+
+    rng = random.Random(seed + existing)
+    admin_id = db.session.query(User.id).filter_by(username='admin').scalar()
+    last_incident = db.session.query(func.max(StatusUpdate.incident_id)).scalar() or 0
+    incidents = db.session.execute(
+        select(Incident.id, Incident.status, Incident.assigned_team_id, Incident.created_at, Incident.resolved_at)
+        .where(Incident.id > last_incident)
+        .order_by(Incident.id)
+    ).all()
+
+    table = StatusUpdate.__table__
+    rows = []
+    for incident in incidents:
+        if existing + len(rows) >= count:
+            break
+        team = incident.assigned_team_id
+        if team is None:
+            rows.append({'incident_id': incident.id, 'old_status': 'pending', 'new_status': 'pending',
+                         'notes': 'Awaiting a rescue team', 'updated_by': admin_id,
+                         'created_at': incident.created_at + timedelta(minutes=rng.randint(1, 30))})
+            continue
+        at = incident.created_at + timedelta(seconds=int(rng.expovariate(1 / 900)) + 30)
+        rows.append({'incident_id': incident.id, 'old_status': 'pending', 'new_status': 'in_progress',
+                     'notes': 'Incident accepted', 'updated_by': team, 'created_at': at})
+        for _ in range(rng.randint(1, 3)):
+            at += timedelta(seconds=int(rng.expovariate(1 / 3600)) + 60)
+            rows.append({'incident_id': incident.id, 'old_status': 'in_progress', 'new_status': 'in_progress',
+                         'notes': 'Team on site', 'updated_by': team, 'created_at': at})
+        if incident.status in ('resolved', 'closed'):
+            rows.append({'incident_id': incident.id, 'old_status': 'in_progress', 'new_status': incident.status,
+                         'notes': 'Incident resolved', 'updated_by': team,
+                         'created_at': incident.resolved_at or at + timedelta(hours=1)})
+        if len(rows) >= batch_size:
+            db.session.execute(table.insert(), rows)
+            db.session.commit()
+            existing += len(rows)
+            rows = []
+
+    if rows:
+        db.session.execute(table.insert(), rows)
+        db.session.commit()
+        existing += len(rows)
+    return existing
+
+def seed_resources(db, count, batch_size=10000, seed=7):
+    """Top the resources table up to `count` rows scattered over SEED_BOUNDS"""
+    from models import Resource
+    from geo_utils import encode_geohash
+
+    existing = db.session.query(Resource).count()
+    if existing >= count:
+        return existing
+
+    rng = random.Random(seed + existing)
+    south, west, north, east = SEED_BOUNDS
+    created_at = datetime.utcnow() - timedelta(days=1)
+
+    table = Resource.__table__
+    remaining = count - existing
+    while remaining > 0:
+        rows = []
+        for _ in range(min(batch_size, remaining)):
+            latitude = rng.uniform(south, north)
+            longitude = rng.uniform(west, east)
+            rows.append({
+                'name': f'Resource {existing + len(rows)}',
+                'resource_type': rng.choice(['vehicle', 'equipment', 'personnel']),
+                'availability_status': rng.choice(['available', 'available', 'in_use', 'maintenance']),
+                'location': 'Bench Depot',
+                'latitude': latitude,
+                'longitude': longitude,
+                'geohash': encode_geohash(latitude, longitude),
+                'created_at': created_at,
+                'updated_at': created_at
+            })
+        db.session.execute(table.insert(), rows)
+        db.session.commit()
+        existing += len(rows)
+        remaining -= len(rows)
+
+    return existing
+
+def seed_assignments(db, count, batch_size=10000, seed=5):
+    """
+    Top the incident_resources table up to `count` rows assigning random
+    seeded resources to random incidents; most are already released.
+    """
+    from models import Incident, IncidentResource, Resource
+
+    existing = db.session.query(IncidentResource).count()
+    if existing >= count:
+        return existing
+
+    rng = random.Random(seed + existing)
+    incident_ids = [row.id for row in db.session.query(Incident.id)]
+    resource_ids = [row.id for row in db.session.query(Resource.id)]
+    if not incident_ids or not resource_ids:
+        return existing
+    now = datetime.utcnow()
+
+    table = IncidentResource.__table__
+    remaining = count - existing
+    while remaining > 0:
+        rows = []
+        for _ in range(min(batch_size, remaining)):
+            assigned_at = now - timedelta(seconds=rng.randint(0, 365 * 24 * 3600))
+            rows.append({
+                'incident_id': rng.choice(incident_ids),
+                'resource_id': rng.choice(resource_ids),
+                'assigned_at': assigned_at,
+                'released_at': assigned_at + timedelta(hours=rng.randint(1, 12)) if rng.random() < 0.9 else None
+            })
+        db.session.execute(table.insert(), rows)
+        db.session.commit()
+        existing += len(rows)
+        remaining -= len(rows)
+
+    return existing
+
+@contextmanager
+def count_queries(engine):
+    """Count the SQL statements executed on `engine` inside the block"""
+    from sqlalchemy import event
+
+    counter = {'queries': 0}
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        counter['queries'] += 1
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+def measure(engine, fn, *args, **kwargs):
+    """
+    Run fn once and return a dict with wall time (ms), peak traced Python
+    memory (KiB), query count and the function's result.
+    """
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    started = time.perf_counter()
+    with count_queries(engine) as counter:
+        result = fn(*args, **kwargs)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'ms': elapsed * 1000,
+        'peak_kib': peak / 1024,
+        'queries': counter['queries'],
+        'result': result
+    }
+
+def print_table(headers, rows):
+    """Print rows as a fixed width text table"""
+    widths = [max([len(str(header))] + [len(str(row[i])) for row in rows]) for i, header in enumerate(headers)]
+    print('  '.join(str(header).ljust(width) for header, width in zip(headers, widths)))
+    print('  '.join('-' * width for width in widths))
+    for row in rows:
+        print('  '.join(str(value).ljust(width) for value, width in zip(row, widths)))
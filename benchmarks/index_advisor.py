@@ -0,0 +1,172 @@
+"""
+Index advisor: EXPLAIN the hot queries of each blueprint.
+
+Seeds a dataset, refreshes the planner statistics and prints the plan
+summary of every query below, flagging the ones that read a whole table:
+  SQLite      SCAN <table> without an index
+  PostgreSQL  Seq Scan nodes
+  MySQL       access type ALL
+A sort the plan adds on top (no index delivers the order) is reported too.
+A full scan of a table with a handful of rows is expected; seed enough
+rows for the plans to mean something.
+
+Exits with status 1 when any query scans sequentially, so it can run in CI.
+
+Usage (from the repository root):
+    python -m benchmarks.index_advisor --incidents 200000
+    python -m benchmarks.index_advisor --database-url postgresql://localhost/crisis_bench
+"""
+import argparse
+import json
+import sys
+from datetime import datetime
+from benchmarks.common import (CITY_BBOX, create_benchmark_app, print_table, seed_assignments, seed_incidents,
+                               seed_resources, seed_status_updates, seed_teams)
+
+def hot_queries(ids):
+    """(blueprint, name, statement) for the queries the pages run, with representative ids"""
+    from sqlalchemy import select
+    from sqlalchemy.orm import joinedload
+    from models import Incident, IncidentResource, Resource, StatusUpdate, User
+    from pagination_utils import newest_first
+    from incident_feed import feed_statement
+    from geo_utils import covering_cells, geohash_range_filter
+
+    cursor = (datetime.utcnow(), 0)  # a keyset cursor one page down
+    bbox = CITY_BBOX
+    return [
+        ('admin', 'latest incidents', Incident.query.options(joinedload(Incident.reporter), joinedload(Incident.assigned_team))
+            .order_by(Incident.created_at.desc()).limit(5)),
+        ('admin', 'incidents page', newest_first(Incident.query, Incident, cursor).limit(21)),
+        ('admin', 'incidents by status', newest_first(Incident.query.filter_by(status='pending'), Incident, cursor).limit(21)),
+        ('admin', 'incidents by status and priority',
+            newest_first(Incident.query.filter_by(status='pending', priority='high'), Incident, cursor).limit(21)),
+        ('admin', 'users page', newest_first(User.query, User, cursor).limit(21)),
+        ('admin', 'resources page', newest_first(Resource.query, Resource, cursor).limit(21)),
+        ('admin', 'incident status history', StatusUpdate.query.filter_by(incident_id=ids['incident'])
+            .order_by(StatusUpdate.created_at.desc())),
+        ('admin', 'open resource assignment', IncidentResource.query.filter_by(
+            incident_id=ids['incident'], resource_id=ids['resource'], released_at=None).limit(1)),
+        ('rescue', 'assigned incidents', Incident.query.options(joinedload(Incident.reporter))
+            .filter_by(assigned_team_id=ids['team']).order_by(Incident.created_at.desc()).limit(10)),
+        ('rescue', 'unassigned open incidents', Incident.query.options(joinedload(Incident.reporter))
+            .filter_by(assigned_team_id=None).filter(Incident.status.in_(['pending', 'in_progress']))
+            .order_by(Incident.created_at.desc()).limit(5)),
+        ('rescue', 'my incidents page',
+            newest_first(Incident.query.filter_by(assigned_team_id=ids['team']), Incident, cursor).limit(11)),
+        ('user', 'recent incidents', Incident.query.filter_by(reported_by=ids['reporter'])
+            .order_by(Incident.created_at.desc()).limit(5)),
+        ('user', 'my incidents page',
+            newest_first(Incident.query.filter_by(reported_by=ids['reporter']), Incident, cursor).limit(11)),
+        ('api', 'incident feed', feed_statement(bbox=bbox)
+            .order_by(Incident.created_at.desc(), Incident.id.desc()).limit(501)),
+        ('api', 'resources in view', select(Resource.id, Resource.latitude, Resource.longitude)
+            .where(Resource.geohash.isnot(None),
+                   geohash_range_filter(Resource.geohash, covering_cells(*bbox)),
+                   Resource.latitude.between(bbox[0], bbox[2]), Resource.longitude.between(bbox[1], bbox[3]))),
+    ]
+
+def explain(db, statement):
+    """Return (plan summary lines, tables scanned sequentially, sorts added)"""
+    statement = getattr(statement, 'statement', statement)  # ORM Query -> Select
+    connection = db.session.connection()
+    dialect = connection.dialect
+    compiled = statement.compile(dialect=dialect, compile_kwargs={"render_postcompile": True})
+    params = compiled.params
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+
+    if dialect.name == 'sqlite':
+        rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).fetchall()
+        details = [row[-1] for row in rows]
+        scans = [detail.split()[1] for detail in details
+                 if detail.startswith('SCAN ') and ' USING ' not in detail]
+        sorts = [detail for detail in details if detail.startswith('USE TEMP B-TREE')]
+        return details, scans, sorts
+
+    if dialect.name == 'postgresql':
+        plan = connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", params).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        details, scans, sorts = [], [], []
+        nodes = [(plan[0]['Plan'], 0)]
+        while nodes:
+            node, depth = nodes.pop()
+            relation = f" on {node['Relation Name']}" if 'Relation Name' in node else ''
+            index = f" using {node['Index Name']}" if 'Index Name' in node else ''
+            details.append(f"{'  ' * depth}{node['Node Type']}{relation}{index}")
+            if node['Node Type'] == 'Seq Scan':
+                scans.append(node['Relation Name'])
+            if node['Node Type'] in ('Sort', 'Incremental Sort'):
+                sorts.append(node['Node Type'])
+            nodes.extend((child, depth + 1) for child in reversed(node.get('Plans', [])))
+        return details, scans, sorts
+
+    if dialect.name == 'mysql':
+        result = connection.exec_driver_sql(f"EXPLAIN {compiled}", params)
+        columns = list(result.keys())
+        rows = [dict(zip(columns, row)) for row in result]
+        details = [f"{row['table']}: {row['type']} {row.get('key') or ''} {row.get('Extra') or ''}".strip()
+                   for row in rows]
+        scans = [row['table'] for row in rows if row['type'] == 'ALL']
+        sorts = [row['table'] for row in rows if 'filesort' in (row.get('Extra') or '')]
+        return details, scans, sorts
+
+    raise SystemExit(f"EXPLAIN is not supported for {dialect.name}")
+
+def refresh_statistics(db):
+    from sqlalchemy import text
+
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        db.session.execute(text('ANALYZE'))
+    elif dialect == 'mysql':
+        db.session.execute(text('ANALYZE TABLE incidents, status_updates, incident_resources, resources, users'))
+    db.session.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--incidents', type=int, default=100000)
+    parser.add_argument('--resources', type=int, default=5000)
+    parser.add_argument('--database-url')
+    parser.add_argument('--verbose', action='store_true', help='print every plan in full')
+    args = parser.parse_args()
+
+    app, db = create_benchmark_app(args.database_url)
+    with app.app_context():
+        from update_schema import apply_schema_updates
+        from models import Incident, Resource
+
+        apply_schema_updates()
+        seed_incidents(db, args.incidents)
+        seed_status_updates(db, args.incidents * 2)
+        seed_resources(db, args.resources)
+        seed_assignments(db, args.incidents // 2)
+        refresh_statistics(db)
+
+        team_id = seed_teams(db)[0]
+        ids = {
+            'team': team_id,
+            'reporter': db.session.query(Incident.reported_by).limit(1).scalar(),
+            'incident': db.session.query(Incident.id).order_by(Incident.id.desc()).limit(1).scalar(),
+            'resource': db.session.query(Resource.id).limit(1).scalar()
+        }
+
+        results = []
+        flagged = 0
+        for blueprint, name, statement in hot_queries(ids):
+            details, scans, sorts = explain(db, statement)
+            flagged += bool(scans)
+            verdict = f"SEQ SCAN {', '.join(scans)}" if scans else 'index'
+            results.append((blueprint, name, verdict, 'sort' if sorts else ''))
+            if args.verbose:
+                print(f"{blueprint} / {name}")
+                for detail in details:
+                    print(f"    {detail}")
+
+    print_table(('blueprint', 'query', 'access', 'extra'), results)
+    print(f"\n{flagged} of {len(results)} queries scan a table sequentially")
+    sys.exit(1 if flagged else 0)
+
+if __name__ == '__main__':
+    main()
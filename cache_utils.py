@@ -0,0 +1,72 @@
+"""
+Small in-process caches for rendered fragments and computed results.
+
+Entries live for a few seconds at most and are bounded in number, so a
+cache never needs explicit invalidation to stay correct: callers that need
+to see a change immediately include a data version in the key.
+"""
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import func
+from app import db
+from models import ChangeEvent
+
+class TTLCache:
+    """Thread-safe mapping whose entries expire after `ttl` seconds, evicting the oldest beyond `max_entries`"""
+
+    def __init__(self, ttl, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get_or_set(self, key, compute):
+        """Return the cached value for `key`, computing and storing it on a miss"""
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+def data_version():
+    """
+    Id of the newest change event. Every incident, status update and
+    resource write appends one, so it changes whenever dashboard data does.
+    Answered from the end of the primary key index.
+    """
+    return db.session.query(func.max(ChangeEvent.id)).scalar() or 0
+
+FRAGMENT_TTL = 10  # seconds
+
+fragment_cache = TTLCache(ttl=FRAGMENT_TTL)
+
+def cached_fragment(name, scope, render):
+    """
+    Return the HTML for a dashboard fragment, rendering it with `render()`
+    only if no copy exists for this `scope` (usually the user id) at the
+    current data version.
+    """
+    return fragment_cache.get_or_set((name, scope, data_version()), render)
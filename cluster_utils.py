@@ -0,0 +1,131 @@
+"""
+Server-side incident clustering for the live maps.
+
+Incident counts are pre-aggregated per geohash cell at every cluster
+precision in the incident_cluster_cells table, keyed by status and
+priority. The table is updated incrementally in the same transaction as
+each incident write (see register_incident_change_handler in models.py),
+so serving a zoomed-out map only reads the handful of cells in view.
+rebuild_clusters.py recomputes the table from scratch.
+"""
+from sqlalchemy import delete, func, insert, literal, select
+from app import db
+from models import Incident, IncidentClusterCell, increment_counters, register_incident_change_handler
+from geo_utils import cell_size, covering_cells, geohash_range_filter
+
+CLUSTER_PRECISIONS = range(1, 8)  # precision 7 cells are ~150m wide
+PRIORITY_RANK = {'low': 0, 'medium': 1, 'high': 2, 'critical': 3}
+CLUSTER_FIELDS = ('status', 'priority', 'geohash', 'latitude', 'longitude')
+
+def precision_for_zoom(zoom):
+    """
+    Pick the cluster precision for a web map zoom level: the coarsest
+    geohash cell no wider than roughly a quarter of a 256px tile.
+    """
+    target_width = 90.0 / (1 << max(int(zoom), 0))
+    for precision in CLUSTER_PRECISIONS:
+        if cell_size(precision)[1] <= target_width:
+            return precision
+    return CLUSTER_PRECISIONS[-1]
+
+@register_incident_change_handler
+def update_cluster_cells(connection, before, after):
+    """Move an incident's contribution between cluster cells as it changes"""
+    if before and after and all(before[f] == after[f] for f in CLUSTER_FIELDS):
+        return
+
+    table = IncidentClusterCell.__table__
+    for sign, snapshot in ((-1, before), (1, after)):
+        if not snapshot or not snapshot['geohash']:
+            continue
+        for precision in CLUSTER_PRECISIONS:
+            increment_counters(connection, table, {
+                'precision': precision,
+                'cell': snapshot['geohash'][:precision],
+                'status': snapshot['status'],
+                'priority': snapshot['priority']
+            }, {
+                'count': sign,
+                'latitude_sum': sign * snapshot['latitude'],
+                'longitude_sum': sign * snapshot['longitude']
+            })
+
+def clusters_in_view(zoom, bbox, statuses=None, priorities=None):
+    """
+    Return the clusters covering `bbox` (south, west, north, east) at the
+    precision for `zoom`, each with its count, centroid, per status and per
+    priority counts and worst priority.
+    """
+    precision = precision_for_zoom(zoom)
+    south, west, north, east = bbox
+    cells = covering_cells(south, west, north, east, max_precision=precision)
+
+    stmt = select(
+        IncidentClusterCell.cell,
+        IncidentClusterCell.status,
+        IncidentClusterCell.priority,
+        IncidentClusterCell.count,
+        IncidentClusterCell.latitude_sum,
+        IncidentClusterCell.longitude_sum
+    ).where(IncidentClusterCell.precision == precision,
+            IncidentClusterCell.count > 0,
+            geohash_range_filter(IncidentClusterCell.cell, cells))
+    if statuses:
+        stmt = stmt.where(IncidentClusterCell.status.in_(statuses))
+    if priorities:
+        stmt = stmt.where(IncidentClusterCell.priority.in_(priorities))
+
+    clusters = {}
+    for row in db.session.execute(stmt):
+        cluster = clusters.setdefault(row.cell, {
+            'cell': row.cell,
+            'count': 0,
+            'latitude_sum': 0.0,
+            'longitude_sum': 0.0,
+            'by_status': {},
+            'by_priority': {},
+            'worst_priority': None
+        })
+        cluster['count'] += row.count
+        cluster['latitude_sum'] += row.latitude_sum
+        cluster['longitude_sum'] += row.longitude_sum
+        cluster['by_status'][row.status] = cluster['by_status'].get(row.status, 0) + row.count
+        cluster['by_priority'][row.priority] = cluster['by_priority'].get(row.priority, 0) + row.count
+        if PRIORITY_RANK.get(row.priority, -1) > PRIORITY_RANK.get(cluster['worst_priority'], -1):
+            cluster['worst_priority'] = row.priority
+
+    results = []
+    for cluster in clusters.values():
+        count = cluster.pop('count')
+        latitude_sum = cluster.pop('latitude_sum')
+        longitude_sum = cluster.pop('longitude_sum')
+        cluster.update({
+            'count': count,
+            'latitude': latitude_sum / count,
+            'longitude': longitude_sum / count
+        })
+        results.append(cluster)
+
+    return precision, results
+
+def rebuild_cluster_cells():
+    """Recompute every cluster cell from the incidents table with one GROUP BY per precision"""
+    table = IncidentClusterCell.__table__
+    db.session.execute(delete(table))
+    for precision in CLUSTER_PRECISIONS:
+        cell = func.substr(Incident.geohash, 1, precision)
+        aggregate = select(
+            literal(precision),
+            cell,
+            Incident.status,
+            Incident.priority,
+            func.count(Incident.id),
+            func.sum(Incident.latitude),
+            func.sum(Incident.longitude)
+        ).where(Incident.geohash.isnot(None))\
+         .group_by(cell, Incident.status, Incident.priority)
+        db.session.execute(insert(table).from_select(
+            ['precision', 'cell', 'status', 'priority', 'count', 'latitude_sum', 'longitude_sum'],
+            aggregate
+        ))
+    db.session.commit()
@@ -0,0 +1,80 @@
+"""
+Compact encodings for the map APIs.
+
+The default JSON payloads are a list of objects, so every key name is
+repeated for every row. The columnar format sends one array per field
+instead. Status, priority and type values are dictionary-encoded as
+small integer codes, timestamps are sent as epoch seconds, and
+coordinates are rounded to 6 decimal places (about 0.1 m). Descriptions
+are left out and fetched per item when a popup opens.
+
+Clients opt in with ?format=columnar or ?format=msgpack, or by sending the
+matching media type in Accept. MessagePack is used only if the msgpack
+package is installed; otherwise those requests get columnar JSON.
+"""
+import json
+from datetime import datetime
+from flask import Response
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_MIMETYPE = 'application/json'
+COLUMNAR_MIMETYPE = 'application/vnd.crisis.columnar+json'
+MSGPACK_MIMETYPE = 'application/x-msgpack'
+
+COORDINATE_DIGITS = 6
+EPOCH = datetime(1970, 1, 1)
+
+def negotiate_format(request):
+    """
+    Pick the response encoding for a request: 'columnar', 'msgpack', or None
+    for the plain JSON objects.
+    """
+    requested = request.args.get('format')
+    if requested is None:
+        offered = [JSON_MIMETYPE, COLUMNAR_MIMETYPE] + ([MSGPACK_MIMETYPE] if msgpack else [])
+        mimetype = request.accept_mimetypes.best_match(offered, default=JSON_MIMETYPE)
+        requested = {COLUMNAR_MIMETYPE: 'columnar', MSGPACK_MIMETYPE: 'msgpack'}.get(mimetype)
+
+    if requested == 'msgpack' and msgpack is None:
+        return 'columnar'
+    return requested if requested in ('columnar', 'msgpack') else None
+
+def epoch_seconds(value):
+    return int((value - EPOCH).total_seconds()) if value else None
+
+def coordinate(value):
+    return round(value, COORDINATE_DIGITS) if value is not None else None
+
+def encode_columns(rows, fields, enums=(), converters=None):
+    """
+    Turn result rows into {'count', 'columns', 'dictionaries'}. Fields named
+    in `enums` are sent as indexes into their dictionary; `converters` maps
+    a field to a function applied to each value.
+    """
+    converters = converters or {}
+    columns = {}
+    dictionaries = {}
+
+    for field in fields:
+        values = [getattr(row, field) for row in rows]
+        if field in converters:
+            convert = converters[field]
+            values = [convert(value) for value in values]
+        if field in enums:
+            codes = {}
+            values = [codes.setdefault(value, len(codes)) for value in values]
+            dictionaries[field] = list(codes)
+        columns[field] = values
+
+    return {'count': len(rows), 'columns': columns, 'dictionaries': dictionaries}
+
+def compact_response(payload, fmt):
+    """Encode a payload containing columnar tables as a Response in the given format"""
+    payload = dict(payload, format=fmt)
+    if fmt == 'msgpack':
+        return Response(msgpack.packb(payload, use_bin_type=True), mimetype=MSGPACK_MIMETYPE)
+    return Response(json.dumps(payload, separators=(',', ':')), mimetype=COLUMNAR_MIMETYPE)
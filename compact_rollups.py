@@ -0,0 +1,29 @@
+"""
+Fold hourly incident rollups older than the retention window into daily
+rollups. Run periodically (e.g. hourly from cron); pass --rebuild to
+recompute every rollup from the incidents table instead.
+"""
+import argparse
+from app import create_app, db
+from rollup_utils import HOURLY_RETENTION_DAYS, compact_rollups, rebuild_rollups
+
+def compact():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rebuild', action='store_true', help='recompute the rollups from scratch')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        try:
+            if args.rebuild:
+                rows = rebuild_rollups()
+                print(f"Incident rollups rebuilt ({rows} rows)")
+            else:
+                folded = compact_rollups()
+                print(f"Compacted {folded} hourly rollups older than {HOURLY_RETENTION_DAYS} days")
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error compacting incident rollups: {str(e)}")
+
+if __name__ == "__main__":
+    compact()
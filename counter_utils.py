@@ -0,0 +1,73 @@
+"""
+Per-user and per-team incident counters for the dashboards.
+
+incident_counters holds the number of incidents each user reported and
+each rescue team is assigned, by status. Rows are adjusted in the same
+transaction as every incident insert, delete, status change and
+(re)assignment through register_incident_change_handler in models.py, so
+a dashboard reads its counts from the primary key instead of counting
+incidents. reconcile_counters.py rebuilds the table from scratch.
+"""
+from sqlalchemy import delete, func, insert, literal, select
+from app import db
+from models import Incident, IncidentCounter, increment_counters, register_incident_change_handler
+
+# owner_type -> the incident column naming the owner
+COUNTER_OWNERS = {
+    'reporter': 'reported_by',
+    'team': 'assigned_team_id'
+}
+
+@register_incident_change_handler
+def update_incident_counters(connection, before, after):
+    """Move an incident between owner/status counters as it changes"""
+    if before and after and all(before[field] == after[field]
+                                for field in ('status', *COUNTER_OWNERS.values())):
+        return
+
+    table = IncidentCounter.__table__
+    for sign, snapshot in ((-1, before), (1, after)):
+        if not snapshot:
+            continue
+        for owner_type, field in COUNTER_OWNERS.items():
+            owner_id = snapshot[field]
+            if owner_id is None:
+                continue
+            # Leave counters for an owner/status pair the change didn't touch
+            other = after if sign < 0 else before
+            if other and other[field] == owner_id and other['status'] == snapshot['status']:
+                continue
+            increment_counters(connection, table, {
+                'owner_type': owner_type,
+                'owner_id': owner_id,
+                'status': snapshot['status']
+            }, {'count': sign})
+
+def incident_counts(owner_type, owner_id):
+    """Return {status: count} for one reporter or team, plus a 'total'"""
+    rows = db.session.execute(
+        select(IncidentCounter.status, IncidentCounter.count)
+        .where(IncidentCounter.owner_type == owner_type, IncidentCounter.owner_id == owner_id)
+    )
+    counts = {status: count for status, count in rows}
+    counts['total'] = sum(counts.values())
+    return counts
+
+def rebuild_incident_counters():
+    """Recompute every counter from the incidents table with one GROUP BY per owner type"""
+    table = IncidentCounter.__table__
+    db.session.execute(delete(table))
+    for owner_type, field in COUNTER_OWNERS.items():
+        owner = getattr(Incident, field)
+        aggregate = select(
+            literal(owner_type),
+            owner,
+            Incident.status,
+            func.count(Incident.id)
+        ).where(owner.isnot(None))\
+         .group_by(owner, Incident.status)
+        db.session.execute(insert(table).from_select(
+            ['owner_type', 'owner_id', 'status', 'count'],
+            aggregate
+        ))
+    db.session.commit()
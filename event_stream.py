@@ -0,0 +1,283 @@
+"""
+Server-Sent Events push channel.
+
+Changes are appended to the change_events table in the same transaction as
+the write that caused them: incident creations, status changes, assignments
+and deletions, StatusUpdate notes, and resource changes. Because the log
+lives in the shared database, every gunicorn worker sees every change.
+
+Each worker runs one EventBroker thread. It reads new rows from the log
+once per POLL_INTERVAL and fans them out to the streams connected to that
+worker, so the database load stays the same however many clients are
+listening. Clients resume after a reconnect with Last-Event-ID; the missed
+events are replayed from the log, up to REPLAY_LIMIT of them. A client that
+missed more gets a resync event and reloads what it shows.
+
+Each open stream holds a connection for as long as its page is open, so in
+production the stream is served by its own gevent gunicorn
+(gunicorn_events.conf.py), where a stream costs a greenlet. Every process
+also caps its streams at EVENT_STREAM_LIMIT and turns the rest away with a
+503, so streams reaching the threaded app server can't take all of its
+threads; pages then fall back to polling. In the browser, one tab per user
+holds the stream and relays events to the user's other tabs (main.js).
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import event, func, or_, select
+from sqlalchemy.orm import Session
+from app import db
+from models import ChangeEvent, Incident, IncidentResource, Resource, StatusUpdate, register_incident_change_handler
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 1.0  # seconds between broker reads of the event log
+RETRY_MS = 5000  # client reconnect delay advertised on each stream
+HEARTBEAT_INTERVAL = 15  # seconds between keepalive comments on idle streams
+GAP_TIMEOUT = 10  # seconds to wait for an id skipped by an uncommitted transaction
+RETENTION = timedelta(days=1)
+REPLAY_LIMIT = 1000
+QUEUE_SIZE = 1000
+EVENT_STREAM_LIMIT = int(os.environ.get('EVENT_STREAM_LIMIT', 32))  # open streams per process
+
+def _record(connection, kind, incident_id=None, resource_id=None, team_id=None, reporter_id=None, **payload):
+    connection.execute(ChangeEvent.__table__.insert().values(
+        kind=kind,
+        incident_id=incident_id,
+        resource_id=resource_id,
+        team_id=team_id,
+        reporter_id=reporter_id,
+        payload=json.dumps(payload),
+        created_at=datetime.utcnow()
+    ))
+
+@register_incident_change_handler
+def record_incident_event(connection, before, after):
+    """Log incident creations, deletions, assignments and status changes"""
+    if before is None:
+        _record(connection, 'incident_created', after['id'], team_id=after['assigned_team_id'],
+                reporter_id=after['reported_by'], status=after['status'], priority=after['priority'],
+                latitude=after['latitude'], longitude=after['longitude'])
+    elif after is None:
+        _record(connection, 'incident_deleted', before['id'], team_id=before['assigned_team_id'],
+                reporter_id=before['reported_by'], latitude=before['latitude'], longitude=before['longitude'])
+    elif before['assigned_team_id'] != after['assigned_team_id']:
+        _record(connection, 'incident_assigned', after['id'], team_id=after['assigned_team_id'],
+                reporter_id=after['reported_by'], previous_team_id=before['assigned_team_id'],
+                status=after['status'])
+    elif before['status'] != after['status']:
+        _record(connection, 'incident_status', after['id'], team_id=after['assigned_team_id'],
+                reporter_id=after['reported_by'], status=after['status'], old_status=before['status'])
+
+@event.listens_for(Session, 'after_flush')
+def record_related_events(session, flush_context):
+    """Log new StatusUpdate rows and resource changes"""
+    connection = None
+    changed = list(session.new) + list(session.deleted) + \
+        [obj for obj in session.dirty if session.is_modified(obj, include_collections=False)]
+    for obj in changed:
+        if isinstance(obj, StatusUpdate) and obj in session.new:
+            connection = connection or session.connection()
+            incident = connection.execute(
+                select(Incident.reported_by, Incident.assigned_team_id).where(Incident.id == obj.incident_id)
+            ).first()
+            _record(connection, 'status_update', obj.incident_id,
+                    team_id=incident.assigned_team_id if incident else None,
+                    reporter_id=incident.reported_by if incident else None,
+                    status=obj.new_status, old_status=obj.old_status)
+        elif isinstance(obj, Resource):
+            connection = connection or session.connection()
+            _record(connection, 'resource_changed', resource_id=obj.id,
+                    availability_status=obj.availability_status, deleted=obj in session.deleted)
+        elif isinstance(obj, IncidentResource):
+            connection = connection or session.connection()
+            _record(connection, 'resource_changed', obj.incident_id, resource_id=obj.resource_id,
+                    released=obj.released_at is not None)
+
+def serialize_event(row):
+    """Convert a change_events row into the dict sent to clients"""
+    data = json.loads(row.payload) if row.payload else {}
+    data.update({
+        'id': row.id,
+        'kind': row.kind,
+        'incident_id': row.incident_id,
+        'resource_id': row.resource_id,
+        'team_id': row.team_id,
+        'reporter_id': row.reporter_id,
+        'created_at': row.created_at.isoformat()
+    })
+    return data
+
+def is_visible(event_data, user_id, role):
+    """Decide whether a user should receive an event, based on role and team"""
+    if role == 'admin':
+        return True
+    if event_data['kind'] == 'resource_changed':
+        return False
+    if role == 'rescue_team':
+        # Teams see their own incidents, incidents taken off them, and the unassigned pool
+        return event_data['team_id'] in (user_id, None) or event_data.get('previous_team_id') == user_id
+    return event_data['reporter_id'] == user_id
+
+def format_sse(event_data):
+    """Encode an event in the text/event-stream wire format"""
+    return f"id: {event_data['id']}\nevent: {event_data['kind']}\ndata: {json.dumps(event_data)}\n\n"
+
+class EventBroker:
+    """Per-process reader of the event log that fans events out to local streams"""
+
+    def __init__(self):
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.app = None
+        self.resume_from = None  # where to start reading when the first stream connects
+
+    def at_capacity(self):
+        """True when this process already serves EVENT_STREAM_LIMIT streams"""
+        with self.lock:
+            return len(self.subscribers) >= EVENT_STREAM_LIMIT
+
+    def subscribe(self, app, since_id):
+        """Register a new stream that has seen every event up to `since_id`"""
+        subscriber = queue.Queue(maxsize=QUEUE_SIZE)
+        with self.lock:
+            self.subscribers.add(subscriber)
+            if self.resume_from is None or since_id < self.resume_from:
+                self.resume_from = since_id
+            if self.thread is None or not self.thread.is_alive():
+                self.app = app
+                self.thread = threading.Thread(target=self._run, name='event-broker', daemon=True)
+                self.thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def _publish(self, event_data):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event_data)
+            except queue.Full:
+                # A stalled client; close its stream so it reconnects and replays
+                self.unsubscribe(subscriber)
+                try:
+                    subscriber.get_nowait()
+                    subscriber.put_nowait(None)
+                except (queue.Empty, queue.Full):
+                    pass
+
+    def _run(self):
+        last_id = None
+        pending_gaps = {}  # id -> time it was first found missing
+        last_pruned = time.monotonic()
+
+        with self.app.app_context():
+            while True:
+                time.sleep(POLL_INTERVAL)
+                try:
+                    with self.lock:
+                        if not self.subscribers:
+                            last_id = None
+                            pending_gaps.clear()
+                            continue
+                        if last_id is None:
+                            last_id = self.resume_from or 0
+                        self.resume_from = None
+
+                    # Ids are allocated at insert but become visible at commit, so a
+                    # skipped id may still appear; keep looking for it for a while
+                    wanted = ChangeEvent.id > last_id
+                    if pending_gaps:
+                        wanted = or_(wanted, ChangeEvent.id.in_(list(pending_gaps)))
+                    rows = db.session.execute(
+                        select(ChangeEvent).where(wanted).order_by(ChangeEvent.id).limit(REPLAY_LIMIT)
+                    ).scalars().all()
+
+                    now = time.monotonic()
+                    for row in rows:
+                        pending_gaps.pop(row.id, None)
+                        if row.id > last_id:
+                            if row.id - last_id <= REPLAY_LIMIT:
+                                pending_gaps.update({missing: now for missing in range(last_id + 1, row.id)})
+                            last_id = row.id
+                        self._publish(serialize_event(row))
+                    pending_gaps = {gap: seen for gap, seen in pending_gaps.items() if now - seen < GAP_TIMEOUT}
+
+                    if now - last_pruned > 600:
+                        db.session.execute(ChangeEvent.__table__.delete().where(
+                            ChangeEvent.created_at < datetime.utcnow() - RETENTION))
+                        db.session.commit()
+                        last_pruned = now
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Event broker error: {str(e)}")
+                finally:
+                    db.session.remove()
+
+broker = EventBroker()
+
+def event_stream(app, user_id, role, last_event_id=None):
+    """Generate the text/event-stream body for one connected client"""
+    since_id = last_event_id
+    if since_id is None:
+        since_id = db.session.query(func.max(ChangeEvent.id)).scalar() or 0
+
+    # Subscribe before replaying so nothing falls between the two
+    subscriber = broker.subscribe(app, since_id)
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+
+        # Replay what the client missed while it was disconnected
+        replayed_id = since_id
+        skipped = {}  # ids the replay found missing -> when; they may still commit
+        rows = db.session.execute(
+            select(ChangeEvent).where(ChangeEvent.id > since_id)
+            .order_by(ChangeEvent.id).limit(REPLAY_LIMIT)
+        ).scalars().all()
+        now = time.monotonic()
+        for row in rows:
+            event_data = serialize_event(row)
+            if row.id - replayed_id <= REPLAY_LIMIT:
+                skipped.update({missing: now for missing in range(replayed_id + 1, row.id)})
+            replayed_id = row.id
+            if is_visible(event_data, user_id, role):
+                yield format_sse(event_data)
+
+        if len(rows) == REPLAY_LIMIT:
+            # Too much was missed to replay, and the broker may already be
+            # past the rest; have the client reload what it shows instead
+            replayed_id = db.session.query(func.max(ChangeEvent.id)).scalar()
+            skipped.clear()
+            yield format_sse({'id': replayed_id, 'kind': 'resync'})
+
+        # Don't hold a pooled connection for the lifetime of the stream
+        db.session.close()
+
+        while True:
+            try:
+                event_data = subscriber.get(timeout=HEARTBEAT_INTERVAL)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+
+            if event_data is None:
+                return
+            if event_data['id'] <= replayed_id:
+                # Only a skipped id committing late comes through below the replay
+                if skipped.pop(event_data['id'], None) is None:
+                    continue
+            elif skipped:
+                now = time.monotonic()
+                skipped = {gap: seen for gap, seen in skipped.items() if now - seen < GAP_TIMEOUT}
+            if is_visible(event_data, user_id, role):
+                yield format_sse(event_data)
+    finally:
+        broker.unsubscribe(subscriber)
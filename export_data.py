@@ -0,0 +1,40 @@
+"""
+Export incidents or their status history as NDJSON or CSV.
+
+Usage:
+    python export_data.py incidents --format csv --output incidents.csv
+    python export_data.py status_updates --status resolved --priority high
+    python export_data.py incidents --type fire --search "warehouse"
+"""
+import argparse
+import sys
+from app import create_app
+from incident_export import EXPORTS, FORMATS, export_chunks
+
+def export_data():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('export', choices=sorted(EXPORTS))
+    parser.add_argument('--format', choices=sorted(FORMATS), default='ndjson')
+    parser.add_argument('--status', help='only incidents with this status')
+    parser.add_argument('--priority', help='only incidents with this priority')
+    parser.add_argument('--type', help='only incidents of this type')
+    parser.add_argument('--search', help='only incidents a search for this text finds')
+    parser.add_argument('--output', help='file to write (default: standard output)')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        out = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+        try:
+            for chunk in export_chunks(args.export, args.format, args.status, args.priority,
+                                       args.type, args.search):
+                out.write(chunk)
+        finally:
+            if args.output:
+                out.close()
+
+    if args.output:
+        print(f"Exported {args.export} to {args.output}", file=sys.stderr)
+
+if __name__ == "__main__":
+    export_data()
@@ -0,0 +1,156 @@
+"""
+Geohash helpers for indexing and querying incident coordinates.
+
+A geohash interleaves latitude and longitude bits into a base32 string, so
+every prefix names a rectangular cell and all points inside that cell share
+the prefix. Storing the hash in an indexed column lets a bounding box query
+become a handful of index range scans instead of a full table scan.
+"""
+import math
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9  # ~5m x 5m cells, plenty for incident locations
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Encode a coordinate pair as a geohash string"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(geohash) < precision:
+        if even:
+            mid = (lng_range[0] + lng_range[1]) / 2
+            if longitude >= mid:
+                bits = (bits << 1) | 1
+                lng_range[0] = mid
+            else:
+                bits = bits << 1
+                lng_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                bits = (bits << 1) | 1
+                lat_range[0] = mid
+            else:
+                bits = bits << 1
+                lat_range[1] = mid
+        even = not even
+        bit_count += 1
+
+        if bit_count == 5:
+            geohash.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return ''.join(geohash)
+
+def cell_size(precision):
+    """Return the (height, width) in degrees of a geohash cell"""
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = (5 * precision) // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
+def successor(prefix):
+    """
+    Return the smallest geohash prefix that sorts after every hash starting
+    with `prefix`, or None if there is none (the prefix is all 'z').
+    """
+    chars = list(prefix)
+    while chars:
+        index = BASE32.index(chars[-1])
+        if index + 1 < len(BASE32):
+            chars[-1] = BASE32[index + 1]
+            return ''.join(chars)
+        chars.pop()
+    return None
+
+def _cell_span(low, high, origin, size):
+    """Return the first and last cell index covering [low, high] on one axis"""
+    first = int(math.floor((low - origin) / size))
+    last = int(math.floor((high - origin) / size))
+    return first, last
+
+def covering_cells(south, west, north, east, max_cells=32, max_precision=GEOHASH_PRECISION):
+    """
+    Return a list of geohash prefixes whose cells together cover the box.
+
+    The finest precision that needs at most `max_cells` cells is used, so
+    the covering stays tight for small viewports and short for large ones.
+    Boxes crossing the antimeridian (west > east) are split in two.
+    """
+    if west > east:
+        return (covering_cells(south, west, north, 180.0, max_cells // 2 or 1, max_precision) +
+                covering_cells(south, -180.0, north, east, max_cells // 2 or 1, max_precision))
+
+    south, north = max(south, -90.0), min(north, 90.0)
+    west, east = max(west, -180.0), min(east, 180.0)
+
+    precision = 1
+    for candidate in range(1, max_precision + 1):
+        height, width = cell_size(candidate)
+        lat_first, lat_last = _cell_span(south, north, -90.0, height)
+        lng_first, lng_last = _cell_span(west, east, -180.0, width)
+        if (lat_last - lat_first + 1) * (lng_last - lng_first + 1) > max_cells:
+            break
+        precision = candidate
+
+    height, width = cell_size(precision)
+    lat_first, lat_last = _cell_span(south, north, -90.0, height)
+    lng_first, lng_last = _cell_span(west, east, -180.0, width)
+    lat_max_index = (1 << ((5 * precision) // 2)) - 1
+    lng_max_index = (1 << ((5 * precision + 1) // 2)) - 1
+
+    cells = set()
+    for lat_index in range(max(lat_first, 0), min(lat_last, lat_max_index) + 1):
+        for lng_index in range(max(lng_first, 0), min(lng_last, lng_max_index) + 1):
+            center_lat = -90.0 + (lat_index + 0.5) * height
+            center_lng = -180.0 + (lng_index + 0.5) * width
+            cells.add(encode_geohash(center_lat, center_lng, precision))
+
+    return sorted(cells)
+
+def geohash_range_filter(column, cells):
+    """
+    Build a SQLAlchemy filter matching rows whose geohash column falls in
+    any of the given cells. Each cell becomes an index range scan
+    (prefix <= hash < successor) rather than a LIKE, so it works with the
+    default B-tree index on every backend.
+    """
+    from sqlalchemy import and_, or_
+
+    clauses = []
+    for cell in cells:
+        upper = successor(cell)
+        if upper is None:
+            clauses.append(column >= cell)
+        else:
+            clauses.append(and_(column >= cell, column < upper))
+    return or_(*clauses)
+
+def parse_bbox(value):
+    """
+    Parse a "west,south,east,north" bounding box string, the format produced
+    by Leaflet's LatLngBounds.toBBoxString(). Returns (south, west, north, east).
+    Raises ValueError if the string is malformed.
+    """
+    parts = [float(part) for part in value.split(',')]
+    if len(parts) != 4:
+        raise ValueError('bbox must have four comma separated numbers')
+
+    west, south, east, north = parts
+    if not (-90.0 <= south <= 90.0 and -90.0 <= north <= 90.0) or south > north:
+        raise ValueError('bbox latitudes out of range')
+
+    # Leaflet reports longitudes beyond +/-180 after panning around the world
+    if east - west >= 360.0:
+        west, east = -180.0, 180.0
+    else:
+        west = ((west + 180.0) % 360.0) - 180.0
+        east = ((east + 180.0) % 360.0) - 180.0
+        if east == -180.0 and parts[2] > parts[0]:
+            east = 180.0
+
+    return south, west, north, east
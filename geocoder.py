@@ -0,0 +1,68 @@
+"""
+Offline geocoder for resource locations.
+
+Free-text locations are resolved against a local gazetteer (a CSV of place
+names and coordinates, data/gazetteer.csv by default or GAZETTEER_PATH), so
+geocoding never makes a network call. A location is geocoded once, when a
+resource is saved, and the coordinates are stored on the row.
+"""
+import csv
+import os
+import re
+from functools import lru_cache
+
+DEFAULT_GAZETTEER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'gazetteer.csv')
+CACHE_SIZE = 4096
+
+COORDINATE_PATTERN = re.compile(r'^\s*(-?\d+(?:\.\d+)?)\s*[,;\s]\s*(-?\d+(?:\.\d+)?)\s*$')
+
+def normalize(text):
+    """Lowercase a place name and collapse punctuation and whitespace"""
+    return ' '.join(re.sub(r"[^\w\s]", ' ', text.lower().replace("'", '')).split())
+
+@lru_cache(maxsize=1)
+def load_gazetteer():
+    """
+    Load the gazetteer as a dict of normalized name -> (lat, lng) and a list
+    of names ordered longest first for substring matching.
+    """
+    path = os.environ.get('GAZETTEER_PATH', DEFAULT_GAZETTEER)
+    places = {}
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            places[normalize(row['name'])] = (float(row['latitude']), float(row['longitude']))
+    names = sorted(places, key=lambda name: (-len(name.split()), -len(name)))
+    return places, names
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _geocode(location):
+    match = COORDINATE_PATTERN.match(location)
+    if match:
+        lat, lng = float(match.group(1)), float(match.group(2))
+        if -90 <= lat <= 90 and -180 <= lng <= 180:
+            return lat, lng
+
+    query = normalize(location)
+    if not query:
+        return None
+
+    places, names = load_gazetteer()
+    if query in places:
+        return places[query]
+
+    # Fall back to the most specific gazetteer name contained in the text
+    padded = f' {query} '
+    for name in names:
+        if f' {name} ' in padded:
+            return places[name]
+    return None
+
+def geocode(location):
+    """
+    Resolve a free-text location to (latitude, longitude), or None if it
+    can't be placed. Accepts gazetteer place names, text containing one,
+    and literal "lat, lng" pairs.
+    """
+    if not location:
+        return None
+    return _geocode(location.strip())
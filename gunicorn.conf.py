@@ -0,0 +1,11 @@
+import os
+
+# Threaded workers for ordinary requests. The server-sent event stream is
+# served by its own gevent server (gunicorn_events.conf.py); if a stream
+# does reach these workers, each process serves at most EVENT_STREAM_LIMIT
+# of them so they can't take every thread.
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 64))
+timeout = 60
+raw_env = [f"EVENT_STREAM_LIMIT={os.environ.get('EVENT_STREAM_LIMIT', threads // 4)}"]
@@ -0,0 +1,30 @@
+import os
+
+# Serves the server-sent event stream (/api/events/stream) apart from the
+# main app server:
+#
+#     gunicorn -c gunicorn_events.conf.py app:app
+#
+# with the front end routing the stream there, e.g. for nginx
+#
+#     location /api/events/ {
+#         proxy_pass http://127.0.0.1:8001;
+#         proxy_buffering off;
+#         proxy_read_timeout 1h;
+#     }
+#
+# An open stream mostly waits, so gevent workers hold each one in a greenlet
+# and a worker takes thousands of them; the threaded main server keeps its
+# threads for ordinary requests.
+bind = os.environ.get('EVENTS_BIND', '127.0.0.1:8001')
+workers = int(os.environ.get('EVENTS_WORKERS', 1))
+worker_class = 'gevent'
+worker_connections = int(os.environ.get('EVENTS_WORKER_CONNECTIONS', 5000))
+timeout = 60
+raw_env = [f"EVENT_STREAM_LIMIT={os.environ.get('EVENT_STREAM_LIMIT', worker_connections - 100)}"]
+
+def post_fork(server, worker):
+    # Let psycopg2 yield to other greenlets while it waits on PostgreSQL
+    from psycogreen.gevent import patch_psycopg
+
+    patch_psycopg()
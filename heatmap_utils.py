@@ -0,0 +1,257 @@
+"""
+Incident density heatmap tiles.
+
+Tiles follow the web map (slippy map) scheme used by Leaflet: tile (x, y)
+at zoom z covers 1/2^z of the Web Mercator square. Each tile is a
+TILE_BINS x TILE_BINS grid of incident counts, computed by projecting the
+incidents inside the tile to pixel space and binning them with one
+numpy.histogram2d call. Only non-empty cells are sent.
+
+Computed tiles are cached per process, keyed by (zoom, tile, filters,
+time bucket). Incident coordinates never change after creation, so a
+tile only goes stale when an incident inside it is created or deleted.
+Every worker follows those events in the change_events log and drops the
+tiles containing them at every zoom level; the rest of the cache stays.
+
+Each event is applied once. Ids are allocated at insert but become visible
+at commit, so an id skipped by the log is kept pending and looked up
+again until it appears or GAP_SECONDS pass. A tile remembers how many
+events had been applied when it was computed, and is not cached if an
+event inside it was applied while it was being computed.
+"""
+import hashlib
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import case, func, or_, select
+from app import db
+from models import ChangeEvent, Incident
+from geo_utils import covering_cells, geohash_range_filter
+
+TILE_BINS = 64  # 4px cells on a 256px tile
+MAX_ZOOM = 18
+TIME_BUCKET_SECONDS = 300  # time windows start on these boundaries so tiles can be shared
+MAX_WINDOW_HOURS = 24 * 365
+TILE_TTL = 3600  # seconds; a safety net, tiles are normally dropped by events
+MAX_TILES = 4096
+SYNC_INTERVAL = 1.0  # seconds between reads of the change log
+GAP_SECONDS = 60  # how long an id skipped by the log is waited for
+MAX_GAP = 1000  # larger jumps in the log are not tracked id by id
+BUILD_SECONDS = 60  # longest a tile computation is expected to take
+MERCATOR_MAX_LATITUDE = 85.0511287798
+
+DENSITY_EVENTS = ('incident_created', 'incident_deleted')
+
+def tile_bounds(z, x, y):
+    """(south, west, north, east) of a web map tile"""
+    n = 1 << z
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return south, west, north, east
+
+def tile_for(latitude, longitude, z):
+    """The (x, y) of the tile containing a point at zoom z"""
+    n = 1 << z
+    latitude = max(-MERCATOR_MAX_LATITUDE, min(MERCATOR_MAX_LATITUDE, latitude))
+    x = int((longitude + 180.0) / 360.0 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(latitude))) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+def validate_tile(z, x, y):
+    if not 0 <= z <= MAX_ZOOM:
+        raise ValueError(f'zoom must be between 0 and {MAX_ZOOM}')
+    if not (0 <= x < (1 << z) and 0 <= y < (1 << z)):
+        raise ValueError('tile out of range')
+
+def time_window(hours, now=None):
+    """
+    Start of a `hours` long window ending at the current time bucket, and
+    the bucket it belongs to; (None, None) for no window.
+    """
+    if not hours:
+        return None, None
+    if not 0 < hours <= MAX_WINDOW_HOURS:
+        raise ValueError(f'window must be between 1 and {MAX_WINDOW_HOURS} hours')
+    bucket = int((now or time.time()) // TIME_BUCKET_SECONDS)
+    since = datetime.utcfromtimestamp(bucket * TIME_BUCKET_SECONDS) - timedelta(hours=hours)
+    return since, bucket
+
+def compute_tile(z, x, y, types=None, since=None):
+    """
+    Bin the incidents inside tile (z, x, y) into a TILE_BINS square grid.
+    Returns {'z', 'x', 'y', 'bins', 'total', 'max', 'cells', 'counts'}
+    where cells are row-major indexes of the non-empty bins.
+    """
+    south, west, north, east = tile_bounds(z, x, y)
+    stmt = select(Incident.latitude, Incident.longitude).where(
+        geohash_range_filter(Incident.geohash, covering_cells(south, west, north, east)),
+        Incident.latitude >= south, Incident.latitude < north,
+        Incident.longitude >= west, Incident.longitude < east
+    )
+    if types:
+        stmt = stmt.where(Incident.incident_type.in_(types))
+    if since is not None:
+        stmt = stmt.where(Incident.created_at >= since)
+
+    # Plain DBAPI tuples straight into arrays
+    rows = db.session.connection().execute(stmt).cursor.fetchall()
+    points = np.array(rows, dtype=np.float64).reshape(-1, 2)
+
+    # Fractional position inside the tile, in the map's projection
+    n = 1 << z
+    latitudes = np.radians(np.clip(points[:, 0], -MERCATOR_MAX_LATITUDE, MERCATOR_MAX_LATITUDE))
+    tile_x = (points[:, 1] + 180.0) / 360.0 * n - x
+    tile_y = (1 - np.arcsinh(np.tan(latitudes)) / np.pi) / 2 * n - y
+
+    counts, _, _ = np.histogram2d(tile_y, tile_x, bins=TILE_BINS, range=[[0, 1], [0, 1]])
+    counts = counts.astype(np.int64).ravel()
+    cells = np.flatnonzero(counts)
+
+    return {
+        'z': z,
+        'x': x,
+        'y': y,
+        'bins': TILE_BINS,
+        'total': int(counts.sum()),
+        'max': int(counts.max()) if len(cells) else 0,
+        'cells': cells.tolist(),
+        'counts': counts[cells].tolist()
+    }
+
+class TileCache:
+    """Per-process heatmap tiles that are dropped when an incident inside them is created or deleted"""
+
+    def __init__(self, ttl=TILE_TTL, max_tiles=MAX_TILES):
+        self.ttl = ttl
+        self.max_tiles = max_tiles
+        self.entries = OrderedDict()  # (z, x, y, variant) -> (expires, tile, etag)
+        self.variants = {}  # (z, x, y) -> set of variants cached for that tile
+        self.last_event_id = None
+        self.pending_gaps = {}  # skipped event id -> time it was first found missing
+        self.applied = 0  # events applied so far, the position tiles are built from
+        self.marks = {}  # (z, x, y) -> (self.applied after its last event, time)
+        self.synced_at = 0.0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                self._drop(key)
+                return None
+            self.entries.move_to_end(key)
+            return entry[1], entry[2]
+
+    def set(self, key, tile, built_from):
+        """
+        Cache `tile`, computed after `built_from` events had been applied,
+        unless an event inside it was applied since. Returns (tile, etag).
+        """
+        etag = hashlib.sha1(json.dumps(tile, sort_keys=True).encode()).hexdigest()
+        with self.lock:
+            mark = self.marks.get(key[:3])
+            if mark is not None and mark[0] > built_from:
+                return tile, etag
+            self.entries[key] = (time.monotonic() + self.ttl, tile, etag)
+            self.entries.move_to_end(key)
+            self.variants.setdefault(key[:3], set()).add(key[3])
+            while len(self.entries) > self.max_tiles:
+                self._drop(next(iter(self.entries)))
+        return tile, etag
+
+    def _drop(self, key):
+        self.entries.pop(key, None)
+        variants = self.variants.get(key[:3])
+        if variants is not None:
+            variants.discard(key[3])
+            if not variants:
+                del self.variants[key[:3]]
+
+    def invalidate_point(self, latitude, longitude):
+        """Drop every cached tile containing a point, at every zoom and for every filter"""
+        with self.lock:
+            self._invalidate_point(latitude, longitude)
+
+    def _invalidate_point(self, latitude, longitude):
+        self.applied += 1
+        now = time.monotonic()
+        for z in range(MAX_ZOOM + 1):
+            tile = (z, *tile_for(latitude, longitude, z))
+            self.marks[tile] = (self.applied, now)
+            for variant in list(self.variants.get(tile, ())):
+                self._drop((*tile, variant))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.variants.clear()
+
+    def sync(self):
+        """
+        Apply incident creations and deletions logged since the last sync.
+        Returns the number of events applied, for set().
+        """
+        with self.lock:
+            if time.monotonic() - self.synced_at < SYNC_INTERVAL:
+                return self.applied
+            self.synced_at = time.monotonic()
+            last_event_id = self.last_event_id
+            pending_gaps = list(self.pending_gaps)
+
+        if last_event_id is None:
+            # Nothing cached yet; start following the log from its end
+            newest = db.session.query(func.max(ChangeEvent.id)).scalar() or 0
+            with self.lock:
+                self.last_event_id = newest
+                return self.applied
+
+        # Every event counts for finding gaps in the ids, but only density
+        # events need their payload
+        wanted = ChangeEvent.id > last_event_id
+        if pending_gaps:
+            wanted = or_(wanted, ChangeEvent.id.in_(pending_gaps))
+        events = db.session.execute(
+            select(ChangeEvent.id, case((ChangeEvent.kind.in_(DENSITY_EVENTS), ChangeEvent.payload)))
+            .where(wanted)
+            .order_by(ChangeEvent.id)
+        ).all()
+
+        with self.lock:
+            now = time.monotonic()
+            for event_id, payload in events:
+                if event_id > self.last_event_id:
+                    if event_id - self.last_event_id <= MAX_GAP:
+                        self.pending_gaps.update({missing: now for missing in range(self.last_event_id + 1, event_id)})
+                    self.last_event_id = event_id
+                elif self.pending_gaps.pop(event_id, None) is None:
+                    continue  # applied already, by an overlapping sync
+                data = json.loads(payload) if payload else {}
+                if data.get('latitude') is None or data.get('longitude') is None:
+                    continue
+                self._invalidate_point(data['latitude'], data['longitude'])
+            self.pending_gaps = {gap: seen for gap, seen in self.pending_gaps.items() if now - seen < GAP_SECONDS}
+            self.marks = {tile: mark for tile, mark in self.marks.items() if now - mark[1] < BUILD_SECONDS}
+            return self.applied
+
+tile_cache = TileCache()
+
+def heatmap_tile(z, x, y, types=None, window_hours=None):
+    """Return (tile, etag) for a heatmap tile, from the cache when it is still current"""
+    validate_tile(z, x, y)
+    since, bucket = time_window(window_hours)
+    variant = (tuple(sorted(types or ())), window_hours or None, bucket)
+
+    built_from = tile_cache.sync()
+    key = (z, x, y, variant)
+    cached = tile_cache.get(key)
+    if cached is not None:
+        return cached
+    return tile_cache.set(key, compute_tile(z, x, y, types, since), built_from)
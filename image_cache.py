@@ -0,0 +1,302 @@
+"""
+Read-through cache of image bytes in front of the Mongo image store.
+
+Two tiers, both bounded by total bytes:
+  memory  a per-process LRU
+  disk    files under IMAGE_CACHE_DIR, shared by the gunicorn workers on
+          the host
+
+A miss in memory tries the disk, then Mongo; what is read is kept in both.
+Stored images never change, so entries need no invalidation: they are keyed
+by the image's SHA-256 (its id for older images without one), and the image
+route looks the fs_files document up before reading, so a deleted image is
+never served from the cache.
+
+The disk tier is safe across processes: a file is written under a temporary
+name and renamed into place, so readers see all of it or nothing, and a
+read checks the length. Reads touch the file's mtime and eviction, under an
+flock on the directory's lock file, removes the least recently read files
+until the directory is back under 90% of its budget. Each process counts
+the bytes it writes since its last directory scan, and evicts when that
+estimate goes over the budget or the scan is more than a minute old.
+
+Images bigger than IMAGE_CACHE_MAX_ENTRY_MB are not cached; the route
+streams them from Mongo as before.
+"""
+import fcntl
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+IMAGE_CACHE_MEMORY_BYTES = int(float(os.environ.get('IMAGE_CACHE_MEMORY_MB', 64)) * MB)
+IMAGE_CACHE_DISK_BYTES = int(float(os.environ.get('IMAGE_CACHE_DISK_MB', 1024)) * MB)
+IMAGE_CACHE_MAX_ENTRY_BYTES = int(float(os.environ.get('IMAGE_CACHE_MAX_ENTRY_MB', 8)) * MB)
+IMAGE_CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'crisis-image-cache'))
+
+DISK_LOW_WATERMARK = 0.9  # eviction stops at this share of the disk budget
+DISK_SCAN_INTERVAL = 60  # seconds before a process re-measures the directory
+STALE_TEMP_SECONDS = 600  # temporary files older than this were left by a dead writer
+
+class MemoryLRU:
+    """Thread-safe LRU of bytes values, bounded by their total size"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self.entries[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+class DiskCache:
+    """Byte-bounded cache directory shared by the processes on one host"""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.estimate = None  # directory size at the last scan plus bytes written since
+        self.scanned_at = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key, length):
+        """The cached bytes for `key`, or None if absent or not `length` long"""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        if len(data) != length:
+            logger.warning(f"Image cache file {path} has {len(data)} bytes, expected {length}; removing it")
+            self._unlink(path)
+            return None
+        try:
+            os.utime(path)  # mark it recently read for eviction
+        except FileNotFoundError:
+            pass
+        return data
+
+    def set(self, key, data):
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(handle, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except Exception:
+            try:
+                os.unlink(temp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+        with self.lock:
+            if self.estimate is not None:
+                self.estimate += len(data)
+            due = self.estimate is None or self.estimate > self.max_bytes or \
+                time.monotonic() - self.scanned_at > DISK_SCAN_INTERVAL
+        if due:
+            self.evict()
+
+    def _scan(self):
+        """(mtime, size, path) of every cache file, removing stale temporary files"""
+        files = []
+        stale_before = time.time() - STALE_TEMP_SECONDS
+        for subdirectory in os.scandir(self.directory):
+            if not subdirectory.is_dir():
+                continue
+            for entry in os.scandir(subdirectory.path):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if entry.name.startswith('.tmp-'):
+                    if stat.st_mtime < stale_before:
+                        self._unlink(entry.path)
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files
+
+    def _unlink(self, path):
+        try:
+            os.unlink(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def evict(self):
+        """Measure the directory and remove the least recently read files beyond the budget"""
+        with open(os.path.join(self.directory, '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                files = self._scan()
+                total = sum(size for _, size, _ in files)
+                evicted = 0
+                if total > self.max_bytes:
+                    files.sort()
+                    target = self.max_bytes * DISK_LOW_WATERMARK
+                    for _, size, path in files:
+                        if total <= target:
+                            break
+                        if self._unlink(path):
+                            evicted += 1
+                        total -= size
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        with self.lock:
+            self.estimate = total
+            self.scanned_at = time.monotonic()
+            self.evictions += evicted
+
+    def usage(self):
+        files = self._scan()
+        return len(files), sum(size for _, size, _ in files)
+
+class ImageCache:
+    """
+    The two tiers in front of a loader. A tier with a zero budget (or no
+    directory, for the disk) is left out.
+    """
+
+    def __init__(self, memory_bytes=IMAGE_CACHE_MEMORY_BYTES, disk_dir=IMAGE_CACHE_DIR,
+                 disk_bytes=IMAGE_CACHE_DISK_BYTES, max_entry_bytes=IMAGE_CACHE_MAX_ENTRY_BYTES):
+        self.memory = MemoryLRU(memory_bytes) if memory_bytes > 0 else None
+        self.disk = None
+        if disk_dir and disk_bytes > 0:
+            try:
+                self.disk = DiskCache(disk_dir, disk_bytes)
+            except OSError as e:
+                logger.error(f"Image disk cache disabled, {disk_dir} is not usable: {str(e)}")
+        self.max_entry_bytes = max_entry_bytes if self.memory or self.disk else 0
+        self.counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'errors': 0}
+        self.lock = threading.Lock()
+        self.loading = {}  # key -> lock held while one thread loads it
+
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def cacheable(self, file_doc):
+        return file_doc["length"] <= self.max_entry_bytes
+
+    def get(self, file_doc, load):
+        """
+        The bytes of the image `file_doc`, from the cache or from `load()`.
+        Concurrent misses for one image in a process share a single load.
+        Returns None if `load()` does.
+        """
+        key = file_doc.get("sha256") or str(file_doc["_id"])
+        length = file_doc["length"]
+        if self.memory is not None:
+            data = self.memory.get(key)
+            if data is not None:
+                self._count('memory_hits')
+                return data
+
+        with self.lock:
+            key_lock = self.loading.get(key)
+            created = key_lock is None
+            if created:
+                key_lock = self.loading[key] = threading.Lock()
+        try:
+            with key_lock:
+                # Another thread may have loaded it while this one waited
+                data = self.memory.get(key) if self.memory is not None else None
+                if data is not None:
+                    self._count('memory_hits')
+                    return data
+
+                data = self._disk_get(key, length)
+                if data is not None:
+                    self._count('disk_hits')
+                else:
+                    self._count('misses')
+                    data = load()
+                    if data is None or len(data) != length:
+                        return None
+                    self._disk_set(key, data)
+                if self.memory is not None:
+                    self.memory.set(key, data)
+                return data
+        finally:
+            # Only the thread that registered the lock removes it; a waiter
+            # popping it could remove a lock a newer loader registered
+            if created:
+                with self.lock:
+                    if self.loading.get(key) is key_lock:
+                        del self.loading[key]
+
+    def _disk_get(self, key, length):
+        if self.disk is None:
+            return None
+        try:
+            return self.disk.get(key, length)
+        except OSError as e:
+            self._count('errors')
+            logger.error(f"Error reading image {key} from the disk cache: {str(e)}")
+            return None
+
+    def _disk_set(self, key, data):
+        if self.disk is None:
+            return
+        try:
+            self.disk.set(key, data)
+        except OSError as e:
+            self._count('errors')
+            logger.error(f"Error writing image {key} to the disk cache: {str(e)}")
+
+    def stats(self):
+        """Counters for this process, with the size of each tier"""
+        with self.lock:
+            stats = dict(self.counters)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['memory_hits'] + stats['disk_hits']) / lookups, 4) if lookups else None
+        if self.memory is not None:
+            stats['memory'] = {'entries': len(self.memory.entries), 'bytes': self.memory.size,
+                               'max_bytes': self.memory.max_bytes, 'evictions': self.memory.evictions}
+        if self.disk is not None:
+            files, size = self.disk.usage()
+            stats['disk'] = {'directory': self.disk.directory, 'files': files, 'bytes': size,
+                             'max_bytes': self.disk.max_bytes, 'evictions': self.disk.evictions}
+        return stats
+
+image_cache = ImageCache()
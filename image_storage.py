@@ -0,0 +1,325 @@
+"""
+Image storage backends behind one interface.
+
+IMAGE_STORAGE selects the backend:
+  mongo       chunked storage in MongoDB (mongo_utils), the default
+  filesystem  one file per image under IMAGE_STORAGE_DIR
+  memory      a dict in the process, for tests and local experiments
+
+Every backend describes an image with an fs_files-shaped document: _id (an
+ObjectId, so ids still fit the 24 character image_id columns), length,
+uploadDate, md5, sha256, metadata.contentType and, once rendered, variants.
+The image route, the variant pipeline and the blueprints only use the
+methods of ImageStorage, and mongo_utils, which connects to MONGODB_URI on
+import, is only imported when the mongo backend is selected.
+
+The filesystem backend hands files to the server instead of reading them
+into Python: with IMAGE_ACCEL_REDIRECT set to an internal nginx location
+that aliases IMAGE_STORAGE_DIR, the route answers with an X-Accel-Redirect
+header and nginx sends the file; otherwise whole files go out through the
+WSGI server's file wrapper, which gunicorn turns into sendfile.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from bson.objectid import ObjectId
+from flask import request
+from werkzeug.utils import secure_filename
+from werkzeug.wsgi import wrap_file
+import logging
+
+logger = logging.getLogger(__name__)
+
+IMAGE_STORAGE = os.environ.get('IMAGE_STORAGE', 'mongo')
+IMAGE_STORAGE_DIR = os.environ.get('IMAGE_STORAGE_DIR',
+                                   os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'images'))
+IMAGE_ACCEL_REDIRECT = os.environ.get('IMAGE_ACCEL_REDIRECT')  # e.g. /_images, an internal nginx location
+
+READ_SIZE = 256 * 1024  # bytes per read when copying or streaming a file
+
+def _new_file_doc(file_id, file, incident_id, metadata, length, md5, sha256):
+    """The fs_files-shaped document for a newly stored image"""
+    return {
+        "_id": file_id,
+        "filename": secure_filename(file.filename),
+        "length": length,
+        "uploadDate": datetime.utcnow(),
+        "md5": md5,
+        "sha256": sha256,
+        "metadata": {
+            "filename": secure_filename(file.filename),
+            "contentType": file.content_type,
+            "incident_id": str(incident_id) if incident_id else None,
+            **(metadata or {})
+        }
+    }
+
+class ImageStorage(ABC):
+    """Interface of an image store. Ids are 24 character ObjectId strings."""
+
+    remote = False  # True when reads leave the host, so the image cache is worth its copy
+    in_process = False  # True when other processes can't read the images
+
+    @abstractmethod
+    def save(self, file, incident_id=None, metadata=None):
+        """Store the upload `file`; returns the new image id, or None on failure"""
+
+    @abstractmethod
+    def get_file(self, file_id):
+        """The image's document, or None if there is no such image"""
+
+    @abstractmethod
+    def iter_chunks(self, file_doc, start=0, stop=None):
+        """Yield bytes [start, stop) of the image"""
+
+    def read(self, file_doc):
+        """All the bytes of the image, or None if they can't be read in full"""
+        data = b''.join(self.iter_chunks(file_doc))
+        return data if len(data) == file_doc["length"] else None
+
+    def body(self, file_doc, start, stop):
+        """A WSGI response body for bytes [start, stop) of the image"""
+        return self.iter_chunks(file_doc, start, stop)
+
+    def accel_redirect(self, file_doc):
+        """Internal URI the front end server can send the image from, if there is one"""
+        return None
+
+    @abstractmethod
+    def set_variants(self, file_id, variants):
+        """Record {size name: image id} variants on the image's document"""
+
+    @abstractmethod
+    def delete(self, file_id):
+        """Delete an image and its variants; returns True on success"""
+
+class MongoImageStorage(ImageStorage):
+    """Chunked, deduplicated storage in MongoDB through mongo_utils"""
+
+    remote = True
+
+    def __init__(self):
+        import mongo_utils  # connects to MONGODB_URI
+
+        self.mongo = mongo_utils
+
+    def save(self, file, incident_id=None, metadata=None):
+        return self.mongo.save_image(file, incident_id, metadata)
+
+    def get_file(self, file_id):
+        return self.mongo.get_image_file(file_id)
+
+    def iter_chunks(self, file_doc, start=0, stop=None):
+        return self.mongo.iter_image_chunks(file_doc, start, stop)
+
+    def read(self, file_doc):
+        return self.mongo.read_image(file_doc)
+
+    def set_variants(self, file_id, variants):
+        self.mongo.fs_files.update_one(
+            {"_id": ObjectId(file_id)},
+            {"$set": {f"variants.{name}": variant_id for name, variant_id in variants.items()}}
+        )
+
+    def delete(self, file_id):
+        return self.mongo.delete_image(file_id)
+
+class FilesystemImageStorage(ImageStorage):
+    """
+    Each image is a file <root>/<id[:2]>/<id> with its document beside it in
+    <id>.json. Both are written under temporary names and renamed into
+    place, the document last, so a reader never finds a partial image.
+    """
+
+    def __init__(self, root=IMAGE_STORAGE_DIR, accel_redirect=IMAGE_ACCEL_REDIRECT):
+        self.root = root
+        self.accel_prefix = accel_redirect.rstrip('/') if accel_redirect else None
+        os.makedirs(root, exist_ok=True)
+
+    def _relative_path(self, file_id):
+        return f"{file_id[:2]}/{file_id}"
+
+    def _path(self, file_id):
+        return os.path.join(self.root, self._relative_path(file_id))
+
+    def _write_atomic(self, path, write):
+        handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(handle, 'wb') as f:
+                result = write(f)
+            os.replace(temp_path, path)
+            return result
+        except Exception:
+            try:
+                os.unlink(temp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def _write_doc(self, file_doc):
+        file_id = str(file_doc["_id"])
+        data = json.dumps({**file_doc, "_id": file_id, "uploadDate": file_doc["uploadDate"].isoformat()}).encode()
+        self._write_atomic(self._path(file_id) + '.json', lambda f: f.write(data))
+
+    def save(self, file, incident_id=None, metadata=None):
+        stream = getattr(file, 'stream', file)
+
+        def copy(f):
+            md5 = hashlib.md5()
+            sha256 = hashlib.sha256()
+            length = 0
+            while True:
+                data = stream.read(READ_SIZE)
+                if not data:
+                    break
+                md5.update(data)
+                sha256.update(data)
+                length += len(data)
+                f.write(data)
+            return length, md5.hexdigest(), sha256.hexdigest()
+
+        file_id = ObjectId()
+        path = self._path(str(file_id))
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            length, md5, sha256 = self._write_atomic(path, copy)
+            self._write_doc(_new_file_doc(file_id, file, incident_id, metadata, length, md5, sha256))
+            logger.info(f"Image saved to {path}")
+            return str(file_id)
+        except Exception as e:
+            logger.error(f"Error saving image to {self.root}: {str(e)}")
+            # Without its document the data file is unreachable
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            return None
+
+    def get_file(self, file_id):
+        # Only well formed ids become paths
+        if not file_id or not ObjectId.is_valid(file_id):
+            return None
+        try:
+            with open(self._path(str(file_id)) + '.json', 'rb') as f:
+                file_doc = json.load(f)
+        except FileNotFoundError:
+            return None
+        file_doc["_id"] = ObjectId(file_doc["_id"])
+        file_doc["uploadDate"] = datetime.fromisoformat(file_doc["uploadDate"])
+        return file_doc
+
+    def iter_chunks(self, file_doc, start=0, stop=None):
+        stop = file_doc["length"] if stop is None else min(stop, file_doc["length"])
+        with open(self._path(str(file_doc["_id"])), 'rb') as f:
+            f.seek(start)
+            remaining = stop - start
+            while remaining > 0:
+                data = f.read(min(READ_SIZE, remaining))
+                if not data:
+                    logger.error(f"Image file {f.name} is shorter than {file_doc['length']} bytes")
+                    return
+                remaining -= len(data)
+                yield data
+
+    def body(self, file_doc, start, stop):
+        if start == 0 and stop == file_doc["length"]:
+            # The server's file wrapper may send the file without Python reading it
+            return wrap_file(request.environ, open(self._path(str(file_doc["_id"])), 'rb'), READ_SIZE)
+        return self.iter_chunks(file_doc, start, stop)
+
+    def accel_redirect(self, file_doc):
+        if self.accel_prefix is None:
+            return None
+        return f"{self.accel_prefix}/{self._relative_path(str(file_doc['_id']))}"
+
+    def set_variants(self, file_id, variants):
+        file_doc = self.get_file(file_id)
+        if file_doc is None:
+            return
+        file_doc["variants"] = {**file_doc.get("variants", {}), **variants}
+        self._write_doc(file_doc)
+
+    def delete(self, file_id):
+        file_doc = self.get_file(file_id)
+        if file_doc is None:
+            return False
+        try:
+            for delete_id in {str(file_id), *file_doc.get("variants", {}).values()}:
+                path = self._path(delete_id)
+                # The document goes first, so the image disappears at once
+                for doomed in (path + '.json', path):
+                    try:
+                        os.unlink(doomed)
+                    except FileNotFoundError:
+                        pass
+            logger.info(f"Image deleted from {self.root} with ID: {file_id}")
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting image {file_id}: {str(e)}")
+            return False
+
+class MemoryImageStorage(ImageStorage):
+    """Images held in a dict in this process"""
+
+    in_process = True
+
+    def __init__(self):
+        self.files = {}  # id -> (document, bytes)
+        self.lock = threading.Lock()
+
+    def save(self, file, incident_id=None, metadata=None):
+        data = getattr(file, 'stream', file).read()
+        file_doc = _new_file_doc(ObjectId(), file, incident_id, metadata, len(data),
+                                 hashlib.md5(data).hexdigest(), hashlib.sha256(data).hexdigest())
+        with self.lock:
+            self.files[str(file_doc["_id"])] = (file_doc, data)
+        return str(file_doc["_id"])
+
+    def get_file(self, file_id):
+        with self.lock:
+            entry = self.files.get(str(file_id))
+        return dict(entry[0]) if entry else None
+
+    def iter_chunks(self, file_doc, start=0, stop=None):
+        with self.lock:
+            entry = self.files.get(str(file_doc["_id"]))
+        if entry:
+            yield entry[1][start:stop]
+
+    def set_variants(self, file_id, variants):
+        with self.lock:
+            entry = self.files.get(str(file_id))
+            if entry:
+                entry[0]["variants"] = {**entry[0].get("variants", {}), **variants}
+
+    def delete(self, file_id):
+        with self.lock:
+            entry = self.files.pop(str(file_id), None)
+            if entry is None:
+                return False
+            for variant_id in entry[0].get("variants", {}).values():
+                self.files.pop(variant_id, None)
+        return True
+
+BACKENDS = {
+    'mongo': MongoImageStorage,
+    'filesystem': FilesystemImageStorage,
+    'memory': MemoryImageStorage
+}
+
+_storage = None
+_storage_lock = threading.Lock()
+
+def get_image_storage():
+    """The configured backend, created on first use"""
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            if IMAGE_STORAGE not in BACKENDS:
+                raise ValueError(f"Unknown IMAGE_STORAGE {IMAGE_STORAGE!r}, expected one of {', '.join(BACKENDS)}")
+            _storage = BACKENDS[IMAGE_STORAGE]()
+        return _storage
@@ -0,0 +1,27 @@
+from mongo_utils import db, image_storage_stats
+
+def image_storage_report():
+    """Print how many bytes chunk deduplication saves in the image store"""
+    if db is None:
+        print("MongoDB connection not available")
+        return
+    try:
+        stats = image_storage_stats()
+    except Exception as e:
+        print(f"Error reading image storage stats: {str(e)}")
+        return
+
+    mib = 1024 * 1024
+    saved_share = stats["saved_bytes"] / stats["image_bytes"] if stats["image_bytes"] else 0
+    print(f"Images:          {stats['images']} ({stats['image_bytes'] / mib:.1f} MiB)")
+    print(f"Chunks stored:   {stats['chunks']} ({stats['stored_bytes'] / mib:.1f} MiB)")
+    print(f"Bytes saved:     {stats['saved_bytes'] / mib:.1f} MiB ({saved_share:.1%})")
+    if stats["referenced_bytes"] != stats["image_bytes"]:
+        print(f"Chunk references cover {stats['referenced_bytes'] / mib:.1f} MiB; "
+              f"some are left over from failed uploads")
+    if stats["legacy_images"]:
+        print(f"Not deduplicated: {stats['legacy_images']} older images in fs_chunks "
+              f"({stats['legacy_bytes'] / mib:.1f} MiB)")
+
+if __name__ == "__main__":
+    image_storage_report()
@@ -0,0 +1,148 @@
+"""
+Responsive variants of incident images.
+
+Each uploaded image gets a thumbnail and a medium size, re-encoded as WebP,
+so list and detail pages don't send multi-megabyte originals to phones. The
+variants are rendered in a process pool off the request path: the upload is
+stored as it comes in, its id is submitted to the pool, the worker reads
+the original back from the image store, and a done callback in the web
+process stores each variant. Only ids and the encoded variants cross the
+process boundary; the original is never pickled.
+
+A variant is an ordinary stored image whose metadata carries variant_of
+(the original's id) and variant (the size name). The original's document
+records them under variants.<size>, so the image route finds a
+variant with the lookup it already does for the original. Until a variant
+is stored the route serves the original.
+
+backfill_image_variants.py renders the variants of images uploaded before
+this.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from PIL import Image, ImageOps
+from werkzeug.datastructures import FileStorage
+from image_storage import get_image_storage
+
+logger = logging.getLogger(__name__)
+
+VARIANTS = {'thumb': 320, 'medium': 1024}  # size name -> longest edge in pixels
+VARIANT_FORMAT = 'WEBP'
+VARIANT_CONTENT_TYPE = 'image/webp'
+VARIANT_QUALITY = 80
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2))
+
+def render_variants(data):
+    """
+    Render every size in VARIANTS from the image bytes `data`.
+    Returns {size name: encoded bytes}. Runs in the pool's worker processes.
+    """
+    image = Image.open(BytesIO(data))
+    # Let JPEG decode straight at a reduced scale when the largest variant
+    # needs no more than that
+    image.draft('RGB', (max(VARIANTS.values()),) * 2)
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+
+    rendered = {}
+    # Largest first, each size scaled down from the one before
+    for name, edge in sorted(VARIANTS.items(), key=lambda item: item[1], reverse=True):
+        image.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+        output = BytesIO()
+        image.save(output, VARIANT_FORMAT, quality=VARIANT_QUALITY, method=4)
+        rendered[name] = output.getvalue()
+    return rendered
+
+def render_stored_variants(file_id):
+    """
+    Read image `file_id` from the image store and render its variants.
+    Returns (length of the original, {size name: encoded bytes}). Runs in
+    the pool's worker processes, which open the store configured by the
+    environment like the web process does.
+    """
+    return _render_original(_read_original(file_id))
+
+def _read_original(file_id):
+    storage = get_image_storage()
+    file_doc = storage.get_file(file_id)
+    if file_doc is None:
+        raise LookupError(f"Image {file_id} is not stored")
+    data = storage.read(file_doc)
+    if data is None:
+        raise IOError(f"Image {file_id} could not be read in full")
+    return data
+
+def _render_original(data):
+    return len(data), render_variants(data)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    """The process pool variants are rendered in, started on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn, not fork: the web process runs threads
+            _executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS,
+                                            mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+def store_variants(file_id, original_length, rendered):
+    """
+    Save rendered variants of image `file_id` and record them on its
+    document. A variant no smaller than the original points at the
+    original instead. Returns {size name: stored image id}.
+    """
+    storage = get_image_storage()
+    stored = {}
+    for name, data in rendered.items():
+        if len(data) >= original_length:
+            stored[name] = str(file_id)
+            continue
+        variant = FileStorage(BytesIO(data), filename=f"{file_id}-{name}.webp", content_type=VARIANT_CONTENT_TYPE)
+        variant_id = storage.save(variant, metadata={"variant_of": str(file_id), "variant": name})
+        if variant_id:
+            stored[name] = variant_id
+    if stored:
+        storage.set_variants(file_id, stored)
+    return stored
+
+def _variants_done(file_id, future):
+    try:
+        stored = store_variants(file_id, *future.result())
+        logger.info(f"Stored variants {sorted(stored)} of image {file_id}")
+    except Exception as e:
+        logger.error(f"Error rendering variants of image {file_id}: {str(e)}")
+
+def schedule_variants(file_id):
+    """
+    Render and store the variants of stored image `file_id` in the
+    background. Returns the pool's future, or None if the work could not be
+    submitted; the original is served meanwhile either way.
+    """
+    global _executor
+    executor = get_executor()
+    try:
+        if get_image_storage().in_process:
+            # The workers can't see a store held in this process, so the bytes go to them
+            future = executor.submit(_render_original, _read_original(file_id))
+        else:
+            future = executor.submit(render_stored_variants, file_id)
+    except BrokenProcessPool as e:
+        logger.error(f"Image worker pool is broken, restarting it: {str(e)}")
+        with _executor_lock:
+            if _executor is executor:
+                _executor = None
+        return None
+    except (LookupError, IOError) as e:
+        logger.error(f"Error rendering variants of image {file_id}: {str(e)}")
+        return None
+    future.add_done_callback(lambda done: _variants_done(file_id, done))
+    return future
@@ -0,0 +1,142 @@
+"""
+Bulk export of incidents and their status history.
+
+Rows are read through a server-side cursor (yield_per) as plain column
+tuples and written out as NDJSON or CSV a batch at a time, so memory use
+stays flat however many rows are exported. Used by the admin export
+endpoints and by export_data.py.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+from app import db
+from models import Incident, StatusUpdate, User
+from search_utils import search_condition
+
+BATCH_SIZE = 1000
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+def _apply_filters(stmt, status=None, priority=None, incident_type=None, search=None):
+    # Same filters as the admin incidents list; a search only selects rows
+    # here, the export stays in id order
+    if status:
+        stmt = stmt.where(Incident.status == status)
+    if priority:
+        stmt = stmt.where(Incident.priority == priority)
+    if incident_type:
+        stmt = stmt.where(Incident.incident_type == incident_type)
+    if search:
+        stmt = stmt.where(search_condition(search))
+    return stmt
+
+def incidents_statement(status=None, priority=None, incident_type=None, search=None):
+    """SELECT for the incident export, with reporter and team names joined in"""
+    reporter = aliased(User)
+    team = aliased(User)
+
+    stmt = select(
+        Incident.id,
+        Incident.title,
+        Incident.description,
+        Incident.incident_type,
+        Incident.priority,
+        Incident.status,
+        Incident.latitude,
+        Incident.longitude,
+        Incident.address,
+        Incident.reported_by,
+        reporter.username.label('reporter'),
+        Incident.assigned_team_id,
+        team.full_name.label('assigned_team'),
+        Incident.image_id,
+        Incident.created_at,
+        Incident.updated_at,
+        Incident.resolved_at
+    ).join(reporter, reporter.id == Incident.reported_by)\
+     .outerjoin(team, team.id == Incident.assigned_team_id)\
+     .order_by(Incident.id)
+
+    return _apply_filters(stmt, status, priority, incident_type, search)
+
+def status_updates_statement(status=None, priority=None, incident_type=None, search=None):
+    """SELECT for the status history export, limited to incidents matching the filters"""
+    updater = aliased(User)
+
+    stmt = select(
+        StatusUpdate.id,
+        StatusUpdate.incident_id,
+        StatusUpdate.old_status,
+        StatusUpdate.new_status,
+        StatusUpdate.notes,
+        StatusUpdate.updated_by,
+        updater.username.label('updated_by_username'),
+        StatusUpdate.created_at
+    ).join(updater, updater.id == StatusUpdate.updated_by)\
+     .order_by(StatusUpdate.id)
+
+    if status or priority or incident_type or search:
+        stmt = _apply_filters(stmt.join(Incident, Incident.id == StatusUpdate.incident_id),
+                              status, priority, incident_type, search)
+    return stmt
+
+EXPORTS = {
+    'incidents': incidents_statement,
+    'status_updates': status_updates_statement
+}
+
+def iter_batches(stmt, batch_size=BATCH_SIZE):
+    """Yield (column names, rows) a batch at a time from a streamed result"""
+    result = db.session.execute(stmt.execution_options(yield_per=batch_size))
+    columns = list(result.keys())
+    for batch in result.partitions():
+        yield columns, batch
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def write_ndjson(stmt, batch_size=BATCH_SIZE):
+    """Generate the export as newline delimited JSON, one chunk per batch"""
+    for columns, batch in iter_batches(stmt, batch_size):
+        yield ''.join(
+            json.dumps(dict(zip(columns, map(_json_value, row))), separators=(',', ':')) + '\n'
+            for row in batch
+        )
+
+def write_csv(stmt, batch_size=BATCH_SIZE):
+    """Generate the export as CSV with a header row, one chunk per batch"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    header_written = False
+
+    for columns, batch in iter_batches(stmt, batch_size):
+        if not header_written:
+            writer.writerow(columns)
+            header_written = True
+        writer.writerows([_csv_value(value) for value in row] for row in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if not header_written:
+        # Nothing matched; still send the header so the file is well formed
+        result = db.session.execute(stmt.limit(0))
+        writer.writerow(list(result.keys()))
+        yield buffer.getvalue()
+
+def export_chunks(export, fmt, status=None, priority=None, incident_type=None, search=None):
+    """Generate the chunks of an export: `export` is a key of EXPORTS, `fmt` a key of FORMATS"""
+    stmt = EXPORTS[export](status=status, priority=priority, incident_type=incident_type, search=search)
+    writer = write_csv if fmt == 'csv' else write_ndjson
+    return writer(stmt)
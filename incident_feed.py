@@ -0,0 +1,233 @@
+"""
+Map incident feed.
+
+Builds the /api/incidents payload with a single joined SELECT over just the
+columns the map needs. Rows come back as lightweight tuples instead of ORM
+instances, so there is no identity-map bookkeeping, no lazy loads and no
+per-incident team lookup.
+
+A snapshot is capped at `limit` incidents, newest first; when it is
+truncated, `next_page` is a keyset cursor that can be passed back as
+`after` for the next, older batch.
+
+Clients that already hold a snapshot can pass the `cursor` from their last
+response to receive only the incidents changed or deleted since then. The
+cursor is an (updated_at, id) watermark. Every response also carries an ETag
+derived from the newest change, so an unchanged poll costs three index
+lookups (see feed_version) and a 304. The same payloads can be sent column-oriented, see
+compact_payload.py.
+"""
+import hashlib
+from collections import namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy import and_, func, or_, select, tuple_
+from sqlalchemy.orm import aliased
+from app import db
+from models import DeletedIncident, Incident, User
+from geo_utils import covering_cells, geohash_range_filter
+from compact_payload import coordinate, encode_columns, epoch_seconds
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 2000
+
+# updated_at is stamped at flush time, so a transaction can commit after a
+# later-stamped one. Cursors never advance past now - SETTLE_SECONDS and
+# changes inside that window are sent again on the next poll; clients apply
+# them idempotently. Validators are not honoured until the newest change has
+# settled, for the same reason.
+SETTLE_SECONDS = 5
+
+EPOCH = datetime(1970, 1, 1)
+
+FeedVersion = namedtuple('FeedVersion', ['last_modified', 'token'])
+
+# Fields of the compact (columnar) feed; descriptions are fetched per incident
+COMPACT_FIELDS = ('id', 'title', 'incident_type', 'priority', 'status',
+                  'latitude', 'longitude', 'created_at', 'assigned_team')
+COMPACT_ENUMS = ('incident_type', 'priority', 'status')
+
+def feed_statement(bbox=None, types=None, statuses=None, priorities=None, include_description=True):
+    """
+    Build the SELECT for the map feed.
+
+    `bbox` is a (south, west, north, east) tuple as returned by
+    geo_utils.parse_bbox; the filters are lists of accepted values.
+    """
+    team = aliased(User)
+
+    columns = [Incident.id, Incident.title]
+    if include_description:
+        columns.append(Incident.description)
+    columns += [
+        Incident.incident_type,
+        Incident.priority,
+        Incident.status,
+        Incident.latitude,
+        Incident.longitude,
+        Incident.created_at,
+        team.full_name.label('assigned_team')
+    ]
+
+    stmt = select(*columns)\
+        .outerjoin(team, team.id == Incident.assigned_team_id)\
+        .where(Incident.geohash.isnot(None))
+
+    if bbox:
+        south, west, north, east = bbox
+        stmt = stmt.where(geohash_range_filter(Incident.geohash, covering_cells(south, west, north, east)))
+        stmt = stmt.where(Incident.latitude.between(south, north))
+        if west <= east:
+            stmt = stmt.where(Incident.longitude.between(west, east))
+        else:
+            stmt = stmt.where(or_(Incident.longitude >= west, Incident.longitude <= east))
+
+    if types:
+        stmt = stmt.where(Incident.incident_type.in_(types))
+    if statuses:
+        stmt = stmt.where(Incident.status.in_(statuses))
+    if priorities:
+        stmt = stmt.where(Incident.priority.in_(priorities))
+
+    return stmt
+
+def fetch_feed(stmt, limit=DEFAULT_LIMIT, after=None):
+    """
+    Run a feed statement newest first on (created_at, id), capped at `limit`
+    rows and starting below the `after` page cursor if given.
+    Returns (rows, truncated, next page cursor or None).
+    """
+    if after:
+        stmt = stmt.where(tuple_(Incident.created_at, Incident.id) < decode_cursor(after))
+    rows = db.session.execute(
+        stmt.order_by(Incident.created_at.desc(), Incident.id.desc()).limit(limit + 1)
+    ).all()
+    truncated = len(rows) > limit
+    rows = rows[:limit]
+    next_page = encode_cursor(rows[-1].created_at or EPOCH, rows[-1].id) if truncated else None
+    return rows, truncated, next_page
+
+def serialize_row(row):
+    """Convert a feed row tuple into the JSON shape the map scripts expect"""
+    return {
+        'id': row.id,
+        'title': row.title,
+        'description': row.description,
+        'incident_type': row.incident_type,
+        'priority': row.priority,
+        'status': row.status,
+        'latitude': row.latitude,
+        'longitude': row.longitude,
+        'created_at': row.created_at.isoformat() if row.created_at else None,
+        'assigned_team': row.assigned_team
+    }
+
+def encode_compact(rows):
+    """Encode feed rows (selected without descriptions) as columnar tables"""
+    return encode_columns(rows, COMPACT_FIELDS, COMPACT_ENUMS, {
+        'latitude': coordinate,
+        'longitude': coordinate,
+        'created_at': epoch_seconds
+    })
+
+def encode_cursor(timestamp, incident_id):
+    """Encode an (updated_at, id) watermark as an opaque string"""
+    return f"{(timestamp - EPOCH) // timedelta(microseconds=1)}:{incident_id}"
+
+def decode_cursor(cursor):
+    """Decode a cursor string. Raises ValueError if it is malformed."""
+    micros, incident_id = cursor.split(':')
+    return EPOCH + timedelta(microseconds=int(micros)), int(incident_id)
+
+def settle_point():
+    """Return the newest watermark that is safe to hand out"""
+    return datetime.utcnow() - timedelta(seconds=SETTLE_SECONDS)
+
+def feed_version():
+    """
+    Return the feed's current FeedVersion. Each aggregate is its own query
+    so it is answered from the end of one index (updated_at, the tombstone
+    primary key, deleted_at), not a row scan.
+    """
+    last_updated = db.session.query(func.max(Incident.updated_at)).scalar()
+    last_deleted_id = db.session.query(func.max(DeletedIncident.id)).scalar()
+    last_deleted_at = db.session.query(func.max(DeletedIncident.deleted_at)).scalar()
+
+    last_modified = max([t for t in (last_updated, last_deleted_at) if t is not None], default=EPOCH)
+    token = f"{last_updated.isoformat() if last_updated else ''}/{last_deleted_id or 0}"
+    return FeedVersion(last_modified, token)
+
+def feed_etag(version, query_string, variant=None):
+    """
+    Build a strong ETag for a feed response from the data version, request
+    parameters and negotiated encoding
+    """
+    digest = hashlib.sha1(version.token.encode())
+    digest.update(query_string)
+    if variant:
+        digest.update(f"|{variant}".encode())
+    return digest.hexdigest()
+
+def is_settled(version):
+    """True if the newest change is old enough for validators to be trusted"""
+    return version.last_modified <= settle_point()
+
+def initial_cursor(version):
+    """Cursor handed out with a full snapshot"""
+    return encode_cursor(min(version.last_modified, settle_point()), 0)
+
+def fetch_changes(stmt, cursor, limit=DEFAULT_LIMIT):
+    """
+    Return the rows of `stmt` changed after `cursor` in watermark order, the
+    ids of incidents deleted since, the next cursor, and whether more
+    changed rows remain.
+    """
+    since, since_id = decode_cursor(cursor)
+
+    rows = db.session.execute(
+        stmt.add_columns(Incident.updated_at)
+            .where(or_(Incident.updated_at > since,
+                       and_(Incident.updated_at == since, Incident.id > since_id)))
+            .order_by(Incident.updated_at, Incident.id)
+            .limit(limit + 1)
+    ).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    settled = (settle_point(), 0)
+    next_key = (since, since_id)
+    if rows:
+        last_key = (rows[-1].updated_at, rows[-1].id)
+        if last_key > settled:
+            # Paging stops at the settle point too: a row stamped before the
+            # end of this page may still commit. The rest comes with the next poll.
+            last_key, has_more = settled, False
+        next_key = max(next_key, last_key)
+
+    # While more pages follow, each page carries the tombstones up to its own
+    # end, so none is sent twice
+    tombstones_stmt = select(DeletedIncident.incident_id, DeletedIncident.deleted_at)\
+        .where(DeletedIncident.deleted_at > since)
+    if has_more:
+        tombstones_stmt = tombstones_stmt.where(DeletedIncident.deleted_at <= next_key[0])
+    tombstones = db.session.execute(tombstones_stmt).all()
+
+    if tombstones and not has_more:
+        last_deleted = max(tombstone.deleted_at for tombstone in tombstones)
+        next_key = max(next_key, (min(last_deleted, settled[0]), 0))
+
+    deleted_ids = [tombstone.incident_id for tombstone in tombstones]
+    return rows, deleted_ids, encode_cursor(*next_key), has_more
+
+def row_matches(row, types=None, statuses=None, priorities=None):
+    """Check a feed row against the attribute filters"""
+    return ((not types or row.incident_type in types) and
+            (not statuses or row.status in statuses) and
+            (not priorities or row.priority in priorities))
+
+def parse_list_arg(args, name):
+    """Read a comma separated query string argument as a list"""
+    return [value for value in args.get(name, '').split(',') if value]
+
+def parse_limit_arg(args):
+    """Read the `limit` query string argument, clamped to the allowed range"""
+    return min(max(args.get('limit', DEFAULT_LIMIT, type=int), 1), MAX_LIMIT)
@@ -1,10 +1,16 @@
 from app import db
 from flask_login import UserMixin
 from datetime import datetime
-from sqlalchemy import event
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.base import NO_VALUE
+from geo_utils import encode_geohash
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
+    __table_args__ = (
+        db.Index('ix_users_created_at_id', 'created_at', 'id'),  # keyset pagination, see pagination_utils.py
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), unique=True, nullable=False, index=True)
@@ -14,9 +20,11 @@ class User(UserMixin, db.Model):
     full_name = db.Column(db.String(100), nullable=False)
     phone = db.Column(db.String(20))
     address = db.Column(db.Text)
+    latitude = db.Column(db.Float)  # last known position, used to dispatch rescue teams
+    longitude = db.Column(db.Float)
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     # Relationships
     reported_incidents = db.relationship('Incident', foreign_keys='Incident.reported_by', backref='reporter', lazy='dynamic')
@@ -34,8 +42,21 @@ class User(UserMixin, db.Model):
     def is_user(self):
         return self.role == 'user'
 
+UNASSIGNED_OPEN = "assigned_team_id IS NULL AND status IN ('pending', 'in_progress')"
+
 class Incident(db.Model):
     __tablename__ = 'incidents'
+    __table_args__ = (
+        db.Index('ix_incidents_created_at_id', 'created_at', 'id'),  # keyset pagination, see pagination_utils.py
+        # Filtered lists, newest first
+        db.Index('ix_incidents_status_created_at', 'status', 'created_at', 'id'),
+        db.Index('ix_incidents_status_priority_created_at', 'status', 'priority', 'created_at', 'id'),
+        db.Index('ix_incidents_team_created_at', 'assigned_team_id', 'created_at', 'id'),
+        db.Index('ix_incidents_reporter_created_at', 'reported_by', 'created_at', 'id'),
+        # The open incidents no team has taken yet (rescue dashboard); partial where supported
+        db.Index('ix_incidents_unassigned_open', 'created_at',
+                 postgresql_where=db.text(UNASSIGNED_OPEN), sqlite_where=db.text(UNASSIGNED_OPEN)),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -48,6 +69,7 @@ class Incident(db.Model):
     latitude = db.Column(db.Float)
     longitude = db.Column(db.Float)
     address = db.Column(db.Text)
+    geohash = db.Column(db.String(12), index=True)  # Spatial index key, kept in sync with latitude/longitude
     
     # File upload - MongoDB image ID
     image_id = db.Column(db.String(24))
@@ -55,7 +77,7 @@ class Incident(db.Model):
     
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     resolved_at = db.Column(db.DateTime)
     
     # Foreign keys
@@ -89,6 +111,9 @@ class Incident(db.Model):
 
 class Resource(db.Model):
     __tablename__ = 'resources'
+    __table_args__ = (
+        db.Index('ix_resources_created_at_id', 'created_at', 'id'),  # keyset pagination, see pagination_utils.py
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -96,8 +121,11 @@ class Resource(db.Model):
     description = db.Column(db.Text)
     availability_status = db.Column(db.String(20), nullable=False, default='available')  # available, in_use, maintenance
     location = db.Column(db.String(200))
+    latitude = db.Column(db.Float)  # geocoded from location when the resource is saved
+    longitude = db.Column(db.Float)
+    geohash = db.Column(db.String(12), index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     # Relationships
     incident_assignments = db.relationship('IncidentResource', backref='resource', lazy='dynamic')
@@ -115,6 +143,9 @@ class Resource(db.Model):
 
 class IncidentResource(db.Model):
     __tablename__ = 'incident_resources'
+    __table_args__ = (
+        db.Index('ix_incident_resources_assignment', 'incident_id', 'resource_id', 'released_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     incident_id = db.Column(db.Integer, db.ForeignKey('incidents.id'), nullable=False)
@@ -128,6 +159,9 @@ class IncidentResource(db.Model):
 
 class StatusUpdate(db.Model):
     __tablename__ = 'status_updates'
+    __table_args__ = (
+        db.Index('ix_status_updates_incident_created_at', 'incident_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     incident_id = db.Column(db.Integer, db.ForeignKey('incidents.id'), nullable=False)
@@ -143,10 +177,214 @@ class StatusUpdate(db.Model):
     def __repr__(self):
         return f'<StatusUpdate {self.incident_id}: {self.old_status} -> {self.new_status}>'
 
+class IncidentClusterCell(db.Model):
+    __tablename__ = 'incident_cluster_cells'
+    
+    # Pre-aggregated incident counts per geohash cell, one set of rows per
+    # cluster precision, maintained incrementally as incidents are written
+    precision = db.Column(db.Integer, primary_key=True)
+    cell = db.Column(db.String(12), primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    priority = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    latitude_sum = db.Column(db.Float, nullable=False, default=0.0)
+    longitude_sum = db.Column(db.Float, nullable=False, default=0.0)
+    
+    def __repr__(self):
+        return f'<IncidentClusterCell {self.precision}:{self.cell} {self.status}/{self.priority}>'
+
+class IncidentCounter(db.Model):
+    __tablename__ = 'incident_counters'
+    
+    # Incident counts per reporter and per assigned team by status, maintained
+    # incrementally as incidents are written; read by the user and rescue
+    # team dashboards
+    owner_type = db.Column(db.String(20), primary_key=True)  # reporter, team
+    owner_id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<IncidentCounter {self.owner_type}:{self.owner_id} {self.status}>'
+
+class IncidentRollup(db.Model):
+    __tablename__ = 'incident_rollups'
+    
+    # Incident counts per creation hour or day by type, priority and status.
+    # Writes update hourly rows; compaction folds old hours into daily rows
+    granularity = db.Column(db.String(10), primary_key=True)  # hour, day
+    bucket = db.Column(db.DateTime, primary_key=True)
+    incident_type = db.Column(db.String(50), primary_key=True)
+    priority = db.Column(db.String(20), primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<IncidentRollup {self.granularity}:{self.bucket} {self.incident_type}/{self.priority}/{self.status}>'
+
+class ChangeEvent(db.Model):
+    __tablename__ = 'change_events'
+    
+    # Append-only log of changes pushed to connected clients; shared by all
+    # app processes so every worker can stream every change
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(40), nullable=False)  # incident_created, incident_status, incident_assigned, ...
+    incident_id = db.Column(db.Integer)
+    resource_id = db.Column(db.Integer)
+    team_id = db.Column(db.Integer)
+    reporter_id = db.Column(db.Integer)
+    payload = db.Column(db.Text)  # JSON with event specific details
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<ChangeEvent {self.id} {self.kind}>'
+
+class DeletedIncident(db.Model):
+    __tablename__ = 'deleted_incidents'
+    
+    # Tombstones let map clients syncing by updated_at learn about deletions
+    id = db.Column(db.Integer, primary_key=True)
+    incident_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<DeletedIncident {self.incident_id}>'
+
 # Event listeners to update incident resolved_at timestamp
 @event.listens_for(Incident.status, 'set')
 def incident_status_changed(target, value, oldvalue, initiator):
     if value == 'resolved' and oldvalue != 'resolved':
         target.resolved_at = datetime.utcnow()
     elif value != 'resolved' and oldvalue == 'resolved':
-        target.resolved_at = None
\ No newline at end of file
+        target.resolved_at = None
+
+# Event listeners to keep the incident geohash in sync with its coordinates
+@event.listens_for(Incident, 'before_insert')
+@event.listens_for(Incident, 'before_update')
+def incident_geohash_sync(mapper, connection, target):
+    if target.latitude is not None and target.longitude is not None:
+        target.geohash = encode_geohash(target.latitude, target.longitude)
+    else:
+        target.geohash = None
+
+# Same for resources, whose coordinates are geocoded from their location
+@event.listens_for(Resource, 'before_insert')
+@event.listens_for(Resource, 'before_update')
+def resource_geohash_sync(mapper, connection, target):
+    if target.latitude is not None and target.longitude is not None:
+        target.geohash = encode_geohash(target.latitude, target.longitude)
+    else:
+        target.geohash = None
+
+# Event listener to record a tombstone in the same transaction as an incident delete
+@event.listens_for(Incident, 'after_delete')
+def incident_deleted(mapper, connection, target):
+    connection.execute(DeletedIncident.__table__.insert().values(
+        incident_id=target.id,
+        deleted_at=datetime.utcnow()
+    ))
+
+# Incident change tracking
+#
+# Derived tables (cluster cells, counters, rollups) are kept up to date in the
+# same transaction as the incident write. Handlers registered here are called
+# after each flush with snapshots of the tracked fields before and after the
+# change; `before` is None for inserts and `after` is None for deletes.
+INCIDENT_TRACKED_FIELDS = ('id', 'status', 'priority', 'incident_type', 'latitude', 'longitude',
+                           'geohash', 'reported_by', 'assigned_team_id', 'created_at')
+
+incident_change_handlers = []
+
+def register_incident_change_handler(handler):
+    """Register handler(connection, before, after) to run after incident flushes"""
+    incident_change_handlers.append(handler)
+    return handler
+
+def _incident_snapshot(incident):
+    return {key: getattr(incident, key) for key in INCIDENT_TRACKED_FIELDS}
+
+def _incident_committed_snapshot(session, incident):
+    """Return the tracked fields as they are in the database, before this flush"""
+    state = inspect(incident)
+    snapshot = {}
+    missing = []
+    for key in INCIDENT_TRACKED_FIELDS:
+        if key in state.committed_state:
+            value = state.committed_state[key]
+        else:
+            value = state.dict.get(key, NO_VALUE)
+        if value is NO_VALUE:
+            missing.append(key)
+        else:
+            snapshot[key] = value
+    
+    # Old values of expired attributes were never loaded; read them now,
+    # before the flush overwrites the row
+    if missing:
+        columns = [Incident.__table__.c[key] for key in missing]
+        row = session.connection().execute(
+            select(*columns).where(Incident.__table__.c.id == state.identity[0])
+        ).one()
+        snapshot.update(zip(missing, row))
+    return snapshot
+
+@event.listens_for(Session, 'before_flush')
+def capture_incident_changes(session, flush_context, instances):
+    if not incident_change_handlers:
+        return
+    # Start afresh every flush: a list left by a flush that failed must not
+    # be applied by the next one
+    changes = session.info['incident_changes'] = []
+    for obj in session.new:
+        if isinstance(obj, Incident):
+            changes.append((None, obj))
+    for obj in session.dirty:
+        if isinstance(obj, Incident) and session.is_modified(obj, include_collections=False):
+            changes.append((_incident_committed_snapshot(session, obj), obj))
+    for obj in session.deleted:
+        if isinstance(obj, Incident):
+            changes.append((_incident_committed_snapshot(session, obj), None))
+
+@event.listens_for(Session, 'after_flush')
+def apply_incident_changes(session, flush_context):
+    changes = session.info.pop('incident_changes', None)
+    if not changes:
+        return
+    connection = session.connection()
+    for before, obj in changes:
+        after = _incident_snapshot(obj) if obj is not None else None
+        for handler in incident_change_handlers:
+            handler(connection, before, after)
+
+@event.listens_for(Session, 'after_rollback')
+@event.listens_for(Session, 'after_soft_rollback')
+def discard_incident_changes(session, *args):
+    session.info.pop('incident_changes', None)
+
+def increment_counters(connection, table, key, deltas):
+    """
+    Add `deltas` to the counter columns of the row identified by `key`,
+    inserting the row if it does not exist yet. Uses a native upsert on
+    PostgreSQL and SQLite so concurrent writers cannot collide on insert.
+    """
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table).values(**key, **deltas)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(key),
+            set_={column: table.c[column] + stmt.excluded[column] for column in deltas}
+        )
+        connection.execute(stmt)
+        return
+    
+    result = connection.execute(
+        table.update()
+        .where(*[table.c[column] == value for column, value in key.items()])
+        .values({column: table.c[column] + delta for column, delta in deltas.items()})
+    )
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(**key, **deltas))
@@ -1,7 +1,11 @@
 import os
 import base64
+import hashlib
+from collections import Counter
+from datetime import datetime
 from io import BytesIO
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
+from bson.errors import InvalidId
 from bson.objectid import ObjectId
 from dotenv import load_dotenv
 from werkzeug.utils import secure_filename
@@ -14,62 +18,144 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+CHUNK_SIZE = 261120  # bytes per chunk document, as GridFS uses
+INSERT_BATCH = 16  # chunks per bulk write, about 4 MB
+
+# Image data lives in content_chunks, one document per distinct chunk keyed
+# by the SHA-256 of its bytes and counting the images that use it. An
+# fs_files document lists its chunk hashes in order, so an image uploaded
+# again, or sharing chunks with another, adds references rather than bytes.
+# Images stored before this keep their chunks in fs_chunks under files_id.
+
 # MongoDB connection
 try:
     client = MongoClient(os.getenv('MONGODB_URI'))
     db = client.get_database()
     fs_files = db.fs_files
     fs_chunks = db.fs_chunks
+    content_chunks = db.content_chunks
     logger.info("MongoDB connection established")
 except Exception as e:
     logger.error(f"MongoDB connection error: {str(e)}")
     db = None
 
-def save_image(file, incident_id=None):
+def _read_chunk(stream, size):
+    """Read up to `size` bytes, fewer only at the end of the stream"""
+    parts = []
+    remaining = size
+    while remaining:
+        data = stream.read(remaining)
+        if not data:
+            break
+        parts.append(data)
+        remaining -= len(data)
+    return b''.join(parts)
+
+def _add_chunk_refs(chunks):
+    """
+    Add a reference to each (hash, data) chunk, storing the ones not stored
+    yet. Returns the number of bytes newly stored.
+    """
+    counts = Counter(digest for digest, _ in chunks)
+    sizes = {digest: len(data) for digest, data in chunks}
+    data_by_digest = dict(chunks)
+    digests = list(counts)
+    # An upsert per hash is atomic, so concurrent uploads of the same chunk
+    # end up with one document and both references
+    result = content_chunks.bulk_write([
+        UpdateOne({"_id": digest},
+                  {"$inc": {"refs": counts[digest]},
+                   "$setOnInsert": {"data": data_by_digest[digest], "size": sizes[digest]}},
+                  upsert=True)
+        for digest in digests
+    ], ordered=False)
+    return sum(sizes[digests[index]] for index in result.upserted_ids)
+
+def _release_chunk_refs(digests):
+    """Drop one reference per entry of `digests`, removing chunks no image uses any more"""
+    counts = Counter(digests)
+    if not counts:
+        return
+    content_chunks.bulk_write([UpdateOne({"_id": digest}, {"$inc": {"refs": -count}})
+                               for digest, count in counts.items()], ordered=False)
+    content_chunks.delete_many({"_id": {"$in": list(counts)}, "refs": {"$lte": 0}})
+
+def save_image(file, incident_id=None, metadata=None):
     """
     Save an image to MongoDB
     Returns the MongoDB ObjectId of the saved file
+    `metadata` is merged into the fs_files metadata.
+    
+    The upload is read one chunk at a time, each chunk is hashed as it is
+    read, and the chunks are written to content_chunks in batches of
+    INSERT_BATCH; chunks already stored only gain a reference. The fs_files
+    document, with the chunk hashes, length and checksums, is written last:
+    readers look up fs_files first, so a failed upload never shows up as a
+    partial image.
     """
     if db is None:
         logger.error("MongoDB connection not available")
         return None
     
+    file_id = ObjectId()
+    digests = []  # hashes of the chunks referenced so far
     try:
-        # Read file data
         filename = secure_filename(file.filename)
-        file_data = file.read()
         content_type = file.content_type
+        stream = getattr(file, 'stream', file)
+        
+        md5 = hashlib.md5()
+        sha256 = hashlib.sha256()
+        length = 0
+        stored = 0
+        batch = []
+        while True:
+            chunk_data = _read_chunk(stream, CHUNK_SIZE)
+            if not chunk_data:
+                break
+            md5.update(chunk_data)
+            sha256.update(chunk_data)
+            length += len(chunk_data)
+            batch.append((hashlib.sha256(chunk_data).hexdigest(), chunk_data))
+            # A batch that fails part way can leave references behind; that
+            # only keeps chunks stored longer, never frees one in use
+            if len(batch) >= INSERT_BATCH:
+                stored += _add_chunk_refs(batch)
+                digests.extend(digest for digest, _ in batch)
+                batch = []
+        if batch:
+            stored += _add_chunk_refs(batch)
+            digests.extend(digest for digest, _ in batch)
         
         # Create metadata
         metadata = {
             "filename": filename,
             "contentType": content_type,
-            "incident_id": str(incident_id) if incident_id else None
+            "incident_id": str(incident_id) if incident_id else None,
+            **(metadata or {})
         }
         
-        # Insert file data
-        file_id = fs_files.insert_one({
+        fs_files.insert_one({
+            "_id": file_id,
             "filename": filename,
-            "length": len(file_data),
-            "chunkSize": 261120,
+            "length": length,
+            "chunkSize": CHUNK_SIZE,
+            "chunks": digests,
+            "uploadDate": datetime.utcnow(),
+            "md5": md5.hexdigest(),
+            "sha256": sha256.hexdigest(),
             "metadata": metadata
-        }).inserted_id
+        })
         
-        # Insert file chunks
-        chunk_size = 261120
-        for i in range(0, len(file_data), chunk_size):
-            chunk_data = file_data[i:i+chunk_size]
-            fs_chunks.insert_one({
-                "files_id": file_id,
-                "n": i // chunk_size,
-                "data": chunk_data
-            })
-        
-        logger.info(f"Image saved to MongoDB with ID: {file_id}")
+        logger.info(f"Image saved to MongoDB with ID: {file_id} ({length - stored} of {length} bytes deduplicated)")
         return str(file_id)
     
     except Exception as e:
         logger.error(f"Error saving image to MongoDB: {str(e)}")
+        try:
+            _release_chunk_refs(digests)
+        except Exception as cleanup_error:
+            logger.error(f"Error releasing chunks of failed upload {file_id}: {str(cleanup_error)}")
         return None
 
 def get_image(file_id):
@@ -92,15 +178,20 @@ def get_image(file_id):
         content_type = file_doc.get("metadata", {}).get("contentType", "image/jpeg")
         
         # Get file chunks
-        chunks = list(fs_chunks.find({"files_id": ObjectId(file_id)}).sort("n", 1))
+        if "chunks" in file_doc:
+            stored = {chunk["_id"]: chunk["data"]
+                      for chunk in content_chunks.find({"_id": {"$in": list(set(file_doc["chunks"]))}})}
+            chunks = [stored[digest] for digest in file_doc["chunks"] if digest in stored]
+            if len(chunks) < len(file_doc["chunks"]):
+                chunks = []
+        else:
+            chunks = [chunk["data"] for chunk in fs_chunks.find({"files_id": ObjectId(file_id)}).sort("n", 1)]
         if not chunks:
             logger.warning(f"No chunks found for image with ID {file_id}")
             return None, None
         
-        # Combine chunks
-        file_data = b''
-        for chunk in chunks:
-            file_data += chunk["data"]
+        # Combine chunks in one copy
+        file_data = b''.join(chunks)
         
         logger.info(f"Image retrieved from MongoDB with ID: {file_id}")
         return file_data, content_type
@@ -109,6 +200,97 @@ def get_image(file_id):
         logger.error(f"Error retrieving image from MongoDB: {str(e)}")
         return None, None
 
+def get_image_file(file_id):
+    """
+    Get an image's fs_files document, or None if there is no such image.
+    Use with iter_image_chunks to stream the image.
+    """
+    if db is None:
+        logger.error("MongoDB connection not available")
+        return None
+    
+    try:
+        return fs_files.find_one({"_id": ObjectId(file_id)})
+    except InvalidId:
+        return None
+    except Exception as e:
+        logger.error(f"Error retrieving image from MongoDB: {str(e)}")
+        return None
+
+def iter_image_chunks(file_doc, start=0, stop=None):
+    """
+    Yield bytes [start, stop) of an image as they come off the chunk cursor.
+    Only the chunks overlapping the range are fetched, one at a time, so at
+    most about one chunk is held in memory.
+    """
+    length = file_doc["length"]
+    stop = length if stop is None else min(stop, length)
+    if start >= stop:
+        return
+    chunk_size = file_doc.get("chunkSize", CHUNK_SIZE)
+    first, last = start // chunk_size, (stop - 1) // chunk_size
+    
+    if "chunks" in file_doc:
+        for n, digest in enumerate(file_doc["chunks"][first:last + 1], first):
+            chunk = content_chunks.find_one({"_id": digest}, {"data": 1})
+            if chunk is None:
+                logger.error(f"Image {file_doc['_id']} is missing chunk {n}")
+                return
+            offset = n * chunk_size
+            yield chunk["data"][max(start - offset, 0):stop - offset]
+        return
+    
+    cursor = fs_chunks.find(
+        {"files_id": file_doc["_id"], "n": {"$gte": first, "$lte": last}}
+    ).sort("n", 1).batch_size(1)
+    expected = first
+    try:
+        for chunk in cursor:
+            if chunk["n"] != expected:
+                logger.error(f"Image {file_doc['_id']} is missing chunk {expected}")
+                return
+            offset = chunk["n"] * chunk_size
+            data = chunk["data"]
+            yield data[max(start - offset, 0):stop - offset]
+            expected += 1
+    finally:
+        cursor.close()
+    if expected <= last:
+        logger.error(f"Image {file_doc['_id']} is missing chunk {expected}")
+
+def read_image(file_doc):
+    """All the bytes of the image `file_doc`, or None if any chunk is missing"""
+    data = b''.join(iter_image_chunks(file_doc))
+    return data if len(data) == file_doc["length"] else None
+
+def image_storage_stats():
+    """
+    How much chunk deduplication saves: the bytes of every image stored
+    through content_chunks against the bytes of the distinct chunks holding
+    them. Images still in the fs_chunks layout are counted separately.
+    """
+    def total(collection, match, field):
+        result = list(collection.aggregate([
+            {"$match": match},
+            {"$group": {"_id": None, "count": {"$sum": 1}, "bytes": {"$sum": field}}}
+        ]))
+        return (result[0]["count"], result[0]["bytes"]) if result else (0, 0)
+    
+    images, image_bytes = total(fs_files, {"chunks": {"$exists": True}}, "$length")
+    chunks, stored_bytes = total(content_chunks, {}, "$size")
+    _, referenced_bytes = total(content_chunks, {}, {"$multiply": ["$size", "$refs"]})
+    legacy_images, legacy_bytes = total(fs_files, {"chunks": {"$exists": False}}, "$length")
+    return {
+        "images": images,
+        "image_bytes": image_bytes,
+        "chunks": chunks,
+        "stored_bytes": stored_bytes,
+        "saved_bytes": image_bytes - stored_bytes,
+        "referenced_bytes": referenced_bytes,  # equals image_bytes unless references leaked
+        "legacy_images": legacy_images,
+        "legacy_bytes": legacy_bytes
+    }
+
 def get_image_base64(file_id):
     """
     Get image as base64 string for embedding in HTML
@@ -128,9 +310,19 @@ def delete_image(file_id):
         return False
     
     try:
-        # Delete file metadata and chunks
-        fs_files.delete_one({"_id": ObjectId(file_id)})
-        fs_chunks.delete_many({"files_id": ObjectId(file_id)})
+        # Delete file metadata, with that of the image's variants, then drop
+        # their chunk references; a chunk goes with its last reference
+        file_doc = fs_files.find_one({"_id": ObjectId(file_id)}, {"variants": 1}) or {}
+        file_ids = [ObjectId(file_id)] + [ObjectId(variant_id) for variant_id in
+                                          set(file_doc.get("variants", {}).values()) if variant_id != str(file_id)]
+        digests = []
+        for deleted_id in file_ids:
+            # Only the delete that removed the document releases its chunks
+            deleted = fs_files.find_one_and_delete({"_id": deleted_id}, {"chunks": 1})
+            if deleted:
+                digests.extend(deleted.get("chunks", []))
+        _release_chunk_refs(digests)
+        fs_chunks.delete_many({"files_id": {"$in": file_ids}})
         logger.info(f"Image deleted from MongoDB with ID: {file_id}")
         return True
     
@@ -0,0 +1,233 @@
+"""
+Nearest available resources and rescue teams for dispatch.
+
+Candidate positions are held per process in a grid index: points bucketed
+into fixed-size latitude/longitude cells. A query searches rings of cells
+outward from the incident until no unsearched cell can hold anything
+closer than the k-th best match, so it only looks at points near the
+incident.
+
+Each index follows its table incrementally: before a lookup it compares
+max(updated_at) with the last value it saw (an index lookup) and re-reads
+only the rows changed since. Availability changes and position updates
+both bump updated_at. Deleted rows can't be seen that way, so matches are
+confirmed against the database before they are returned.
+"""
+import math
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from sqlalchemy import func, select
+from app import db
+from models import Resource, User
+
+EARTH_RADIUS_KM = 6371.0088
+CELL_DEGREES = 0.05  # about 5.5 km of latitude per cell
+MAX_RINGS = 40  # beyond this the search falls back to a full scan
+
+# updated_at is stamped at flush time, so a row can commit after a later
+# stamped one; rows stamped within this window are re-read on every refresh
+SETTLE_SECONDS = 5
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points in kilometres"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+class GridIndex:
+    """In-memory k-nearest-neighbour index over points on the globe"""
+
+    def __init__(self, cell_degrees=CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self.rows = int(math.ceil(180 / cell_degrees))
+        self.columns = int(math.ceil(360 / cell_degrees))
+        self.cells = {}  # (row, column) -> {id: (lat, lng)}
+        self.positions = {}  # id -> (row, column)
+
+    def _cell(self, lat, lng):
+        row = min(int((lat + 90) / self.cell_degrees), self.rows - 1)
+        column = int((lng + 180) / self.cell_degrees) % self.columns
+        return row, column
+
+    def __len__(self):
+        return len(self.positions)
+
+    def upsert(self, key, lat, lng):
+        self.remove(key)
+        cell = self._cell(lat, lng)
+        self.cells.setdefault(cell, {})[key] = (lat, lng)
+        self.positions[key] = cell
+
+    def remove(self, key):
+        cell = self.positions.pop(key, None)
+        if cell is not None:
+            bucket = self.cells[cell]
+            del bucket[key]
+            if not bucket:
+                del self.cells[cell]
+
+    def _ring(self, row, column, radius):
+        """Cells at Chebyshev distance `radius` from (row, column)"""
+        if radius == 0:
+            yield row, column
+            return
+        for r in range(row - radius, row + radius + 1):
+            if not 0 <= r < self.rows:
+                continue
+            if r in (row - radius, row + radius):
+                cols = range(column - radius, column + radius + 1)
+            else:
+                cols = (column - radius, column + radius)
+            for c in cols:
+                yield r, c % self.columns
+
+    def _ring_min_distance(self, lat, radius):
+        """Lower bound on the distance to any point in a ring `radius` cells out"""
+        if radius <= 1:
+            return 0.0
+        # Points in the ring are at least radius - 1 cells away in latitude or
+        # longitude; a longitude gap is shortest at the highest latitude reached
+        gap = math.radians((radius - 1) * self.cell_degrees)
+        highest = math.radians(min(90.0, abs(lat) + (radius + 1) * self.cell_degrees))
+        latitude_bound = EARTH_RADIUS_KM * gap
+        longitude_bound = 2 * EARTH_RADIUS_KM * math.asin(math.cos(highest) * math.sin(min(gap, math.pi) / 2))
+        return min(latitude_bound, longitude_bound)
+
+    def nearest(self, lat, lng, k):
+        """Return up to `k` (distance_km, id) pairs, closest first"""
+        if k <= 0 or not self.positions:
+            return []
+
+        row, column = self._cell(lat, lng)
+        found = []
+        searched = 0
+        for radius in range(MAX_RINGS + 1):
+            if len(found) >= k and self._ring_min_distance(lat, radius) > found[k - 1][0]:
+                return found[:k]
+            for cell in set(self._ring(row, column, radius)):
+                bucket = self.cells.get(cell)
+                if bucket:
+                    searched += len(bucket)
+                    found.extend((haversine_km(lat, lng, plat, plng), key) for key, (plat, plng) in bucket.items())
+            found.sort()
+            del found[k:]
+            if searched == len(self.positions):
+                return found
+
+        # Sparse data far from the query: measure every point
+        found = [(haversine_km(lat, lng, plat, plng), key)
+                 for bucket in self.cells.values() for key, (plat, plng) in bucket.items()]
+        found.sort()
+        return found[:k]
+
+class TableIndex(ABC):
+    """
+    A GridIndex that follows one table. Subclasses provide the statement
+    reading positions and the check that confirms matches; `candidates`
+    decides which rows belong in the index.
+    """
+
+    def __init__(self, model, candidates):
+        self.model = model
+        self.candidates = candidates
+        self.grid = GridIndex()
+        self.synced_to = None  # newest updated_at applied
+        self.read_at = None  # when the table was last read
+        self.lock = threading.Lock()
+
+    def _is_candidate(self, row):
+        return row.latitude is not None and row.longitude is not None and self.candidates(row)
+
+    def refresh(self):
+        """Apply rows changed since the last refresh"""
+        model = self.model
+        settle = timedelta(seconds=SETTLE_SECONDS)
+        newest = db.session.query(func.max(model.updated_at)).scalar()
+        with self.lock:
+            # Nothing new, and the last read came after every row stamped up
+            # to synced_to had time to commit
+            if newest is None or (self.synced_to is not None and newest <= self.synced_to
+                                  and self.read_at - settle > self.synced_to):
+                return
+
+            stmt = self.statement()
+            if self.synced_to is not None:
+                stmt = stmt.where(model.updated_at >= self.synced_to - settle)
+            read_at = datetime.utcnow()
+            for row in db.session.execute(stmt):
+                if self._is_candidate(row):
+                    self.grid.upsert(row.id, row.latitude, row.longitude)
+                else:
+                    self.grid.remove(row.id)
+            self.synced_to = newest
+            self.read_at = read_at
+
+    @abstractmethod
+    def statement(self):
+        """SELECT of id, latitude, longitude and the columns `candidates` reads"""
+
+    @abstractmethod
+    def confirm(self, ids):
+        """Return the subset of `ids` that are still candidates in the database"""
+
+    def nearest(self, lat, lng, k):
+        """Return up to `k` (distance_km, id) pairs for the closest current candidates"""
+        self.refresh()
+        while True:
+            with self.lock:
+                matches = self.grid.nearest(lat, lng, k)
+            if not matches:
+                return []
+            valid = self.confirm([key for _, key in matches])
+            stale = [key for _, key in matches if key not in valid]
+            if not stale:
+                return matches
+            # Deleted rows leave no updated_at trace; drop them and search again
+            with self.lock:
+                for key in stale:
+                    self.grid.remove(key)
+
+class ResourceIndex(TableIndex):
+    def __init__(self):
+        super().__init__(Resource, lambda row: row.availability_status == 'available')
+
+    def statement(self):
+        return select(Resource.id, Resource.latitude, Resource.longitude,
+                      Resource.availability_status, Resource.updated_at)
+
+    def confirm(self, ids):
+        return set(db.session.execute(
+            select(Resource.id).where(Resource.id.in_(ids), Resource.availability_status == 'available')
+        ).scalars())
+
+class TeamIndex(TableIndex):
+    def __init__(self):
+        super().__init__(User, lambda row: row.role == 'rescue_team' and row.is_active)
+
+    def statement(self):
+        return select(User.id, User.latitude, User.longitude, User.role, User.is_active, User.updated_at)
+
+    def confirm(self, ids):
+        return set(db.session.execute(
+            select(User.id).where(User.id.in_(ids), User.role == 'rescue_team', User.is_active.is_(True))
+        ).scalars())
+
+resource_index = ResourceIndex()
+team_index = TeamIndex()
+
+def nearest_resources(lat, lng, k=10):
+    """The `k` closest available resources as (distance_km, Resource) pairs"""
+    return _load(Resource, resource_index.nearest(lat, lng, k))
+
+def nearest_teams(lat, lng, k=10):
+    """The `k` closest active rescue teams with a known position as (distance_km, User) pairs"""
+    return _load(User, team_index.nearest(lat, lng, k))
+
+def _load(model, matches):
+    if not matches:
+        return []
+    objects = {obj.id: obj for obj in model.query.filter(model.id.in_([key for _, key in matches]))}
+    return [(distance, objects[key]) for distance, key in matches if key in objects]
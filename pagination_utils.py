@@ -0,0 +1,140 @@
+"""
+Keyset (cursor) pagination for the list pages.
+
+Lists are shown newest first on (created_at, id). Rather than an OFFSET, a
+page link carries the key of the last row shown (`after`) or the first row
+shown (`before`), and the next page is read with a range condition on that
+key. Every page then costs the same index range read, however deep it is,
+and rows inserted meanwhile don't shift the pages.
+
+No COUNT(*) is run per page. Views pass a total they already have (the
+dashboard snapshot or the incident counters), PostgreSQL planner estimates
+are used otherwise, and `?count=exact` asks for an exact count.
+
+`?page=N` links without a cursor (old bookmarks) still work through an
+OFFSET read, and `page` is carried along with cursors as the page number
+to display.
+"""
+import json
+import math
+from sqlalchemy import text, tuple_
+from app import db
+from incident_feed import EPOCH, decode_cursor, encode_cursor
+
+class KeysetPage:
+    """One page of a keyset paginated query, with the prev/next attributes the templates use"""
+
+    def __init__(self, items, page, per_page, has_prev, has_next, total=None, estimated=False, link_args=None,
+                 cursor=None):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.has_prev = has_prev
+        self.has_next = has_next
+        self.total = total
+        self.estimated = estimated
+        self.link_args = link_args or {}
+        cursor = cursor or _row_cursor
+        self.prev_cursor = cursor(items[0]) if items and has_prev else None
+        self.next_cursor = cursor(items[-1]) if items and has_next else None
+
+    @property
+    def prev_num(self):
+        return self.page - 1 if self.has_prev else None
+
+    @property
+    def next_num(self):
+        return self.page + 1 if self.has_next else None
+
+    @property
+    def pages(self):
+        """Number of pages, or None when the total isn't known"""
+        if self.total is None:
+            return None
+        return max(math.ceil(self.total / self.per_page), self.page)
+
+    @property
+    def prev_args(self):
+        """url_for arguments for the previous page"""
+        if self.prev_cursor is None:
+            return {**self.link_args, 'page': self.prev_num}
+        return {**self.link_args, 'before': self.prev_cursor, 'page': self.prev_num}
+
+    @property
+    def next_args(self):
+        """url_for arguments for the next page"""
+        return {**self.link_args, 'after': self.next_cursor, 'page': self.next_num}
+
+def _row_cursor(row):
+    return encode_cursor(row.created_at or EPOCH, row.id)
+
+def _parse_cursor(args, name):
+    try:
+        return decode_cursor(args[name]) if args.get(name) else None
+    except ValueError:
+        return None
+
+def newest_first(query, model, after=None):
+    """`query` ordered newest first on (created_at, id), starting below the `after` key if given"""
+    query = query.order_by(model.created_at.desc(), model.id.desc())
+    if after is not None:
+        query = query.filter(tuple_(model.created_at, model.id) < after)
+    return query
+
+def keyset_paginate(query, model, per_page, args, total=None):
+    """
+    Return a KeysetPage of `query` ordered newest first on (created_at, id).
+
+    `args` are the request arguments (after, before, page, count). `total`
+    is an already known row count for the query, if there is one.
+    """
+    page = max(args.get('page', 1, type=int), 1)
+    after = _parse_cursor(args, 'after')
+    before = _parse_cursor(args, 'before')
+    query = query.order_by(None)
+    link_args = {}
+
+    if before is not None:
+        # Read backwards from the first row of the page the link came from
+        rows = query.filter(tuple_(model.created_at, model.id) > before)\
+                    .order_by(model.created_at.asc(), model.id.asc())\
+                    .limit(per_page + 1).all()
+        has_prev = len(rows) > per_page
+        items = rows[:per_page][::-1]
+        has_next = True
+        if not has_prev:
+            page = 1
+    else:
+        page_query = newest_first(query, model, after)
+        if after is None and page > 1:
+            page_query = page_query.offset((page - 1) * per_page)
+        rows = page_query.limit(per_page + 1).all()
+        has_next = len(rows) > per_page
+        items = rows[:per_page]
+        has_prev = after is not None or page > 1
+        if not has_prev:
+            page = 1
+
+    estimated = False
+    if args.get('count') == 'exact':
+        total = query.count()
+        link_args['count'] = 'exact'
+    if total is None:
+        total = estimate_count(query)
+        estimated = total is not None
+
+    return KeysetPage(items, page, per_page, has_prev, has_next, total, estimated, link_args)
+
+def estimate_count(query):
+    """
+    The planner's row estimate for `query` on PostgreSQL, which costs no
+    scan; None on other databases.
+    """
+    if db.engine.dialect.name != 'postgresql':
+        return None
+    statement = query.statement
+    sql = statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True})
+    plan = db.session.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
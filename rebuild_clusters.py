@@ -0,0 +1,16 @@
+from app import create_app, db
+from cluster_utils import rebuild_cluster_cells
+
+def rebuild_clusters():
+    """Recompute the incident cluster cells from scratch"""
+    app = create_app()
+    with app.app_context():
+        try:
+            rebuild_cluster_cells()
+            print("Incident cluster cells rebuilt")
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error rebuilding cluster cells: {str(e)}")
+
+if __name__ == "__main__":
+    rebuild_clusters()
@@ -0,0 +1,16 @@
+from app import create_app, db
+from counter_utils import rebuild_incident_counters
+
+def reconcile_counters():
+    """Rebuild the per-user and per-team incident counters from scratch"""
+    app = create_app()
+    with app.app_context():
+        try:
+            rebuild_incident_counters()
+            print("Incident counters rebuilt")
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error rebuilding incident counters: {str(e)}")
+
+if __name__ == "__main__":
+    reconcile_counters()
@@ -1,43 +1,102 @@
-from flask import render_template, request, flash, redirect, url_for, current_app
+from flask import render_template, request, flash, redirect, url_for, current_app, abort, jsonify
 from flask_login import login_required, current_user
+from sqlalchemy.orm import joinedload
 from app import db
 from models import Incident, StatusUpdate
 from forms import StatusUpdateForm
-from utils import rescue_team_required
+from utils import allowed_file, rescue_team_required
+from image_storage import get_image_storage
+from image_utils import schedule_variants
+from cache_utils import cached_fragment
+from counter_utils import incident_counts
+from pagination_utils import keyset_paginate
 from . import rescue_bp
 
+def get_dashboard_stats(team_id):
+    """Counts of a team's assigned incidents by status"""
+    counts = incident_counts('team', team_id)
+    
+    return {
+        'total_assigned': counts['total'],
+        'pending': counts.get('pending', 0),
+        'in_progress': counts.get('in_progress', 0),
+        'resolved': counts.get('resolved', 0)
+    }
+
+def get_assigned_incidents(team_id):
+    """A team's latest assigned incidents"""
+    return Incident.query.options(joinedload(Incident.reporter))\
+                         .filter_by(assigned_team_id=team_id)\
+                         .order_by(Incident.created_at.desc())\
+                         .limit(10).all()
+
+def get_unassigned_incidents():
+    """Latest open incidents that no team has taken yet"""
+    return Incident.query.options(joinedload(Incident.reporter))\
+                         .filter_by(assigned_team_id=None)\
+                         .filter(Incident.status.in_(['pending', 'in_progress']))\
+                         .order_by(Incident.created_at.desc())\
+                         .limit(5).all()
+
+# Refreshable dashboard regions: fragment name -> (template, context loader taking the team id)
+DASHBOARD_FRAGMENTS = {
+    'stats': ('rescue/_dashboard_stats.html',
+              lambda team_id: {'stats': get_dashboard_stats(team_id)}),
+    'assigned_incidents': ('rescue/_assigned_incidents.html',
+                           lambda team_id: {'assigned_incidents': get_assigned_incidents(team_id)}),
+    'unassigned_incidents': ('rescue/_unassigned_incidents.html',
+                             lambda team_id: {'unassigned_incidents': get_unassigned_incidents()})
+}
+
 @rescue_bp.route('/dashboard')
 @login_required
 @rescue_team_required
 def dashboard():
-    # Get assigned incidents
-    assigned_incidents = Incident.query.filter_by(assigned_team_id=current_user.id)\
-                                      .order_by(Incident.created_at.desc())\
-                                      .limit(10).all()
-    
-    # Get all unassigned incidents
-    unassigned_incidents = Incident.query.filter_by(assigned_team_id=None)\
-                                        .filter(Incident.status.in_(['pending', 'in_progress']))\
-                                        .order_by(Incident.created_at.desc())\
-                                        .limit(5).all()
-    
-    # Get statistics
-    total_assigned = Incident.query.filter_by(assigned_team_id=current_user.id).count()
-    pending_assigned = Incident.query.filter_by(assigned_team_id=current_user.id, status='pending').count()
-    in_progress_assigned = Incident.query.filter_by(assigned_team_id=current_user.id, status='in_progress').count()
-    resolved_assigned = Incident.query.filter_by(assigned_team_id=current_user.id, status='resolved').count()
-    
-    stats = {
-        'total_assigned': total_assigned,
-        'pending': pending_assigned,
-        'in_progress': in_progress_assigned,
-        'resolved': resolved_assigned
-    }
-    
     return render_template('rescue/dashboard.html',
-                         assigned_incidents=assigned_incidents,
-                         unassigned_incidents=unassigned_incidents,
-                         stats=stats)
+                         assigned_incidents=get_assigned_incidents(current_user.id),
+                         unassigned_incidents=get_unassigned_incidents(),
+                         stats=get_dashboard_stats(current_user.id))
+
+@rescue_bp.route('/dashboard/fragments/<name>')
+@login_required
+@rescue_team_required
+def dashboard_fragment(name):
+    if name not in DASHBOARD_FRAGMENTS:
+        abort(404)
+    template, load_context = DASHBOARD_FRAGMENTS[name]
+    team_id = current_user.id
+    
+    # The unassigned pool is the same for every team
+    scope = None if name == 'unassigned_incidents' else team_id
+    return cached_fragment(('rescue', name), scope, lambda: render_template(template, **load_context(team_id)))
+
+@rescue_bp.route('/location', methods=['POST'])
+@login_required
+@rescue_team_required
+def update_location():
+    # JSON only, so a cross-site form can't move a team
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({'error': 'Expected a JSON body'}), 400
+    
+    try:
+        latitude = float(data['latitude'])
+        longitude = float(data['longitude'])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'latitude and longitude are required'}), 400
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return jsonify({'error': 'Coordinates out of range'}), 400
+    
+    try:
+        current_user.latitude = latitude
+        current_user.longitude = longitude
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Error updating location for team {current_user.username}: {str(e)}')
+        return jsonify({'error': 'Could not save location'}), 500
+    
+    return jsonify({'latitude': latitude, 'longitude': longitude})
 
 @rescue_bp.route('/incident/<int:incident_id>')
 @login_required
@@ -73,10 +132,21 @@ def update_status(incident_id):
     
     form = StatusUpdateForm()
     if form.validate_on_submit():
+        image = request.files.get('image')
+        if image and image.filename and not allowed_file(image.filename):
+            flash('Images must be PNG, JPG or GIF files.', 'error')
+            return redirect(url_for('rescue.incident_details', incident_id=incident_id))
+        rescue_image_id = None
         try:
             old_status = incident.status
             new_status = form.status.data
             
+            # Photo of the scene from the rescue team
+            if image and image.filename:
+                rescue_image_id = get_image_storage().save(image, incident.id)
+                if rescue_image_id:
+                    incident.rescue_image_id = rescue_image_id
+            
             # Create status update record
             status_update = StatusUpdate(
                 incident_id=incident.id,
@@ -92,11 +162,18 @@ def update_status(incident_id):
             db.session.add(status_update)
             db.session.commit()
             
+            # Rendered in the background like reporters' photos, once the incident refers to it
+            if rescue_image_id:
+                schedule_variants(rescue_image_id)
+            
             flash(f'Incident status updated from "{old_status}" to "{new_status}".', 'success')
             current_app.logger.info(f'Incident {incident.id} status updated by {current_user.username}: {old_status} -> {new_status}')
             
         except Exception as e:
             db.session.rollback()
+            # Nothing refers to the photo now
+            if rescue_image_id:
+                get_image_storage().delete(rescue_image_id)
             flash('An error occurred while updating the status. Please try again.', 'error')
             current_app.logger.error(f'Error updating incident status: {str(e)}')
     
@@ -145,11 +222,9 @@ def accept_incident(incident_id):
 @login_required
 @rescue_team_required
 def my_incidents():
-    page = request.args.get('page', 1, type=int)
     per_page = 10
     
-    incidents = Incident.query.filter_by(assigned_team_id=current_user.id)\
-                             .order_by(Incident.created_at.desc())\
-                             .paginate(page=page, per_page=per_page, error_out=False)
+    incidents = keyset_paginate(Incident.query.filter_by(assigned_team_id=current_user.id), Incident, per_page, request.args,
+                                total=incident_counts('team', current_user.id)['total'])
     
     return render_template('rescue/my_incidents.html', incidents=incidents)
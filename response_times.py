@@ -0,0 +1,216 @@
+"""
+Response-time analytics from the status update history.
+
+For every incident created in a date range three durations are measured
+from its creation:
+  time_to_accept       until the first status update by the assigned team
+                       (accepting it, or its first update after an admin
+                       assigned it)
+  time_to_in_progress  until the first update moving it to in_progress
+  time_to_resolve      until resolved_at
+
+Incident columns and the status updates, reduced in SQL to the first
+update per incident and updater, are loaded as NumPy arrays; matching
+transitions to incidents and teams is done on those arrays. Percentiles per incident type, priority and
+team come from a single sort per grouping, without a Python loop over
+incidents or groups. Results are cached per date range for
+RESPONSE_TIME_TTL seconds.
+"""
+import numpy as np
+from sqlalchemy import Float, case, func, select
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+from app import db
+from models import Incident, StatusUpdate, User
+from cache_utils import TTLCache
+
+METRICS = ('time_to_accept', 'time_to_in_progress', 'time_to_resolve')
+PERCENTILES = (50, 90, 99)
+GROUPINGS = ('incident_type', 'priority', 'team')
+RESPONSE_TIME_TTL = 300  # seconds
+
+class epoch(FunctionElement):
+    """Seconds since the Unix epoch for a DateTime expression"""
+    type = Float()
+    inherit_cache = True
+
+@compiles(epoch)
+def _epoch_default(element, compiler, **kw):
+    return f"EXTRACT(EPOCH FROM {compiler.process(element.clauses, **kw)})"
+
+@compiles(epoch, 'sqlite')
+def _epoch_sqlite(element, compiler, **kw):
+    return f"((julianday({compiler.process(element.clauses, **kw)}) - 2440587.5) * 86400.0)"
+
+@compiles(epoch, 'mysql')
+def _epoch_mysql(element, compiler, **kw):
+    return f"UNIX_TIMESTAMP({compiler.process(element.clauses, **kw)})"
+
+def _created_in(column, start, stop):
+    conditions = []
+    if start is not None:
+        conditions.append(column >= start)
+    if stop is not None:
+        conditions.append(column < stop)
+    return conditions
+
+def _fetch_columns(stmt, count):
+    """Run `stmt` and return its result as `count` column tuples"""
+    # Plain DBAPI tuples; SQLAlchemy's per-row processing is skipped
+    rows = db.session.connection().execute(stmt).cursor.fetchall()
+    return list(zip(*rows)) or [()] * count
+
+def load_incident_timings(start=None, stop=None):
+    """
+    Return a dict of equal-length arrays, one entry per incident created in
+    [start, stop): created, accepted, in_progress and resolved times as
+    epoch seconds (NaN where it never happened), and incident_type,
+    priority and team codes with their labels.
+    """
+    in_range = _created_in(Incident.created_at, start, stop)
+    ids, created, resolved, incident_types, priorities, teams = _fetch_columns(
+        select(
+            Incident.id,
+            epoch(Incident.created_at),
+            epoch(Incident.resolved_at),
+            Incident.incident_type,
+            Incident.priority,
+            func.coalesce(Incident.assigned_team_id, 0)
+        ).where(*in_range).order_by(Incident.id), 6)
+
+    # First update per incident and updater, and first move to in_progress.
+    # Grouping by updater instead of joining incidents keeps this a single
+    # pass over status_updates; the assigned team is matched below.
+    transitions = select(
+        StatusUpdate.incident_id,
+        StatusUpdate.updated_by,
+        epoch(func.min(StatusUpdate.created_at)),
+        epoch(func.min(case((StatusUpdate.new_status == 'in_progress', StatusUpdate.created_at))))
+    ).group_by(StatusUpdate.incident_id, StatusUpdate.updated_by)
+    if in_range:
+        transitions = transitions.where(StatusUpdate.incident_id.in_(select(Incident.id).where(*in_range)))
+    update_incidents, updaters, first_update, first_in_progress = _fetch_columns(transitions, 4)
+
+    ids = np.array(ids, dtype=np.int64)
+    team_ids = np.array(teams, dtype=np.int64)
+    update_incidents = np.array(update_incidents, dtype=np.int64)
+    first_update = np.array(first_update, dtype=np.float64)
+    first_in_progress = np.array(first_in_progress, dtype=np.float64)
+
+    accepted = np.full(len(ids), np.nan)
+    in_progress = np.full(len(ids), np.nan)
+    if len(ids) and len(update_incidents):
+        # Row of each transition's incident
+        rows = np.searchsorted(ids, update_incidents).clip(max=len(ids) - 1)
+        known = ids[rows] == update_incidents
+
+        by_team = known & (np.array(updaters, dtype=np.int64) == team_ids[rows])
+        np.fmin.at(accepted, rows[by_team], first_update[by_team])
+
+        moved = known & ~np.isnan(first_in_progress)
+        np.fmin.at(in_progress, rows[moved], first_in_progress[moved])
+
+    timings = {
+        'created': np.array(created, dtype=np.float64),
+        'accepted': accepted,
+        'in_progress': in_progress,
+        'resolved': np.array(resolved, dtype=np.float64)
+    }
+    for name, values in (('incident_type', incident_types), ('priority', priorities), ('team', teams)):
+        codes, labels = _factorize(values)
+        timings[name] = codes
+        timings[f'{name}_labels'] = labels
+    timings['team_labels'] = _team_names(timings['team_labels'])
+    return timings
+
+def _factorize(values):
+    """Small integer codes for `values` and the distinct values they index"""
+    index = {}
+    codes = np.fromiter((index.setdefault(value, len(index)) for value in values),
+                        dtype=np.int64, count=len(values))
+    return codes.astype(np.min_scalar_type(max(len(index), 1))), list(index)
+
+def _team_names(team_ids):
+    names = dict(db.session.execute(
+        select(User.id, User.full_name).where(User.id.in_([team_id for team_id in team_ids if team_id]))
+    ).all())
+    return [names.get(team_id, f'Team {team_id}') if team_id else 'Unassigned' for team_id in team_ids]
+
+def group_percentiles(codes, values, percentiles=PERCENTILES):
+    """
+    Percentiles of `values` within each group of `codes`, ignoring NaN and
+    negative values. Returns (group codes, counts, {percentile: array}),
+    interpolating linearly between closest ranks.
+
+    Both sorts are stable: the first is close to linear when `values` is
+    already sorted, and the second is a radix sort for small integer codes.
+    """
+    valid = values >= 0  # also False for NaN
+    codes = codes[valid]
+    values = values[valid]
+    if not len(values):
+        empty = np.array([], dtype=np.float64)
+        return np.array([], dtype=codes.dtype), np.array([], dtype=np.int64), {p: empty for p in percentiles}
+
+    order = np.argsort(values, kind='stable')
+    order = order[np.argsort(codes[order], kind='stable')]
+    codes = codes[order]
+    values = values[order]
+
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    counts = np.diff(np.r_[starts, len(values)])
+
+    results = {}
+    for percentile in percentiles:
+        position = starts + (counts - 1) * (percentile / 100.0)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.ceil(position).astype(np.int64)
+        results[percentile] = values[lower] + (values[upper] - values[lower]) * (position - lower)
+    return codes[starts], counts, results
+
+def summarize_timings(timings):
+    """
+    Response-time percentiles (in seconds) from load_incident_timings:
+    {'overall': {metric: stats}, 'by_incident_type': {label: {metric:
+    stats}}, 'by_priority': ..., 'by_team': ...}, where stats holds the
+    count and one 'p<N>' entry per percentile.
+    """
+    created = timings['created']
+    overall = np.zeros(len(created), dtype=np.uint8)
+
+    # Sort each metric once; grouping the sorted values is then cheap
+    durations = {}
+    for metric, column in zip(METRICS, ('accepted', 'in_progress', 'resolved')):
+        values = timings[column] - created
+        order = np.flatnonzero(values >= 0)
+        order = order[np.argsort(values[order], kind='stable')]
+        durations[metric] = (order, values[order])
+
+    result = {'overall': {}, 'incidents': int(len(created))}
+    for grouping in (None, *GROUPINGS):
+        codes = overall if grouping is None else timings[grouping]
+        labels = ['overall'] if grouping is None else timings[f'{grouping}_labels']
+        groups = {}
+        for metric in METRICS:
+            order, values = durations[metric]
+            group_codes, counts, by_percentile = group_percentiles(codes[order], values)
+            for i, code in enumerate(group_codes):
+                stats = {'count': int(counts[i])}
+                stats.update({f'p{percentile}': round(float(by_percentile[percentile][i]), 1)
+                              for percentile in PERCENTILES})
+                groups.setdefault(labels[code], {})[metric] = stats
+        if grouping is None:
+            result['overall'] = groups.get('overall', {})
+        else:
+            result[f'by_{grouping}'] = groups
+    return result
+
+def compute_response_times(start=None, stop=None):
+    """Response-time percentiles for incidents created in [start, stop)"""
+    return summarize_timings(load_incident_timings(start, stop))
+
+response_time_cache = TTLCache(ttl=RESPONSE_TIME_TTL, max_entries=64)
+
+def response_times(start=None, stop=None):
+    """compute_response_times for [start, stop), cached per range"""
+    return response_time_cache.get_or_set((start, stop), lambda: compute_response_times(start, stop))
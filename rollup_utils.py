@@ -0,0 +1,206 @@
+"""
+Time-bucketed incident rollups for the analytics charts.
+
+incident_rollups counts incidents by creation time bucket, type, priority
+and status. Every incident write adjusts its hourly row in the same
+transaction (see register_incident_change_handler in models.py). The
+compaction job (compact_rollups.py) folds hourly rows older than
+HOURLY_RETENTION_DAYS into daily rows, which are then final, so the table
+grows with elapsed time rather than with the number of incidents.
+
+Day, week and month queries read daily rows plus any hourly rows not yet
+compacted; hour queries are limited to the retention window.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, insert, select
+from app import db
+from models import Incident, IncidentRollup, increment_counters, register_incident_change_handler
+
+HOURLY_RETENTION_DAYS = 14
+GRANULARITIES = ('hour', 'day', 'week', 'month')
+MAX_TREND_BUCKETS = 1000
+DEFAULT_TREND_BUCKETS = 12
+
+ROLLUP_FIELDS = ('created_at', 'incident_type', 'priority', 'status')
+DIMENSIONS = ('incident_type', 'priority', 'status')
+
+def truncate(moment, granularity):
+    """Start of the bucket containing `moment`"""
+    if granularity == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+def next_bucket(bucket, granularity):
+    if granularity == 'hour':
+        return bucket + timedelta(hours=1)
+    if granularity == 'day':
+        return bucket + timedelta(days=1)
+    if granularity == 'week':
+        return bucket + timedelta(days=7)
+    if bucket.month == 12:
+        return bucket.replace(year=bucket.year + 1, month=1)
+    return bucket.replace(month=bucket.month + 1)
+
+def previous_bucket(bucket, granularity):
+    if granularity == 'hour':
+        return bucket - timedelta(hours=1)
+    if granularity == 'day':
+        return bucket - timedelta(days=1)
+    if granularity == 'week':
+        return bucket - timedelta(days=7)
+    if bucket.month == 1:
+        return bucket.replace(year=bucket.year - 1, month=12)
+    return bucket.replace(month=bucket.month - 1)
+
+def latest_buckets_start(end, granularity, count=DEFAULT_TREND_BUCKETS):
+    """Start of the `count` buckets ending with the one containing `end`"""
+    bucket = truncate(end, granularity)
+    for _ in range(count - 1):
+        bucket = previous_bucket(bucket, granularity)
+    return bucket
+
+def bucket_label(bucket, granularity):
+    if granularity == 'hour':
+        return bucket.strftime('%Y-%m-%d %H:00')
+    if granularity == 'month':
+        return f"{bucket.month}/{bucket.year}"
+    return bucket.strftime('%Y-%m-%d')
+
+def hourly_horizon(now=None):
+    """Hourly rows from this point on are kept; older ones are compacted into days"""
+    return truncate((now or datetime.utcnow()) - timedelta(days=HOURLY_RETENTION_DAYS), 'day')
+
+@register_incident_change_handler
+def update_incident_rollups(connection, before, after):
+    """Move an incident's contribution between hourly rollup rows as it changes"""
+    if before and after and all(before[f] == after[f] for f in ROLLUP_FIELDS):
+        return
+
+    table = IncidentRollup.__table__
+    for sign, snapshot in ((-1, before), (1, after)):
+        if not snapshot or snapshot['created_at'] is None:
+            continue
+        increment_counters(connection, table, {
+            'granularity': 'hour',
+            'bucket': truncate(snapshot['created_at'], 'hour'),
+            'incident_type': snapshot['incident_type'],
+            'priority': snapshot['priority'],
+            'status': snapshot['status']
+        }, {'count': sign})
+
+def compact_rollups(now=None):
+    """
+    Fold hourly rows from before the retention window into daily rows and
+    drop rows whose count fell to zero. Returns the number of hourly rows
+    folded.
+    """
+    table = IncidentRollup.__table__
+    connection = db.session.connection()
+    old_hours = (table.c.granularity == 'hour', table.c.bucket < hourly_horizon(now))
+    columns = (table.c.bucket, *[table.c[d] for d in DIMENSIONS], table.c.count)
+
+    # Take the rows out with DELETE ... RETURNING where possible so an
+    # increment committed between reading and deleting a row can't be lost
+    if connection.dialect.delete_returning:
+        rows = connection.execute(delete(table).where(*old_hours).returning(*columns)).all()
+    else:
+        rows = connection.execute(select(*columns).where(*old_hours).with_for_update()).all()
+        connection.execute(delete(table).where(*old_hours))
+
+    days = defaultdict(int)
+    for bucket, *dimensions, count in rows:
+        days[(truncate(bucket, 'day'), *dimensions)] += count
+
+    for (bucket, *dimensions), count in days.items():
+        if count:
+            increment_counters(connection, table, {
+                'granularity': 'day',
+                'bucket': bucket,
+                **dict(zip(DIMENSIONS, dimensions))
+            }, {'count': count})
+
+    connection.execute(delete(table).where(table.c.count == 0))
+    db.session.commit()
+    return len(rows)
+
+def rebuild_rollups(now=None, batch_size=1000):
+    """Recompute the rollups from the incidents table: daily rows before the retention window, hourly after"""
+    table = IncidentRollup.__table__
+    horizon = hourly_horizon(now)
+    counts = defaultdict(int)
+
+    stmt = select(Incident.created_at, *[getattr(Incident, d) for d in DIMENSIONS])\
+        .where(Incident.created_at.isnot(None))
+    for created_at, *dimensions in db.session.execute(stmt.execution_options(yield_per=batch_size)):
+        granularity = 'hour' if created_at >= horizon else 'day'
+        counts[(granularity, truncate(created_at, granularity), *dimensions)] += 1
+
+    db.session.execute(delete(table))
+    rows = [{'granularity': granularity, 'bucket': bucket, **dict(zip(DIMENSIONS, dimensions)), 'count': count}
+            for (granularity, bucket, *dimensions), count in counts.items()]
+    for offset in range(0, len(rows), batch_size):
+        db.session.execute(insert(table), rows[offset:offset + batch_size])
+    db.session.commit()
+    return len(rows)
+
+def _rollup_filter(start, stop, granularity):
+    """Rollup rows for [start, stop): hour queries read hourly rows only, the rest read both tiers"""
+    conditions = [IncidentRollup.granularity == 'hour' if granularity == 'hour'
+                  else IncidentRollup.granularity.in_(('hour', 'day'))]
+    if start is not None:
+        conditions.append(IncidentRollup.bucket >= start)
+    if stop is not None:
+        conditions.append(IncidentRollup.bucket < stop)
+    return conditions
+
+def align_range(start, end, granularity):
+    """
+    Widen [start, end) to whole buckets and return (start, stop, buckets).
+    Raises ValueError for ranges the rollups can't answer.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+    if end <= start:
+        raise ValueError("end must be after start")
+    if granularity == 'hour' and start < hourly_horizon():
+        raise ValueError(f"hourly data only covers the last {HOURLY_RETENTION_DAYS} days")
+
+    buckets = []
+    bucket = truncate(start, granularity)
+    while bucket < end:
+        buckets.append(bucket)
+        if len(buckets) > MAX_TREND_BUCKETS:
+            raise ValueError(f"range spans more than {MAX_TREND_BUCKETS} {granularity} buckets")
+        bucket = next_bucket(bucket, granularity)
+    return buckets[0], bucket, buckets
+
+def rollup_trend(start, end, granularity):
+    """Incident counts per bucket over [start, end) as a list of (bucket, count), empty buckets included"""
+    start, stop, buckets = align_range(start, end, granularity)
+    stmt = select(IncidentRollup.bucket, func.sum(IncidentRollup.count))\
+        .where(*_rollup_filter(start, stop, granularity))\
+        .group_by(IncidentRollup.bucket)
+
+    totals = dict.fromkeys(buckets, 0)
+    for bucket, count in db.session.execute(stmt):
+        totals[truncate(bucket, granularity)] += count
+    return list(totals.items())
+
+def rollup_distributions(start=None, stop=None, granularity='day'):
+    """Incident counts over [start, stop) by each of type, priority and status"""
+    stmt = select(*[getattr(IncidentRollup, d) for d in DIMENSIONS], func.sum(IncidentRollup.count))\
+        .where(*_rollup_filter(start, stop, granularity))\
+        .group_by(*[getattr(IncidentRollup, d) for d in DIMENSIONS])
+
+    distributions = {dimension: defaultdict(int) for dimension in DIMENSIONS}
+    for *values, count in db.session.execute(stmt):
+        for dimension, value in zip(DIMENSIONS, values):
+            distributions[dimension][value] += count
+    return {dimension: {value: count for value, count in sorted(counts.items()) if count}
+            for dimension, counts in distributions.items()}
@@ -1,20 +1,110 @@
-from flask import Blueprint, send_file, Response
-from io import BytesIO
-from mongo_utils import get_image
+from datetime import timezone
+from flask import Blueprint, Response, request
+from werkzeug.datastructures import ContentRange
+from image_utils import VARIANTS
+from image_cache import image_cache
+from image_storage import get_image_storage
 
 # Create a blueprint for image routes
 image_bp = Blueprint('image', __name__)
 
+IMAGE_MAX_AGE = 365 * 24 * 3600  # an image stored under an ObjectId never changes
+PENDING_VARIANT_MAX_AGE = 60  # the original stands in for a variant not rendered yet
+
+def image_validators(file_doc):
+    """Strong ETag and Last-Modified for an image, from its fs_files document"""
+    etag = file_doc.get("sha256") or file_doc.get("md5") or str(file_doc["_id"])
+    last_modified = file_doc.get("uploadDate") or file_doc["_id"].generation_time
+    return etag, last_modified.replace(tzinfo=timezone.utc, microsecond=0)
+
+def set_cache_headers(response, etag, last_modified, immutable=True):
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = IMAGE_MAX_AGE if immutable else PENDING_VARIANT_MAX_AGE
+    response.cache_control.immutable = immutable
+
+def _if_range_matches(etag, last_modified):
+    if_range = request.if_range
+    if if_range.etag is not None:
+        return if_range.etag == etag
+    if if_range.date is not None:
+        return if_range.date >= last_modified
+    return True
+
 @image_bp.route('/image/<file_id>')
 def serve_image(file_id):
-    """Serve images from MongoDB"""
-    image_data, content_type = get_image(file_id)
-    
-    if not image_data:
+    """
+    Stream an image from the image store, honouring single byte-range
+    requests. ?size=thumb or ?size=medium serves that variant of the image.
+    """
+    size = request.args.get('size')
+    if size and size not in VARIANTS:
+        return "Unknown image size", 400
+
+    storage = get_image_storage()
+    file_doc = storage.get_file(file_id)
+
+    if not file_doc:
         return "Image not found", 404
-    
-    return Response(
-        BytesIO(image_data),
+
+    immutable = True
+    if size:
+        variant_id = file_doc.get("variants", {}).get(size)
+        variant_doc = storage.get_file(variant_id) if variant_id and variant_id != str(file_doc["_id"]) else None
+        if variant_doc:
+            file_doc = variant_doc
+        elif variant_id != str(file_doc["_id"]):
+            # Not rendered yet: serve the original, but only cache it briefly
+            immutable = False
+
+    length = file_doc["length"]
+    content_type = file_doc.get("metadata", {}).get("contentType") or "image/jpeg"
+    etag, last_modified = image_validators(file_doc)
+    start, stop, status = 0, length, 200
+
+    # Revalidation is answered from the image's document alone
+    not_modified = request.if_none_match.contains(etag) if request.if_none_match else \
+        request.if_modified_since is not None and last_modified <= request.if_modified_since
+    if not_modified:
+        response = Response(status=304)
+        set_cache_headers(response, etag, last_modified, immutable)
+        return response
+
+    # The front end server sends the file itself, ranges included
+    accel_uri = storage.accel_redirect(file_doc)
+    if accel_uri:
+        response = Response(mimetype=content_type)
+        response.headers['X-Accel-Redirect'] = accel_uri
+        set_cache_headers(response, etag, last_modified, immutable)
+        return response
+
+    # A range is only honoured when If-Range (if sent) still matches; multi-range
+    # requests are answered with the whole image
+    if request.range and request.range.units == 'bytes' and len(request.range.ranges) == 1 \
+            and _if_range_matches(etag, last_modified):
+        byte_range = request.range.range_for_length(length)
+        if byte_range is None:
+            response = Response("Requested range not satisfiable", 416)
+            response.content_range = ContentRange('bytes', None, None, length)
+            return response
+        start, stop = byte_range
+        status = 206
+
+    # Images from a remote store, up to the cache's entry size, come from the
+    # memory or disk tier
+    data = None
+    if storage.remote and image_cache.cacheable(file_doc):
+        data = image_cache.get(file_doc, lambda: storage.read(file_doc))
+    response = Response(
+        data[start:stop] if data is not None else storage.body(file_doc, start, stop),
+        status=status,
         mimetype=content_type,
         direct_passthrough=True
-    )
\ No newline at end of file
+    )
+    response.content_length = stop - start
+    response.accept_ranges = 'bytes'
+    set_cache_headers(response, etag, last_modified, immutable)
+    if status == 206:
+        response.content_range = ContentRange('bytes', start, stop, length)
+    return response
@@ -0,0 +1,242 @@
+"""
+Full-text search over incident titles, descriptions and addresses.
+
+On PostgreSQL incidents get a search_vector tsvector column generated from
+the three columns, so the database keeps it current on every write, with a
+GIN index on it (see update_schema.py). Queries are parsed with
+websearch_to_tsquery and ranked with ts_rank_cd; title matches weigh most,
+then the address, then the description.
+
+Other databases, and PostgreSQL before the column is added, use a
+per-process inverted index ranked with BM25. It is built from the
+incidents table on the first search and then follows writes the way
+nearest_utils does: rows whose updated_at moved since the last sync are
+indexed again, and deleted incidents are dropped through the
+deleted_incidents tombstones. A tombstone only drops an indexed row
+updated before the deletion: SQLite can hand a deleted row's id to the
+next insert, and the new row must survive its predecessor's tombstone.
+
+Either way every term of the query has to match, and results are paged
+with a keyset cursor on (rank, id).
+"""
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import REAL, cast, func, inspect, literal_column, select, tuple_
+from app import db
+from models import DeletedIncident, Incident
+from pagination_utils import KeysetPage
+
+SEARCH_CONFIG = 'english'
+SEARCH_FIELDS = (('title', 2.0), ('address', 1.5), ('description', 1.0))  # fallback index weights
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# updated_at is stamped at flush time, so a row can commit after a later
+# stamped one; rows stamped within this window are re-read on every refresh
+SETTLE_SECONDS = 5
+
+TOKEN = re.compile(r'\w+')
+STOPWORDS = frozenset('a an and are as at be by for from in is it near of on or the to with'.split())
+
+def tokenize(text):
+    """Lower-cased word tokens of `text`, stopwords left out"""
+    return [token for token in TOKEN.findall((text or '').lower()) if token not in STOPWORDS]
+
+def encode_rank_cursor(rank, incident_id):
+    return f"{rank!r}:{incident_id}"
+
+def decode_rank_cursor(cursor):
+    """Decode a (rank, id) cursor. Raises ValueError if it is malformed."""
+    rank, incident_id = cursor.rsplit(':', 1)
+    return float(rank), int(incident_id)
+
+class InvertedIndex:
+    """In-memory term -> incident postings with BM25 ranking, following the incidents table"""
+
+    def __init__(self):
+        self.postings = {}  # term -> {incident id: weighted term frequency}
+        self.documents = {}  # incident id -> (length, terms, incident_type, status, priority, updated_at)
+        self.total_length = 0.0
+        self.synced_to = None  # newest updated_at applied
+        self.read_at = None  # when the table was last read
+        self.deleted_to = None  # newest tombstone applied
+        self.lock = threading.Lock()
+
+    def _add(self, row):
+        frequencies = Counter()
+        for field, weight in SEARCH_FIELDS:
+            for token in tokenize(getattr(row, field)):
+                frequencies[token] += weight
+        for term, frequency in frequencies.items():
+            self.postings.setdefault(term, {})[row.id] = frequency
+        length = sum(frequencies.values())
+        self.documents[row.id] = (length, tuple(frequencies), row.incident_type, row.status, row.priority,
+                                  row.updated_at)
+        self.total_length += length
+
+    def _remove(self, incident_id):
+        document = self.documents.pop(incident_id, None)
+        if document is None:
+            return
+        length, terms = document[:2]
+        for term in terms:
+            postings = self.postings[term]
+            del postings[incident_id]
+            if not postings:
+                del self.postings[term]
+        self.total_length -= length
+
+    def refresh(self, batch_size=10000):
+        """Index rows changed since the last refresh and drop deleted ones"""
+        settle = timedelta(seconds=SETTLE_SECONDS)
+        newest = db.session.query(func.max(Incident.updated_at)).scalar()
+        deleted_to = db.session.query(func.max(DeletedIncident.deleted_at)).scalar()
+        with self.lock:
+            # Deletions first, so a row re-read below is never dropped again
+            if self.synced_to is not None and deleted_to is not None and \
+                    (self.deleted_to is None or deleted_to > self.deleted_to):
+                stmt = select(DeletedIncident.incident_id, DeletedIncident.deleted_at)
+                if self.deleted_to is not None:
+                    stmt = stmt.where(DeletedIncident.deleted_at >= self.deleted_to - settle)
+                for incident_id, deleted_at in db.session.execute(stmt):
+                    document = self.documents.get(incident_id)
+                    # A row written after the deletion reuses the id; keep it
+                    if document is not None and document[5] is not None and document[5] > deleted_at:
+                        continue
+                    self._remove(incident_id)
+            self.deleted_to = deleted_to
+
+            # Nothing new, and the last read came after every row stamped up
+            # to synced_to had time to commit
+            if newest is None or (self.synced_to is not None and newest <= self.synced_to
+                                  and self.read_at - settle > self.synced_to):
+                return
+
+            stmt = select(Incident.id, Incident.title, Incident.description, Incident.address,
+                          Incident.incident_type, Incident.status, Incident.priority, Incident.updated_at)
+            if self.synced_to is not None:
+                stmt = stmt.where(Incident.updated_at >= self.synced_to - settle)
+            read_at = datetime.utcnow()
+            for row in db.session.execute(stmt.execution_options(yield_per=batch_size)):
+                self._remove(row.id)
+                self._add(row)
+            self.synced_to = newest
+            self.read_at = read_at
+
+    def search(self, terms, types=None, statuses=None, priorities=None):
+        """Every incident matching all `terms` and the filters, as (score, id) pairs in no order"""
+        with self.lock:
+            postings = [self.postings.get(term) for term in terms]
+            if not postings or None in postings:
+                return []
+            postings.sort(key=len)
+
+            count = len(self.documents)
+            average_length = self.total_length / count or 1.0
+            weights = [math.log(1 + (count - len(p) + 0.5) / (len(p) + 0.5)) for p in postings]
+
+            matches = []
+            for incident_id in postings[0]:
+                if not all(incident_id in p for p in postings[1:]):
+                    continue
+                length, _, incident_type, status, priority, _ = self.documents[incident_id]
+                if (types and incident_type not in types) or (statuses and status not in statuses) \
+                        or (priorities and priority not in priorities):
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                score = sum(weight * p[incident_id] * (BM25_K1 + 1) / (p[incident_id] + norm)
+                            for weight, p in zip(weights, postings))
+                matches.append((score, incident_id))
+            return matches
+
+inverted_index = InvertedIndex()
+
+_search_vector = None
+
+def has_search_vector():
+    """True if incidents has the PostgreSQL search_vector column (checked once per process)"""
+    global _search_vector
+    if _search_vector is None:
+        _search_vector = db.engine.dialect.name == 'postgresql' and \
+            'search_vector' in {c['name'] for c in inspect(db.engine).get_columns('incidents')}
+    return _search_vector
+
+def _database_matches(text, limit, after, before, types, statuses, priorities):
+    """A page of (rank, id) from the tsvector index, in keyset order"""
+    vector = literal_column('incidents.search_vector')
+    query = func.websearch_to_tsquery(SEARCH_CONFIG, text)
+    rank = func.ts_rank_cd(vector, query)
+    key = tuple_(rank, Incident.id)
+
+    stmt = select(rank, Incident.id).where(vector.op('@@')(query))
+    if types:
+        stmt = stmt.where(Incident.incident_type.in_(types))
+    if statuses:
+        stmt = stmt.where(Incident.status.in_(statuses))
+    if priorities:
+        stmt = stmt.where(Incident.priority.in_(priorities))
+
+    # ts_rank_cd returns a real; compare cursors as reals so equal ranks stay equal
+    if before is not None:
+        stmt = stmt.where(key > tuple_(cast(before[0], REAL), before[1])).order_by(rank, Incident.id)
+    else:
+        if after is not None:
+            stmt = stmt.where(key < tuple_(cast(after[0], REAL), after[1]))
+        stmt = stmt.order_by(rank.desc(), Incident.id.desc())
+    return [tuple(row) for row in db.session.execute(stmt.limit(limit))]
+
+def _index_matches(text, limit, after, before, types, statuses, priorities):
+    """A page of (score, id) from the in-process index, in keyset order"""
+    inverted_index.refresh()
+    terms = list(dict.fromkeys(tokenize(text)))
+    matches = inverted_index.search(terms, types, statuses, priorities)
+    if before is not None:
+        return heapq.nsmallest(limit, (match for match in matches if match > before))
+    if after is not None:
+        matches = (match for match in matches if match < after)
+    return heapq.nlargest(limit, matches)
+
+def search_condition(text):
+    """
+    A WHERE condition on incidents for the rows that a search for `text`
+    finds, for statements that filter by the search rather than rank by it
+    (the exports)
+    """
+    if has_search_vector():
+        return literal_column('incidents.search_vector').op('@@')(func.websearch_to_tsquery(SEARCH_CONFIG, text))
+    inverted_index.refresh()
+    matches = inverted_index.search(list(dict.fromkeys(tokenize(text))))
+    return Incident.id.in_([incident_id for _, incident_id in matches])
+
+def search_incidents(text, per_page, args, types=None, statuses=None, priorities=None):
+    """
+    A KeysetPage of the incidents matching `text`, best first. `args` are
+    the request arguments (after, before, page) as for keyset_paginate.
+    """
+    page = max(args.get('page', 1, type=int), 1)
+    try:
+        after = decode_rank_cursor(args['after']) if args.get('after') else None
+        before = decode_rank_cursor(args['before']) if args.get('before') and not after else None
+    except ValueError:
+        after = before = None
+
+    find = _database_matches if has_search_vector() else _index_matches
+    matches = find(text, per_page + 1, after, before, types, statuses, priorities)
+    if before is not None:
+        has_prev, has_next = len(matches) > per_page, True
+        matches = matches[:per_page][::-1]
+    else:
+        has_prev, has_next = after is not None, len(matches) > per_page
+        matches = matches[:per_page]
+    if not has_prev:
+        page = 1
+
+    ranks = {incident_id: rank for rank, incident_id in matches}
+    incidents = {incident.id: incident for incident in Incident.query.filter(Incident.id.in_(list(ranks)))}
+    items = [incidents[incident_id] for _, incident_id in matches if incident_id in incidents]
+    return KeysetPage(items, page, per_page, has_prev, has_next,
+                      cursor=lambda incident: encode_rank_cursor(ranks[incident.id], incident.id))
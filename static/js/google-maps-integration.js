@@ -205,14 +205,27 @@ function createIncidentsMapOverview(incidents) {
 /**
  * Initialize Google Maps integration on page load
  */
+let overviewEtag = null;  // ETag of the feed currently rendered in the overview
+
 function initializeGoogleMapsIntegration() {
-    // Load incidents data and create map overview
-    fetch('/api/incidents')
-        .then(response => response.json())
+    // Load incidents data and create map overview. The browser revalidates
+    // with the stored ETag; an unchanged feed is left as it is on screen.
+    fetch('/api/incidents?format=columnar', { cache: 'no-cache' })
+        .then(response => {
+            const etag = response.headers.get('ETag');
+            if (etag && etag === overviewEtag) {
+                return null;
+            }
+            overviewEtag = etag;
+            return response.json();
+        })
         .then(data => {
+            if (!data) {
+                return;
+            }
             const mapContainer = document.getElementById('googleMapsOverview');
             if (mapContainer) {
-                mapContainer.innerHTML = createIncidentsMapOverview(data.incidents || []);
+                mapContainer.innerHTML = createIncidentsMapOverview(data.incidents ? decodeColumns(data.incidents) : []);
             }
         })
         .catch(error => {
@@ -230,14 +243,37 @@ function initializeGoogleMapsIntegration() {
 }
 
 /**
- * Auto-refresh map overview every 30 seconds
+ * Keep the map overview current: reload on pushed incident changes, or
+ * poll every 30 seconds when no event stream is available
  */
 function startMapOverviewRefresh() {
-    setInterval(() => {
-        if (!document.hidden) {
-            initializeGoogleMapsIntegration();
+    let pollTimer = null;
+    const startPolling = () => {
+        if (!pollTimer) {
+            pollTimer = setInterval(() => {
+                if (!document.hidden) {
+                    initializeGoogleMapsIntegration();
+                }
+            }, 30000);
         }
-    }, 30000);
+    };
+    
+    if (window.CrisisMS && window.CrisisMS.isEventStreamConnected()) {
+        let reloadTimer = null;
+        document.addEventListener('crisis:change', event => {
+            if (event.detail.kind.startsWith('incident_')) {
+                clearTimeout(reloadTimer);
+                reloadTimer = setTimeout(initializeGoogleMapsIntegration, 1000);
+            }
+        });
+        document.addEventListener('crisis:resync', () => {
+            clearTimeout(reloadTimer);
+            reloadTimer = setTimeout(initializeGoogleMapsIntegration, 1000);
+        });
+        document.addEventListener('crisis:stream-closed', startPolling);
+    } else {
+        startPolling();
+    }
 }
 
 // Initialize when page loads
@@ -11,6 +11,9 @@ document.addEventListener('DOMContentLoaded', function() {
     // Initialize form validation
     initializeFormValidation();
     
+    // Subscribe to server-pushed change events
+    initializeEventStream();
+    
     // Initialize auto-refresh for real-time updates
     initializeAutoRefresh();
     
@@ -67,21 +70,164 @@ function initializeFormValidation() {
     });
 }
 
+/**
+ * Event kinds pushed by /api/events/stream. Besides these, 'resync' tells a
+ * client that missed too many changes to reload what it shows.
+ */
+const CHANGE_EVENT_KINDS = [
+    'incident_created',
+    'incident_status',
+    'incident_assigned',
+    'incident_deleted',
+    'status_update',
+    'resource_changed'
+];
+
+let eventSource = null;
+let eventStreamActive = false;
+
+/**
+ * Subscribe to the server-sent event stream on pages that ask for it
+ * (data-event-stream on the body). Each change is re-dispatched on the
+ * document as a 'crisis:change' event, and a resync as 'crisis:resync'; if
+ * the stream is closed for good, 'crisis:stream-closed' is dispatched so
+ * pages can fall back to polling.
+ *
+ * The tabs of one user share a single connection: the tab holding the
+ * user's Web Lock opens the stream and relays every event to the others
+ * over a BroadcastChannel. When that tab closes its lock passes to another
+ * one, which reconnects from the last event the tabs saw. Browsers without
+ * Web Locks or BroadcastChannel open a stream per tab.
+ */
+function initializeEventStream() {
+    const streamUrl = document.body.dataset.eventStream;
+    if (!streamUrl || !window.EventSource) {
+        return;
+    }
+    eventStreamActive = true;
+    
+    if (!window.BroadcastChannel || !navigator.locks) {
+        openEventSource(streamUrl, dispatchChange, closeEventStream);
+        return;
+    }
+    
+    const channelName = 'crisis-events-' + document.body.dataset.eventChannel;
+    const channel = new BroadcastChannel(channelName);
+    const stopWaiting = new AbortController();
+    let lastEventId = null;
+    
+    channel.onmessage = function(message) {
+        if (message.data.type === 'change') {
+            lastEventId = message.data.detail.id;
+            dispatchChange(message.data.detail);
+        } else if (message.data.type === 'closed') {
+            stopWaiting.abort();
+            closeEventStream();
+        }
+    };
+    
+    navigator.locks.request(channelName, { signal: stopWaiting.signal }, function() {
+        // Hold the lock, and with it the connection, until the stream closes or the tab goes away
+        return new Promise(function(release) {
+            const url = lastEventId === null ? streamUrl : streamUrl + '?last_event_id=' + lastEventId;
+            openEventSource(url, function(detail) {
+                lastEventId = detail.id;
+                channel.postMessage({ type: 'change', detail: detail });
+                dispatchChange(detail);
+            }, function() {
+                channel.postMessage({ type: 'closed' });
+                closeEventStream();
+                release();
+            });
+        });
+    }).catch(function() {
+        // The request was aborted because the stream closed in another tab
+    });
+}
+
+/**
+ * Open an EventSource on `url`, passing each change to onChange and calling
+ * onClosed once if the browser gives up on it
+ */
+function openEventSource(url, onChange, onClosed) {
+    eventSource = new EventSource(url);
+    
+    CHANGE_EVENT_KINDS.concat(['resync']).forEach(function(kind) {
+        eventSource.addEventListener(kind, function(event) {
+            onChange(JSON.parse(event.data));
+        });
+    });
+    
+    // EventSource reconnects by itself after network errors; CLOSED means it gave up
+    eventSource.onerror = function() {
+        if (eventSource && eventSource.readyState === EventSource.CLOSED) {
+            eventSource = null;
+            onClosed();
+        }
+    };
+}
+
+function dispatchChange(detail) {
+    const type = detail.kind === 'resync' ? 'crisis:resync' : 'crisis:change';
+    document.dispatchEvent(new CustomEvent(type, { detail: detail }));
+}
+
+function closeEventStream() {
+    if (!eventStreamActive) {
+        return;
+    }
+    eventStreamActive = false;
+    document.dispatchEvent(new CustomEvent('crisis:stream-closed'));
+}
+
+/**
+ * Whether change events are being pushed to this page, by its own
+ * connection or relayed from another tab
+ */
+function isEventStreamConnected() {
+    return eventStreamActive;
+}
+
 /**
  * Initialize auto-refresh for real-time updates
+ *
+ * With the event stream connected, [data-auto-refresh] elements refresh when
+ * a matching change arrives (optionally limited by data-refresh-on, a comma
+ * separated list of event kinds). Without it they poll at the interval in
+ * data-auto-refresh.
  */
 function initializeAutoRefresh() {
     const autoRefreshElements = document.querySelectorAll('[data-auto-refresh]');
     
     autoRefreshElements.forEach(function(element) {
         const interval = parseInt(element.dataset.autoRefresh) || 30000; // Default 30 seconds
+        const kinds = element.dataset.refreshOn ? element.dataset.refreshOn.split(',') : CHANGE_EVENT_KINDS;
+        let pollTimer = null;
         
-        setInterval(function() {
+        const refreshWhenIdle = debounce(function() {
             // Only refresh if the page is visible and user is not interacting with forms
             if (document.visibilityState === 'visible' && !isUserInteracting()) {
                 refreshElement(element);
             }
-        }, interval);
+        }, 1000);
+        
+        const startPolling = function() {
+            if (!pollTimer) {
+                pollTimer = setInterval(refreshWhenIdle, interval);
+            }
+        };
+        
+        if (isEventStreamConnected()) {
+            document.addEventListener('crisis:change', function(event) {
+                if (kinds.includes(event.detail.kind)) {
+                    refreshWhenIdle();
+                }
+            });
+            document.addEventListener('crisis:resync', refreshWhenIdle);
+            document.addEventListener('crisis:stream-closed', startPolling);
+        } else {
+            startPolling();
+        }
     });
 }
 
@@ -100,33 +246,73 @@ function isUserInteracting() {
 
 /**
  * Refresh specific element content
+ *
+ * Elements with data-refresh-url are replaced by the HTML fragment that URL
+ * returns. Others fall back to fetching the whole page and picking out the
+ * matching element.
  */
 function refreshElement(element) {
-    const url = element.dataset.refreshUrl || window.location.href;
+    const fragmentUrl = element.dataset.refreshUrl;
     
-    fetch(url, {
+    fetch(fragmentUrl || window.location.href, {
         headers: {
             'X-Requested-With': 'XMLHttpRequest'
         }
     })
-    .then(response => response.text())
+    .then(response => {
+        // A redirect means the session expired or the role changed; leave the content alone
+        if (!response.ok || response.redirected) {
+            throw new Error(`Unexpected response: ${response.status}`);
+        }
+        return response.text();
+    })
     .then(html => {
-        const parser = new DOMParser();
-        const doc = parser.parseFromString(html, 'text/html');
-        const newElement = doc.querySelector(`[data-auto-refresh="${element.dataset.autoRefresh}"]`);
-        
-        if (newElement) {
+        if (fragmentUrl) {
+            element.innerHTML = html;
+        } else {
+            const parser = new DOMParser();
+            const doc = parser.parseFromString(html, 'text/html');
+            const newElement = doc.querySelector(`[data-auto-refresh="${element.dataset.autoRefresh}"]`);
+            if (!newElement) {
+                return;
+            }
             element.innerHTML = newElement.innerHTML;
-            // Re-initialize components for the refreshed content
-            initializeTooltips();
-            initializeConfirmationDialogs();
         }
+        
+        // Re-initialize components for the refreshed content
+        initializeTooltips();
+        initializeConfirmationDialogs();
     })
     .catch(error => {
         console.error('Auto-refresh failed:', error);
     });
 }
 
+/**
+ * Decode a columnar table from the compact API format into an array of
+ * objects. Dictionary-encoded fields are mapped back to their values and
+ * created_at epoch seconds to ISO strings.
+ */
+function decodeColumns(table) {
+    const columns = table.columns;
+    const dictionaries = table.dictionaries || {};
+    const fields = Object.keys(columns);
+    const rows = new Array(table.count);
+    
+    for (let i = 0; i < table.count; i++) {
+        const row = {};
+        fields.forEach(field => {
+            const value = columns[field][i];
+            row[field] = dictionaries[field] ? dictionaries[field][value] : value;
+        });
+        if (typeof row.created_at === 'number') {
+            row.created_at = new Date(row.created_at * 1000).toISOString();
+        }
+        rows[i] = row;
+    }
+    return rows;
+}
+
 /**
  * Initialize image preview functionality
  */
@@ -432,6 +618,8 @@ window.addEventListener('offline', function() {
 // Export functions for global use
 window.CrisisMS = {
     showNotification,
+    isEventStreamConnected,
+    decodeColumns,
     copyToClipboard,
     printPage,
     exportTableAsCSV,
@@ -6,6 +6,13 @@
 let map = null;
 let markers = [];
 let incidentData = [];
+let incidentMarkers = {};   // incident id -> marker, for incremental updates
+let feedCursor = null;      // watermark from the last /api/incidents response
+let feedBBox = null;        // viewport the cursor belongs to
+let clusterMarkers = [];
+
+// Below this zoom level the map shows server-side clusters instead of markers
+const CLUSTER_MAX_ZOOM = 13;
 
 /**
  * Initialize map with OpenStreetMap (free alternative to Google Maps)
@@ -51,25 +58,29 @@ function initializeMap(containerId, options = {}) {
         addMapControls();
     }
     
+    // Reload the incidents in view whenever the viewport changes
+    map.on('moveend', debounceMapRefresh);
+    
     return map;
 }
 
 /**
  * Add incidents as markers on the map
  */
-function addIncidentsToMap(incidents) {
+function addIncidentsToMap(incidents, fitBounds = true) {
     incidentData = incidents;
     
     incidents.forEach(incident => {
         if (incident.latitude && incident.longitude) {
             const marker = createIncidentMarker(incident);
             markers.push(marker);
+            incidentMarkers[incident.id] = marker;
             marker.addTo(map);
         }
     });
     
     // Fit map to show all markers if there are any
-    if (markers.length > 0) {
+    if (fitBounds && markers.length > 0) {
         const group = new L.featureGroup(markers);
         map.fitBounds(group.getBounds().pad(0.1));
     }
@@ -84,6 +95,11 @@ function createIncidentMarker(incident) {
     const marker = L.marker([incident.latitude, incident.longitude], { icon })
         .bindPopup(createIncidentPopup(incident));
     
+    // The compact feed leaves descriptions out; load one when its popup opens
+    if (incident.description === undefined) {
+        marker.on('popupopen', () => loadIncidentDescription(incident, marker));
+    }
+    
     return marker;
 }
 
@@ -148,7 +164,7 @@ function createIncidentPopup(incident) {
     return `
         <div class="incident-popup">
             <h6 class="mb-2"><strong>${incident.title}</strong></h6>
-            <p class="mb-2 small">${incident.description}</p>
+            <p class="mb-2 small">${incident.description === undefined ? '<span class="text-muted">Loading…</span>' : incident.description}</p>
             <div class="mb-2">
                 <span class="badge ${statusClass} me-1">${incident.status}</span>
                 <span class="badge ${priorityClass}">${incident.priority}</span>
@@ -163,6 +179,25 @@ function createIncidentPopup(incident) {
     `;
 }
 
+/**
+ * Fetch an incident's description and redraw its open popup
+ */
+function loadIncidentDescription(incident, marker) {
+    if (incident.description !== undefined) {
+        return;
+    }
+    
+    fetch(`/api/incidents/${incident.id}/description`)
+        .then(response => response.json())
+        .then(data => {
+            incident.description = data.description || '';
+            marker.setPopupContent(createIncidentPopup(incident));
+        })
+        .catch(error => {
+            console.error('Error loading incident description:', error);
+        });
+}
+
 /**
  * Add resources as markers on the map
  */
@@ -295,24 +330,123 @@ function addMapControls() {
     };
     
     refreshControl.addTo(map);
+    
+    // Add heatmap toggle
+    const heatmapControl = L.control({ position: 'topleft' });
+    
+    heatmapControl.onAdd = function(map) {
+        const div = L.DomUtil.create('div', 'map-heatmap-control');
+        div.innerHTML = `
+            <button class="btn btn-sm btn-secondary mt-1" onclick="toggleHeatmap()" title="Incident Density">
+                <i class="fas fa-fire"></i>
+            </button>
+        `;
+        return div;
+    };
+    
+    heatmapControl.addTo(map);
 }
 
 /**
- * Refresh map data
+ * Build the incidents API URL for the current map viewport
  */
-function refreshMapData() {
-    // Clear existing markers
-    markers.forEach(marker => {
+function getIncidentsUrl(cursor = null) {
+    const params = new URLSearchParams();
+    if (map) {
+        params.set('bbox', map.getBounds().toBBoxString());
+    }
+    if (cursor) {
+        params.set('cursor', cursor);
+    }
+    params.set('format', 'columnar');
+    return `/api/incidents?${params.toString()}`;
+}
+
+let mapRefreshTimer = null;
+
+/**
+ * Refresh map data shortly after the user stops panning or zooming
+ */
+function debounceMapRefresh() {
+    clearTimeout(mapRefreshTimer);
+    mapRefreshTimer = setTimeout(refreshMapData, 300);
+}
+
+/**
+ * Remove an incident marker from the map
+ */
+function removeIncidentMarker(incidentId) {
+    const marker = incidentMarkers[incidentId];
+    if (marker) {
         map.removeLayer(marker);
+        markers = markers.filter(m => m !== marker);
+        delete incidentMarkers[incidentId];
+    }
+    incidentData = incidentData.filter(incident => incident.id !== incidentId);
+}
+
+/**
+ * Apply a delta response: replace changed incidents and drop removed ones
+ */
+function applyIncidentChanges(changed, removed) {
+    removed.forEach(removeIncidentMarker);
+    changed.forEach(incident => {
+        removeIncidentMarker(incident.id);
+        if (incident.latitude && incident.longitude) {
+            const marker = createIncidentMarker(incident);
+            markers.push(marker);
+            incidentMarkers[incident.id] = marker;
+            marker.addTo(map);
+        }
+        incidentData.push(incident);
     });
-    markers = [];
+}
+
+/**
+ * Replace every incident marker with a fresh snapshot
+ */
+function replaceIncidents(incidents) {
+    Object.keys(incidentMarkers).forEach(id => removeIncidentMarker(Number(id)));
+    addIncidentsToMap(incidents, false);
+}
+
+/**
+ * Refresh map data
+ *
+ * The first load for a viewport fetches a snapshot; later polls send the
+ * cursor from the previous response and only receive what changed. An
+ * unchanged feed is revalidated by the browser with a 304.
+ */
+function refreshMapData() {
+    if (map && map.getZoom() < CLUSTER_MAX_ZOOM) {
+        refreshClusters();
+        return;
+    }
+    clearClusters();
+    
+    const bbox = map ? map.getBounds().toBBoxString() : null;
+    const cursor = bbox === feedBBox ? feedCursor : null;
     
-    // Reload incidents data
-    fetch('/api/incidents')
+    fetch(getIncidentsUrl(cursor), { cache: 'no-cache' })
         .then(response => response.json())
         .then(data => {
-            if (data.incidents) {
-                addIncidentsToMap(data.incidents);
+            if (!data.incidents) {
+                return;
+            }
+            
+            const incidents = decodeColumns(data.incidents);
+            if (cursor) {
+                applyIncidentChanges(incidents, data.removed || []);
+            } else {
+                replaceIncidents(incidents);
+            }
+            
+            feedCursor = data.cursor;
+            feedBBox = bbox;
+            
+            // Keep paging while a large batch of changes is still pending
+            if (data.has_more) {
+                refreshMapData();
             }
         })
         .catch(error => {
@@ -320,6 +454,214 @@ function refreshMapData() {
         });
 }
 
+/**
+ * Remove all cluster markers from the map
+ */
+function clearClusters() {
+    clusterMarkers.forEach(marker => map.removeLayer(marker));
+    clusterMarkers = [];
+}
+
+/**
+ * Load pre-aggregated clusters for the current zoom and viewport
+ */
+function refreshClusters() {
+    const params = new URLSearchParams({
+        zoom: map.getZoom(),
+        bbox: map.getBounds().toBBoxString()
+    });
+    
+    fetch(`/api/incidents/clusters?${params.toString()}`, { cache: 'no-cache' })
+        .then(response => response.json())
+        .then(data => {
+            if (!data.clusters) {
+                return;
+            }
+            
+            // Individual markers are replaced by clusters at this zoom
+            Object.keys(incidentMarkers).forEach(id => removeIncidentMarker(Number(id)));
+            feedBBox = null;
+            clearClusters();
+            
+            data.clusters.forEach(cluster => {
+                const marker = createClusterMarker(cluster);
+                clusterMarkers.push(marker);
+                marker.addTo(map);
+            });
+        })
+        .catch(error => {
+            console.error('Error loading incident clusters:', error);
+        });
+}
+
+/**
+ * Create a cluster marker sized by count and coloured by its worst priority
+ */
+function createClusterMarker(cluster) {
+    const priorityColors = {
+        'critical': 'red',
+        'high': 'orange',
+        'medium': 'gold',
+        'low': 'green'
+    };
+    const color = priorityColors[cluster.worst_priority] || 'blue';
+    const size = Math.min(28 + Math.round(Math.log10(cluster.count) * 12), 64);
+    
+    const icon = L.divIcon({
+        className: 'custom-cluster-icon',
+        iconSize: [size, size],
+        iconAnchor: [size / 2, size / 2],
+        html: `<div style="
+            background-color: ${color};
+            width: ${size}px;
+            height: ${size}px;
+            border-radius: 50%;
+            border: 3px solid white;
+            display: flex;
+            align-items: center;
+            justify-content: center;
+            font-weight: bold;
+            color: white;
+            box-shadow: 0 2px 6px rgba(0,0,0,0.3);
+        ">${cluster.count}</div>`
+    });
+    
+    const statusLines = Object.entries(cluster.by_status)
+        .map(([status, count]) => `<span class="badge ${getStatusClass(status)} me-1">${status}: ${count}</span>`)
+        .join('');
+    
+    const marker = L.marker([cluster.latitude, cluster.longitude], { icon })
+        .bindPopup(`
+            <div class="cluster-popup">
+                <h6 class="mb-2"><strong>${cluster.count} incidents</strong></h6>
+                <div class="mb-2">${statusLines}</div>
+                <p class="mb-0 small"><strong>Worst priority:</strong> ${cluster.worst_priority}</p>
+            </div>
+        `);
+    
+    // Zooming into a cluster reveals the clusters or markers inside it
+    marker.on('dblclick', () => map.setView([cluster.latitude, cluster.longitude], map.getZoom() + 2));
+    
+    return marker;
+}
+
+/**
+ * Incident density heatmap
+ *
+ * Tiles come from /api/incidents/heatmap/{z}/{x}/{y} as sparse grids of
+ * counts and are painted onto canvases. Colours use a log scale against
+ * the busiest cell seen so far, so neighbouring tiles stay comparable.
+ */
+let heatmapLayer = null;
+let heatmapFilters = { types: [], window: 0 };  // window in hours, 0 for all time
+let heatmapScale = 1;
+const heatmapTiles = new Map();  // "z/x/y" -> { canvas, coords } for tiles on screen
+
+function getHeatmapUrl(coords) {
+    const params = new URLSearchParams();
+    if (heatmapFilters.types.length) {
+        params.set('type', heatmapFilters.types.join(','));
+    }
+    if (heatmapFilters.window) {
+        params.set('window', heatmapFilters.window);
+    }
+    return `/api/incidents/heatmap/${coords.z}/${coords.x}/${coords.y}?${params.toString()}`;
+}
+
+function heatColor(intensity) {
+    // Blue through yellow to red, more opaque as density grows
+    const hue = Math.round(240 * (1 - intensity));
+    return `hsla(${hue}, 100%, 50%, ${0.25 + 0.6 * intensity})`;
+}
+
+function drawHeatmapTile(canvas, tile) {
+    const ctx = canvas.getContext('2d');
+    const cellSize = canvas.width / tile.bins;
+    heatmapScale = Math.max(heatmapScale, tile.max);
+    const logScale = Math.log1p(heatmapScale);
+    
+    ctx.clearRect(0, 0, canvas.width, canvas.height);
+    tile.cells.forEach((cell, i) => {
+        const row = Math.floor(cell / tile.bins);
+        const column = cell % tile.bins;
+        ctx.fillStyle = heatColor(Math.log1p(tile.counts[i]) / logScale);
+        ctx.fillRect(column * cellSize, row * cellSize, cellSize, cellSize);
+    });
+}
+
+function loadHeatmapTile(canvas, coords) {
+    return fetch(getHeatmapUrl(coords), { cache: 'no-cache' })
+        .then(response => response.json())
+        .then(tile => {
+            if (tile.error) {
+                throw new Error(tile.error);
+            }
+            drawHeatmapTile(canvas, tile);
+        });
+}
+
+function createHeatmapLayer() {
+    const HeatmapLayer = L.GridLayer.extend({
+        createTile: function(coords, done) {
+            const canvas = L.DomUtil.create('canvas', 'heatmap-tile');
+            const size = this.getTileSize();
+            canvas.width = size.x;
+            canvas.height = size.y;
+            heatmapTiles.set(`${coords.z}/${coords.x}/${coords.y}`, { canvas, coords });
+            
+            loadHeatmapTile(canvas, coords)
+                .then(() => done(null, canvas))
+                .catch(error => done(error, canvas));
+            return canvas;
+        }
+    });
+    
+    const layer = new HeatmapLayer({ opacity: 0.7, zIndex: 300 });
+    layer.on('tileunload', event => {
+        heatmapTiles.delete(`${event.coords.z}/${event.coords.x}/${event.coords.y}`);
+    });
+    return layer;
+}
+
+/**
+ * Show or hide the heatmap layer
+ */
+function toggleHeatmap(show = !heatmapLayer) {
+    if (!map) {
+        return;
+    }
+    if (show && !heatmapLayer) {
+        heatmapLayer = createHeatmapLayer().addTo(map);
+    } else if (!show && heatmapLayer) {
+        map.removeLayer(heatmapLayer);
+        heatmapLayer = null;
+        heatmapTiles.clear();
+    }
+}
+
+/**
+ * Filter the heatmap by incident types and a time window in hours
+ */
+function setHeatmapFilters(filters = {}) {
+    heatmapFilters = { ...heatmapFilters, ...filters };
+    heatmapScale = 1;
+    if (heatmapLayer) {
+        heatmapLayer.redraw();
+    }
+}
+
+/**
+ * Repaint the heatmap tiles on screen in place. The browser revalidates
+ * each tile, so unchanged ones cost a 304.
+ */
+function refreshHeatmap() {
+    heatmapTiles.forEach(({ canvas, coords }) => {
+        loadHeatmapTile(canvas, coords).catch(error => {
+            console.error('Error refreshing heatmap tile:', error);
+        });
+    });
+}
+
 /**
  * Filter incidents on map by type or status
  */
@@ -329,6 +671,8 @@ function filterMapIncidents(filterType, filterValue) {
         map.removeLayer(marker);
     });
     markers = [];
+    incidentMarkers = {};
+    feedBBox = null;  // the next refresh reloads a full snapshot
     
     // Filter incidents based on criteria
     const filteredIncidents = incidentData.filter(incident => {
@@ -340,7 +684,7 @@ function filterMapIncidents(filterType, filterValue) {
     });
     
     // Add filtered incidents to map
-    addIncidentsToMap(filteredIncidents);
+    addIncidentsToMap(filteredIncidents, false);
 }
 
 /**
@@ -381,14 +725,49 @@ function formatDateTime(dateString) {
 }
 
 /**
- * Auto-refresh map data every 30 seconds
+ * Keep the map current
+ *
+ * When the page receives pushed change events (see main.js), the map pulls
+ * a delta after each incident change. Otherwise, or once the stream has
+ * closed, it falls back to polling every `interval` milliseconds.
  */
 function startMapAutoRefresh(interval = 30000) {
-    setInterval(() => {
-        if (map && !document.hidden) {
-            refreshMapData();
+    let pollTimer = null;
+    const startPolling = () => {
+        if (!pollTimer) {
+            pollTimer = setInterval(() => {
+                if (map && !document.hidden) {
+                    refreshMapData();
+                    if (heatmapLayer) {
+                        refreshHeatmap();
+                    }
+                }
+            }, interval);
         }
-    }, interval);
+    };
+    
+    if (window.CrisisMS && window.CrisisMS.isEventStreamConnected()) {
+        document.addEventListener('crisis:change', event => {
+            if (map && event.detail.kind.startsWith('incident_')) {
+                debounceMapRefresh();
+            }
+            // Density only changes when incidents come or go
+            if (heatmapLayer && ['incident_created', 'incident_deleted'].includes(event.detail.kind)) {
+                refreshHeatmap();
+            }
+        });
+        document.addEventListener('crisis:resync', () => {
+            if (map) {
+                debounceMapRefresh();
+            }
+            if (heatmapLayer) {
+                refreshHeatmap();
+            }
+        });
+        document.addEventListener('crisis:stream-closed', startPolling);
+    } else {
+        startPolling();
+    }
 }
 
 /**
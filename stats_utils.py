@@ -0,0 +1,105 @@
+"""
+Dashboard statistics.
+
+The admin dashboard figures come from one aggregate query: a single pass
+over incidents with conditional counts, plus user and resource counts as
+scalar subqueries in the same statement.
+
+The result is kept as a snapshot shared by every request in the process.
+An after-commit hook drops it whenever a session commits a change to an
+Incident, User or Resource, so a page load with no writes in between runs
+no aggregate at all. Writes made by other worker processes are picked up
+through the change_events version (incidents and resources) or after
+SNAPSHOT_MAX_AGE (users).
+"""
+import threading
+import time
+from itertools import chain
+from sqlalchemy import and_, case, event, func, select
+from sqlalchemy.orm import Session
+from app import db
+from models import Incident, Resource, User
+from cache_utils import data_version
+
+SNAPSHOT_MAX_AGE = 60  # seconds
+
+INCIDENT_STATUSES = ('pending', 'in_progress', 'resolved', 'closed')
+HIGH_PRIORITIES = ('high', 'critical')
+OPEN_STATUSES = ('pending', 'in_progress')
+
+class Snapshot:
+    """A computed value shared across requests until it is invalidated"""
+
+    def __init__(self, compute, max_age=SNAPSHOT_MAX_AGE):
+        self.compute = compute
+        self.max_age = max_age
+        self.value = None
+        self.version = None
+        self.computed_at = 0.0
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def get(self):
+        version = data_version()
+        with self.lock:
+            if (self.value is not None and self.version == version
+                    and time.monotonic() - self.computed_at < self.max_age):
+                return self.value
+            generation = self.generation
+
+        value = self.compute()
+        with self.lock:
+            # Don't keep a result that a commit made stale while it was computed
+            if self.generation == generation:
+                self.value = value
+                self.version = version
+                self.computed_at = time.monotonic()
+        return value
+
+    def invalidate(self):
+        with self.lock:
+            self.generation += 1
+            self.value = None
+
+def _count_where(condition):
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+def compute_admin_stats():
+    """Compute the admin dashboard stats with a single aggregate query"""
+    stmt = select(
+        select(func.count(User.id)).where(User.role == 'user').scalar_subquery().label('total_users'),
+        select(func.count(User.id)).where(User.role == 'rescue_team').scalar_subquery().label('total_rescue_teams'),
+        select(func.count(Resource.id)).scalar_subquery().label('total_resources'),
+        func.count(Incident.id).label('total_incidents'),
+        *[_count_where(Incident.status == status).label(status) for status in INCIDENT_STATUSES],
+        _count_where(and_(Incident.priority.in_(HIGH_PRIORITIES),
+                          Incident.status.in_(OPEN_STATUSES))).label('high_priority_incidents')
+    ).select_from(Incident)
+    row = db.session.execute(stmt).one()
+
+    return {
+        'total_users': row.total_users,
+        'total_rescue_teams': row.total_rescue_teams,
+        'total_incidents': row.total_incidents,
+        'total_resources': row.total_resources,
+        'high_priority_incidents': row.high_priority_incidents,
+        'incident_stats': {status: getattr(row, status) for status in INCIDENT_STATUSES}
+    }
+
+admin_stats = Snapshot(compute_admin_stats)
+
+SNAPSHOT_MODELS = (Incident, User, Resource)
+
+@event.listens_for(Session, 'after_flush')
+def note_snapshot_changes(session, flush_context):
+    if any(isinstance(obj, SNAPSHOT_MODELS) for obj in chain(session.new, session.dirty, session.deleted)):
+        session.info['stats_changed'] = True
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_snapshots(session):
+    if session.info.pop('stats_changed', False):
+        admin_stats.invalidate()
+
+@event.listens_for(Session, 'after_rollback')
+def discard_snapshot_changes(session):
+    session.info.pop('stats_changed', None)
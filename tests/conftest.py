@@ -0,0 +1,35 @@
+"""
+The app is built against a throwaway SQLite database and the in-memory image
+store. The environment has to be set before app is imported, since importing
+it builds the application.
+"""
+import os
+import tempfile
+import pytest
+
+_handle, DATABASE_PATH = tempfile.mkstemp(prefix='crisis-test-', suffix='.db')
+os.close(_handle)
+os.environ['DATABASE_URL'] = f'sqlite:///{DATABASE_PATH}'
+os.environ['MONGODB_URI'] = 'mongodb://localhost:1/crisis_test?serverSelectionTimeoutMS=200'
+os.environ['IMAGE_STORAGE'] = 'memory'
+
+# Import the app before any test module imports models
+from app import app as flask_app, db  # noqa: E402
+
+@pytest.fixture(scope='session')
+def app():
+    flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    return flask_app
+
+@pytest.fixture
+def session(app):
+    with app.app_context():
+        yield db.session
+        db.session.rollback()
+
+@pytest.fixture
+def admin_client(app):
+    client = app.test_client()
+    with client.session_transaction() as flask_session:
+        flask_session['_user_id'] = '1'  # the default admin create_app adds
+    return client
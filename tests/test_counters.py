@@ -0,0 +1,40 @@
+from models import Incident, User
+from counter_utils import incident_counts, rebuild_incident_counters
+
+def _user(session, name, role):
+    user = User(username=name, email=f'{name}@crisis.test', password_hash='x', role=role, full_name=name)
+    session.add(user)
+    session.commit()
+    return user
+
+def test_counters_follow_status_changes_and_assignments(session):
+    reporter = _user(session, 'counter_reporter', 'user')
+    team = _user(session, 'counter_team', 'rescue_team')
+    other_team = _user(session, 'counter_other_team', 'rescue_team')
+    incidents = [Incident(title=f'Fire {i}', description='Smoke', incident_type='fire', priority='high',
+                          address='7 Mill Rd', reported_by=reporter.id) for i in range(3)]
+    session.add_all(incidents)
+    session.commit()
+
+    incidents[0].assigned_team_id = team.id
+    incidents[0].status = 'in_progress'
+    incidents[1].assigned_team_id = team.id
+    session.commit()
+    incidents[0].status = 'resolved'
+    incidents[1].assigned_team_id = other_team.id
+    session.delete(incidents[2])
+    session.commit()
+
+    expected = {
+        ('reporter', reporter.id): {'resolved': 1, 'pending': 1, 'total': 2},
+        ('team', team.id): {'resolved': 1, 'total': 1},
+        ('team', other_team.id): {'pending': 1, 'total': 1},
+    }
+    # Counters that fell to zero stay behind as zero rows
+    counts = {owner: {status: count for status, count in incident_counts(*owner).items() if count}
+              for owner in expected}
+    assert counts == expected
+
+    # The incremental counters agree with a rebuild from the incidents table
+    rebuild_incident_counters()
+    assert {owner: incident_counts(*owner) for owner in expected} == expected
@@ -0,0 +1,52 @@
+import json
+import pytest
+from sqlalchemy import func
+from models import ChangeEvent
+import event_stream
+from event_stream import event_stream as stream
+
+def _log(session, event_id):
+    session.add(ChangeEvent(id=event_id, kind='resource_changed', payload=json.dumps({})))
+    session.commit()
+
+@pytest.fixture(autouse=True)
+def short_heartbeat(monkeypatch):
+    monkeypatch.setattr(event_stream, 'HEARTBEAT_INTERVAL', 3)
+
+def _next_event(events):
+    """The next event the stream sends, or None if it goes idle first"""
+    for chunk in events:
+        if chunk.startswith(': keepalive'):
+            return None
+        if chunk.startswith('id: '):
+            lines = dict(line.split(': ', 1) for line in chunk.strip().split('\n'))
+            return int(lines['id']), lines['event']
+
+def test_replay_lets_a_late_gap_through(app, session):
+    start = (session.query(func.max(ChangeEvent.id)).scalar() or 0) + 100
+    _log(session, start + 1)
+    _log(session, start + 3)  # start + 2 belongs to a transaction still open
+
+    events = stream(app, 1, 'admin', start)
+    try:
+        assert _next_event(events) == (start + 1, 'resource_changed')
+        assert _next_event(events) == (start + 3, 'resource_changed')
+
+        _log(session, start + 2)
+        assert _next_event(events) == (start + 2, 'resource_changed')
+    finally:
+        events.close()
+
+def test_replay_past_the_limit_asks_for_a_resync(app, session, monkeypatch):
+    monkeypatch.setattr(event_stream, 'REPLAY_LIMIT', 2)
+    start = (session.query(func.max(ChangeEvent.id)).scalar() or 0) + 100
+    for offset in (1, 2, 3):
+        _log(session, start + offset)
+
+    events = stream(app, 1, 'admin', start)
+    try:
+        assert _next_event(events) == (start + 1, 'resource_changed')
+        assert _next_event(events) == (start + 2, 'resource_changed')
+        assert _next_event(events) == (start + 3, 'resync')
+    finally:
+        events.close()
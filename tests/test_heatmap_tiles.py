@@ -0,0 +1,52 @@
+import json
+from sqlalchemy import func
+from models import ChangeEvent
+from heatmap_utils import TileCache, tile_for
+
+POINT = (12.97, 77.59)
+
+def _event(session, event_id, kind='incident_created'):
+    session.add(ChangeEvent(id=event_id, kind=kind, payload=json.dumps({'latitude': POINT[0], 'longitude': POINT[1]})))
+    session.commit()
+
+def _key(z=10):
+    return (z, *tile_for(*POINT, z), ((), None, 0))
+
+def _sync(cache):
+    cache.synced_at = 0.0
+    return cache.sync()
+
+def test_events_are_applied_once_and_late_ids_are_caught(session, monkeypatch):
+    invalidated = []
+    monkeypatch.setattr(TileCache, '_invalidate_point',
+                        lambda self, latitude, longitude: invalidated.append((latitude, longitude)))
+    cache = TileCache()
+    start = (session.query(func.max(ChangeEvent.id)).scalar() or 0) + 100
+    cache.last_event_id = start
+
+    # start + 1 is allocated to a transaction that hasn't committed yet
+    _event(session, start + 2)
+    _sync(cache)
+    _sync(cache)
+    assert len(invalidated) == 1
+    assert start + 1 in cache.pending_gaps
+
+    _event(session, start + 1)
+    _sync(cache)
+    _sync(cache)
+    assert len(invalidated) == 2
+    assert not cache.pending_gaps
+
+def test_tile_computed_across_an_event_is_not_cached(session):
+    cache = TileCache()
+    cache.last_event_id = (session.query(func.max(ChangeEvent.id)).scalar() or 0)
+    built_from = _sync(cache)
+
+    # An incident inside the tile is created while the tile is computed
+    _event(session, cache.last_event_id + 1)
+    _sync(cache)
+    cache.set(_key(), {'cells': []}, built_from)
+    assert cache.get(_key()) is None
+
+    cache.set(_key(), {'cells': [1]}, _sync(cache))
+    assert cache.get(_key())[0] == {'cells': [1]}
@@ -0,0 +1,34 @@
+import pytest
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from models import ChangeEvent, Incident, User
+from counter_utils import incident_counts
+
+def _incident(reporter_id, title='Gas leak'):
+    return Incident(title=title, description='Smell of gas', incident_type='utility', priority='high',
+                    address='1 Main St', reported_by=reporter_id)
+
+def test_failed_flush_is_not_applied_again(session):
+    reporter = User(username='changes_reporter', email='changes@crisis.test', password_hash='x',
+                    role='user', full_name='Reporter')
+    session.add(reporter)
+    session.commit()
+    session.add(_incident(reporter.id))
+    session.commit()
+    events_before = session.query(func.count(ChangeEvent.id)).scalar()
+
+    # The incident insert runs, then the duplicate username fails the flush
+    session.add(_incident(reporter.id, 'Lost'))
+    session.add(User(username='changes_reporter', email='other@crisis.test', password_hash='x',
+                     role='user', full_name='Duplicate'))
+    with pytest.raises(IntegrityError):
+        session.commit()
+    session.rollback()
+
+    session.add(_incident(reporter.id, 'Kept'))
+    session.commit()
+
+    rows = session.query(Incident).filter_by(reported_by=reporter.id).count()
+    assert rows == 2
+    assert incident_counts('reporter', reporter.id) == {'pending': 2, 'total': 2}
+    assert session.query(func.count(ChangeEvent.id)).scalar() == events_before + 1
@@ -0,0 +1,26 @@
+import json
+from models import Incident, User
+
+def _ndjson(response):
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+def test_export_applies_type_and_search(session, admin_client):
+    reporter = User(username='export_reporter', email='export@crisis.test', password_hash='x',
+                    role='user', full_name='Reporter')
+    session.add(reporter)
+    session.commit()
+    for title, incident_type in (('Warehouse fire', 'fire'), ('Kitchen fire', 'fire'),
+                                 ('Warehouse collapse', 'accident')):
+        session.add(Incident(title=title, description='Reported by phone', incident_type=incident_type,
+                             priority='high', address='2 Dock Rd', reported_by=reporter.id))
+    session.commit()
+
+    rows = [row for row in _ndjson(admin_client.get('/admin/export/incidents.ndjson?type=fire'))
+            if row['reported_by'] == reporter.id]
+    assert sorted(row['title'] for row in rows) == ['Kitchen fire', 'Warehouse fire']
+    assert {row['incident_type'] for row in rows} == {'fire'}
+
+    rows = [row for row in _ndjson(admin_client.get('/admin/export/incidents.ndjson?type=fire&q=warehouse'))
+            if row['reported_by'] == reporter.id]
+    assert [row['title'] for row in rows] == ['Warehouse fire']
@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+from models import DeletedIncident, Incident, User
+from incident_feed import decode_cursor, encode_cursor, feed_statement, fetch_changes, settle_point
+
+def _incident(reporter_id, title, stamped):
+    return Incident(title=title, description='Flooded road', incident_type='natural_disaster', priority='high',
+                    address='3 River Rd', latitude=12.97, longitude=77.59, reported_by=reporter_id,
+                    updated_at=stamped)
+
+def _restamp(session, incident, stamped):
+    # updated_at is stamped on every flush; set the time the row was written at
+    session.execute(Incident.__table__.update().where(Incident.__table__.c.id == incident.id)
+                    .values(updated_at=stamped))
+    session.commit()
+
+def test_paging_does_not_pass_a_late_commit(session):
+    reporter = User(username='feed_reporter', email='feed@crisis.test', password_hash='x',
+                    role='user', full_name='Reporter')
+    session.add(reporter)
+    session.commit()
+    now = datetime.utcnow()
+    first, second = _incident(reporter.id, 'First', now), _incident(reporter.id, 'Second', now)
+    session.add_all([first, second])
+    session.commit()
+    _restamp(session, first, now - timedelta(seconds=2))
+    _restamp(session, second, now - timedelta(seconds=1))
+
+    rows, _, cursor, has_more = fetch_changes(feed_statement(), encode_cursor(now - timedelta(minutes=1), 0), limit=1)
+    assert [row.id for row in rows] == [first.id]
+    assert not has_more
+    assert decode_cursor(cursor) <= (settle_point(), 0)
+
+    # Stamped before the page was read, committed after it
+    late = _incident(reporter.id, 'Late', now)
+    session.add(late)
+    session.commit()
+    _restamp(session, late, now - timedelta(seconds=3))
+
+    rows, _, _, _ = fetch_changes(feed_statement(), cursor)
+    assert {first.id, second.id, late.id} <= {row.id for row in rows}
+
+def test_pages_do_not_repeat_tombstones(session):
+    reporter = User(username='tombstone_reporter', email='tombstones@crisis.test', password_hash='x',
+                    role='user', full_name='Reporter')
+    session.add(reporter)
+    session.commit()
+    start = datetime.utcnow() - timedelta(hours=2)
+    incidents = [_incident(reporter.id, f'Row {i}', start) for i in range(3)]
+    session.add_all(incidents)
+    session.commit()
+    for minutes, incident in zip((10, 20, 30), incidents):
+        _restamp(session, incident, start + timedelta(minutes=minutes))
+    session.add_all([DeletedIncident(incident_id=-1, deleted_at=start + timedelta(minutes=15)),
+                     DeletedIncident(incident_id=-2, deleted_at=start + timedelta(minutes=25))])
+    session.commit()
+
+    cursor = encode_cursor(start, 0)
+    pages = []
+    for _ in range(4):
+        rows, deleted_ids, cursor, has_more = fetch_changes(feed_statement(), cursor, limit=1)
+        pages.append(([row.id for row in rows if row.id in {i.id for i in incidents}], deleted_ids))
+        if not has_more:
+            break
+    received = [incident_id for _, deleted_ids in pages for incident_id in deleted_ids if incident_id < 0]
+    assert sorted(received) == [-2, -1]
+    assert [incident_id for ids, _ in pages for incident_id in ids] == [i.id for i in incidents]
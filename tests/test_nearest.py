@@ -0,0 +1,25 @@
+from models import Resource
+from nearest_utils import ResourceIndex
+
+def _ids(index, lat=40.0, lng=-70.0, k=5):
+    return [resource_id for _, resource_id in index.nearest(lat, lng, k)]
+
+def test_resource_index_follows_writes(session):
+    near = Resource(name='Pump near', resource_type='equipment', latitude=40.001, longitude=-70.001)
+    far = Resource(name='Pump far', resource_type='equipment', latitude=40.05, longitude=-70.05)
+    session.add_all([near, far])
+    session.commit()
+    index = ResourceIndex()
+    assert _ids(index)[:2] == [near.id, far.id]
+
+    # Taken out of service, then moved next to the search point
+    near.availability_status = 'in_use'
+    far.latitude, far.longitude = 40.0, -70.0
+    session.commit()
+    assert near.id not in _ids(index)
+    assert _ids(index)[0] == far.id
+
+    # Deletions leave no updated_at behind; nearest() confirms matches
+    session.delete(far)
+    session.commit()
+    assert far.id not in _ids(index)
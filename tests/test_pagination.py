@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+from werkzeug.datastructures import MultiDict
+from models import Incident, User
+from pagination_utils import keyset_paginate
+
+def _titles(page):
+    return [incident.title for incident in page.items]
+
+def test_keyset_pages_forward_and_back(session):
+    reporter = User(username='pages_reporter', email='pages@crisis.test', password_hash='x',
+                    role='user', full_name='Reporter')
+    session.add(reporter)
+    session.commit()
+    start = datetime(2020, 1, 1)
+    # Two incidents share a creation time, so the id breaks the tie
+    for i, minutes in enumerate((0, 1, 2, 3, 3)):
+        session.add(Incident(title=f'Incident {i}', description='Tree down', incident_type='other', priority='low',
+                             address='5 Elm St', reported_by=reporter.id, created_at=start + timedelta(minutes=minutes)))
+    session.commit()
+    query = Incident.query.filter_by(reported_by=reporter.id)
+
+    first = keyset_paginate(query, Incident, 2, MultiDict())
+    assert _titles(first) == ['Incident 4', 'Incident 3']
+    assert (first.page, first.has_prev, first.has_next) == (1, False, True)
+
+    second = keyset_paginate(query, Incident, 2, MultiDict(first.next_args))
+    assert _titles(second) == ['Incident 2', 'Incident 1']
+    assert (second.page, second.has_prev, second.has_next) == (2, True, True)
+
+    third = keyset_paginate(query, Incident, 2, MultiDict(second.next_args))
+    assert _titles(third) == ['Incident 0']
+    assert (third.page, third.has_prev, third.has_next) == (3, True, False)
+
+    back = keyset_paginate(query, Incident, 2, MultiDict(third.prev_args))
+    assert _titles(back) == _titles(second)
+    assert (back.page, back.has_prev, back.has_next) == (2, True, True)
+
+    back = keyset_paginate(query, Incident, 2, MultiDict(back.prev_args))
+    assert _titles(back) == _titles(first)
+    assert (back.page, back.has_prev, back.has_next) == (1, False, True)
+
+    # Old ?page=N links read by offset
+    page = keyset_paginate(query, Incident, 2, MultiDict({'page': '2', 'count': 'exact'}))
+    assert _titles(page) == ['Incident 2', 'Incident 1']
+    assert (page.page, page.total, page.pages) == (2, 5, 3)
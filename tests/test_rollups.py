@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+from models import Incident, User
+from rollup_utils import compact_rollups, rebuild_rollups, rollup_distributions, rollup_trend
+
+DAY = datetime(2001, 3, 4)
+
+def test_rollup_totals_follow_status_changes(session):
+    reporter = User(username='rollup_reporter', email='rollup@crisis.test', password_hash='x',
+                    role='user', full_name='Reporter')
+    session.add(reporter)
+    session.commit()
+    incidents = [Incident(title=f'Flood {i}', description='Water rising', incident_type='natural_disaster',
+                          priority=priority, address='8 Bank St', reported_by=reporter.id,
+                          created_at=DAY + timedelta(hours=hour))
+                 for i, (priority, hour) in enumerate((('high', 9), ('low', 9), ('high', 15)))]
+    session.add_all(incidents)
+    session.commit()
+
+    incidents[0].status = 'resolved'
+    incidents[1].status = 'in_progress'
+    session.commit()
+    incidents[1].status = 'resolved'
+    session.commit()
+
+    expected = {
+        'incident_type': {'natural_disaster': 3},
+        'priority': {'high': 2, 'low': 1},
+        'status': {'pending': 1, 'resolved': 2}
+    }
+    next_day = DAY + timedelta(days=1)
+    assert rollup_distributions(DAY, next_day) == expected
+    assert rollup_trend(DAY, next_day, 'day') == [(DAY, 3)]
+
+    # Folding the old hours into a day keeps the totals, as does a rebuild
+    compact_rollups()
+    assert rollup_distributions(DAY, next_day) == expected
+    rebuild_rollups()
+    assert rollup_distributions(DAY, next_day) == expected
@@ -0,0 +1,31 @@
+from datetime import timedelta
+from models import DeletedIncident, Incident, User
+from search_utils import InvertedIndex
+
+def test_tombstone_of_a_reused_id_keeps_the_new_row(session):
+    reporter = User(username='search_reporter', email='search@crisis.test', password_hash='x',
+                    role='user', full_name='Reporter')
+    session.add(reporter)
+    session.commit()
+    incident = Incident(title='Chlorine leak at depot', description='Strong smell', incident_type='utility',
+                        priority='critical', address='9 Depot Ln', reported_by=reporter.id)
+    session.add(incident)
+    session.commit()
+    # Written long enough ago that a refresh doesn't read the row again
+    written = incident.updated_at - timedelta(hours=1)
+    session.execute(Incident.__table__.update().where(Incident.__table__.c.id == incident.id)
+                    .values(updated_at=written))
+    session.commit()
+
+    index = InvertedIndex()
+    index.refresh()
+    # The row that had this id before was deleted just before it was inserted
+    session.add(DeletedIncident(incident_id=incident.id, deleted_at=written - timedelta(seconds=1)))
+    session.commit()
+    index.refresh()
+    assert incident.id in {incident_id for _, incident_id in index.search(['chlorine'])}
+
+    session.delete(incident)
+    session.commit()
+    index.refresh()
+    assert index.search(['chlorine']) == []
@@ -1,27 +1,95 @@
 from app import create_app, db
-from sqlalchemy import text
+from sqlalchemy import inspect, text
+from models import UNASSIGNED_OPEN
+
+# db.create_all() only creates missing tables, so columns and indexes added to
+# existing tables are listed here and applied idempotently.
+COLUMNS = [
+    ('incidents', 'image_id', 'VARCHAR(24)'),
+    ('incidents', 'geohash', 'VARCHAR(12)'),
+    ('resources', 'latitude', 'FLOAT'),
+    ('resources', 'longitude', 'FLOAT'),
+    ('resources', 'geohash', 'VARCHAR(12)'),
+    ('users', 'latitude', 'FLOAT'),
+    ('users', 'longitude', 'FLOAT'),
+]
+
+INDEXES = [
+    ('ix_incidents_geohash', 'incidents', 'geohash'),
+    ('ix_incidents_updated_at', 'incidents', 'updated_at'),
+    ('ix_deleted_incidents_deleted_at', 'deleted_incidents', 'deleted_at'),
+    ('ix_resources_geohash', 'resources', 'geohash'),
+    ('ix_resources_updated_at', 'resources', 'updated_at'),
+    ('ix_users_updated_at', 'users', 'updated_at'),
+    ('ix_incidents_created_at_id', 'incidents', 'created_at, id'),
+    ('ix_resources_created_at_id', 'resources', 'created_at, id'),
+    ('ix_users_created_at_id', 'users', 'created_at, id'),
+    ('ix_incidents_status_created_at', 'incidents', 'status, created_at, id'),
+    ('ix_incidents_status_priority_created_at', 'incidents', 'status, priority, created_at, id'),
+    ('ix_incidents_team_created_at', 'incidents', 'assigned_team_id, created_at, id'),
+    ('ix_incidents_reporter_created_at', 'incidents', 'reported_by, created_at, id'),
+    ('ix_status_updates_incident_created_at', 'status_updates', 'incident_id, created_at'),
+    ('ix_incident_resources_assignment', 'incident_resources', 'incident_id, resource_id, released_at'),
+]
+
+# Partial indexes, on databases that have them (PostgreSQL, SQLite)
+PARTIAL_INDEXES = [
+    ('ix_incidents_unassigned_open', 'incidents', 'created_at', UNASSIGNED_OPEN),
+]
+
+SEARCH_VECTOR_COLUMN = """
+ALTER TABLE incidents ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(address, '')), 'B') ||
+    setweight(to_tsvector('english', coalesce(description, '')), 'C')
+) STORED
+"""
+
+def apply_schema_updates():
+    """Add any missing columns and indexes. Must run inside an app context."""
+    inspector = inspect(db.engine)
+
+    for table, column, column_type in COLUMNS:
+        existing = [c['name'] for c in inspector.get_columns(table)]
+        if column not in existing:
+            db.session.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}"))
+            print(f"Added {column} column to {table} table")
+
+            # Older databases stored image paths before images moved to MongoDB
+            if column == 'image_id' and 'image_path' in existing:
+                db.session.execute(text("UPDATE incidents SET image_id = image_path WHERE image_path IS NOT NULL"))
+
+    # MySQL has no CREATE INDEX IF NOT EXISTS, so look the indexes up first
+    existing_indexes = {}
+    for name, table, columns in INDEXES:
+        if table not in existing_indexes:
+            existing_indexes[table] = {index['name'] for index in inspector.get_indexes(table)}
+        if name not in existing_indexes[table]:
+            db.session.execute(text(f"CREATE INDEX {name} ON {table} ({columns})"))
+            print(f"Added index {name} to {table} table")
+
+    if db.engine.dialect.name in ('postgresql', 'sqlite'):
+        for name, table, columns, where in PARTIAL_INDEXES:
+            db.session.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns}) WHERE {where}"))
+
+    # Full-text search vector, kept current by the database (see search_utils.py)
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text(SEARCH_VECTOR_COLUMN))
+        db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_incidents_search_vector "
+                                "ON incidents USING GIN (search_vector)"))
+
+    db.session.commit()
 
 def update_schema():
-    """Update database schema to add image_id column"""
+    """Update database schema to match the current models"""
     app = create_app()
     with app.app_context():
         try:
-            # Check if column exists
-            result = db.session.execute(text("SHOW COLUMNS FROM incidents LIKE 'image_id'"))
-            if not result.fetchone():
-                # Add image_id column
-                db.session.execute(text("ALTER TABLE incidents ADD COLUMN image_id VARCHAR(24)"))
-                # Rename image_path to image_id if it exists
-                result = db.session.execute(text("SHOW COLUMNS FROM incidents LIKE 'image_path'"))
-                if result.fetchone():
-                    db.session.execute(text("UPDATE incidents SET image_id = image_path WHERE image_path IS NOT NULL"))
-                db.session.commit()
-                print("Successfully added image_id column to incidents table")
-            else:
-                print("image_id column already exists")
+            apply_schema_updates()
+            print("Schema is up to date")
         except Exception as e:
             db.session.rollback()
             print(f"Error updating schema: {str(e)}")
 
 if __name__ == "__main__":
-    update_schema()
\ No newline at end of file
+    update_schema()
@@ -1,37 +1,60 @@
 import os
-from flask import render_template, request, flash, redirect, url_for, current_app
+from flask import render_template, request, flash, redirect, url_for, current_app, abort
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 from app import db
 from models import Incident, User
 from forms import IncidentForm
-from utils import allowed_file, save_uploaded_file, user_required
+from utils import allowed_file, user_required
+from image_storage import get_image_storage
+from image_utils import schedule_variants
+from cache_utils import cached_fragment
+from counter_utils import incident_counts
+from pagination_utils import keyset_paginate
 from . import user_bp
 
+def get_dashboard_stats(user_id):
+    """Counts of a user's reported incidents by status"""
+    counts = incident_counts('reporter', user_id)
+    
+    return {
+        'total': counts['total'],
+        'pending': counts.get('pending', 0),
+        'in_progress': counts.get('in_progress', 0),
+        'resolved': counts.get('resolved', 0)
+    }
+
+def get_recent_incidents(user_id):
+    """A user's latest reports"""
+    return Incident.query.filter_by(reported_by=user_id)\
+                         .order_by(Incident.created_at.desc())\
+                         .limit(5).all()
+
+# Refreshable dashboard regions: fragment name -> (template, context loader taking the user id)
+DASHBOARD_FRAGMENTS = {
+    'stats': ('user/_dashboard_stats.html',
+              lambda user_id: {'stats': get_dashboard_stats(user_id)}),
+    'recent_incidents': ('user/_recent_incidents.html',
+                         lambda user_id: {'recent_incidents': get_recent_incidents(user_id)})
+}
+
 @user_bp.route('/dashboard')
 @login_required
 @user_required
 def dashboard():
-    # Get user's recent incidents
-    recent_incidents = Incident.query.filter_by(reported_by=current_user.id)\
-                                   .order_by(Incident.created_at.desc())\
-                                   .limit(5).all()
-    
-    # Get statistics
-    total_incidents = Incident.query.filter_by(reported_by=current_user.id).count()
-    pending_incidents = Incident.query.filter_by(reported_by=current_user.id, status='pending').count()
-    resolved_incidents = Incident.query.filter_by(reported_by=current_user.id, status='resolved').count()
-    
-    stats = {
-        'total': total_incidents,
-        'pending': pending_incidents,
-        'in_progress': Incident.query.filter_by(reported_by=current_user.id, status='in_progress').count(),
-        'resolved': resolved_incidents
-    }
-    
     return render_template('user/dashboard.html', 
-                         recent_incidents=recent_incidents,
-                         stats=stats)
+                         recent_incidents=get_recent_incidents(current_user.id),
+                         stats=get_dashboard_stats(current_user.id))
+
+@user_bp.route('/dashboard/fragments/<name>')
+@login_required
+@user_required
+def dashboard_fragment(name):
+    if name not in DASHBOARD_FRAGMENTS:
+        abort(404)
+    template, load_context = DASHBOARD_FRAGMENTS[name]
+    user_id = current_user.id
+    return cached_fragment(('user', name), user_id, lambda: render_template(template, **load_context(user_id)))
 
 @user_bp.route('/report-incident', methods=['GET', 'POST'])
 @login_required
@@ -40,11 +63,11 @@ def report_incident():
     form = IncidentForm()
     
     if form.validate_on_submit():
+        image_id = None
         try:
             # Handle file upload
-            image_path = None
             if form.image.data:
-                image_path = save_uploaded_file(form.image.data, 'incidents')
+                image_id = get_image_storage().save(form.image.data)
             
             # Create new incident
             incident = Incident(
@@ -55,19 +78,26 @@ def report_incident():
                 address=form.address.data,
                 latitude=float(form.latitude.data) if form.latitude.data else None,
                 longitude=float(form.longitude.data) if form.longitude.data else None,
-                image_path=image_path,
+                image_id=image_id,
                 reported_by=current_user.id
             )
             
             db.session.add(incident)
             db.session.commit()
             
+            # Thumbnail and medium sizes are rendered in the background
+            if image_id:
+                schedule_variants(image_id)
+            
             flash('Incident reported successfully! Our team will respond shortly.', 'success')
             current_app.logger.info(f'New incident reported by {current_user.username}: {incident.title}')
             return redirect(url_for('user.my_incidents'))
             
         except Exception as e:
             db.session.rollback()
+            # Nothing refers to the image now
+            if image_id:
+                get_image_storage().delete(image_id)
             flash('An error occurred while reporting the incident. Please try again.', 'error')
             current_app.logger.error(f'Error reporting incident: {str(e)}')
     
@@ -77,12 +107,10 @@ def report_incident():
 @login_required
 @user_required
 def my_incidents():
-    page = request.args.get('page', 1, type=int)
     per_page = 10
     
-    incidents = Incident.query.filter_by(reported_by=current_user.id)\
-                             .order_by(Incident.created_at.desc())\
-                             .paginate(page=page, per_page=per_page, error_out=False)
+    incidents = keyset_paginate(Incident.query.filter_by(reported_by=current_user.id), Incident, per_page, request.args,
+                                total=incident_counts('reporter', current_user.id)['total'])
     
     return render_template('user/my_incidents.html', incidents=incidents)
 